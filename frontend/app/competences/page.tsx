@@ -19,6 +19,7 @@ import {
   DialogTrigger,
 } from "@/components/ui/dialog"
 import { api, Niveau, Matiere, Thematique, Competence, SousCompetence } from "@/lib/api"
+import { allResults } from "@/lib/pagination"
 
 const tabs = [
   { id: "niveaux", label: "Niveaux", icon: BookOpen },
@@ -59,23 +60,23 @@ export default function CompetencesDashboard() {
     try {
       switch (activeTab) {
         case "niveaux":
-          const niveauxResponse = await api.getNiveaux()
+          const niveauxResponse = await allResults(api.getNiveaux())
           if (niveauxResponse.data) setNiveaux(niveauxResponse.data)
           break
         case "matieres":
-          const matieresResponse = await api.getMatieres()
+          const matieresResponse = await allResults(api.getMatieres())
           if (matieresResponse.data) setMatieres(matieresResponse.data)
           break
         case "thematiques":
-          const thematiquesResponse = await api.getThematiques()
+          const thematiquesResponse = await allResults(api.getThematiques())
           if (thematiquesResponse.data) setThematiques(thematiquesResponse.data)
           break
         case "competences":
-          const competencesResponse = await api.getCompetences()
+          const competencesResponse = await allResults(api.getCompetences())
           if (competencesResponse.data) setCompetences(competencesResponse.data)
           break
         case "sous-competences":
-          const sousCompetencesResponse = await api.getSousCompetences()
+          const sousCompetencesResponse = await allResults(api.getSousCompetences())
           if (sousCompetencesResponse.data) setSousCompetences(sousCompetencesResponse.data)
           break
       }
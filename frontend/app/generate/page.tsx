@@ -12,6 +12,7 @@ import { Loader2, Bot, RefreshCw, CheckCircle, AlertCircle } from "lucide-react"
 import { Separator } from "@/components/ui/separator"
 import { Alert, AlertDescription } from "@/components/ui/alert"
 import { api, Niveau, Matiere, Thematique, Competence, SousCompetence } from "@/lib/api"
+import { allResults } from "@/lib/pagination"
 
 interface QuestionRequest {
   school_level: string
@@ -60,11 +61,11 @@ export default function GeneratePage() {
     const loadData = async () => {
       try {
         const [niveauxRes, matieresRes, thematiquesRes, competencesRes, sousCompetencesRes] = await Promise.all([
-          api.getNiveaux(),
-          api.getMatieres(),
-          api.getThematiques(),
-          api.getCompetences(),
-          api.getSousCompetences(),
+          allResults(api.getNiveaux()),
+          allResults(api.getMatieres()),
+          allResults(api.getThematiques()),
+          allResults(api.getCompetences()),
+          allResults(api.getSousCompetences()),
         ])
         
         setNiveaux(niveauxRes.data || [])
@@ -20,6 +20,7 @@ import {
 } from "@/components/ui/dialog"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
 import { api, type Niveau as NiveauType, type Thematique as ThematiqueType, type Competence as CompetenceType, type SousCompetence as SousCompetenceType, type Matiere as MatiereType } from "@/lib/api"
+import { allResults } from "@/lib/pagination"
 
 const tabs = [
   { id: "niveaux", label: "Niveaux", icon: BookOpen },
@@ -49,11 +50,11 @@ export default function GestionDashboard() {
       setLoading(true)
       try {
         const [niv, mat, thm, cmp, sc] = await Promise.all([
-          api.getNiveaux(),
-          api.getMatieres(),
-          api.getThematiques(),
-          api.getCompetences(),
-          api.getSousCompetences(),
+          allResults(api.getNiveaux()),
+          allResults(api.getMatieres()),
+          allResults(api.getThematiques()),
+          allResults(api.getCompetences()),
+          allResults(api.getSousCompetences()),
         ])
         if (!isCancelled) {
           setNiveaux(niv.data || [])
@@ -284,11 +285,11 @@ export default function GestionDashboard() {
         // Reload data after successful save
         try {
           const [niv, mat, thm, cmp, sc] = await Promise.all([
-            api.getNiveaux(),
-            api.getMatieres(),
-            api.getThematiques(),
-            api.getCompetences(),
-            api.getSousCompetences(),
+            allResults(api.getNiveaux()),
+            allResults(api.getMatieres()),
+            allResults(api.getThematiques()),
+            allResults(api.getCompetences()),
+            allResults(api.getSousCompetences()),
           ])
           
           // Check if any reload failed
@@ -368,11 +369,11 @@ export default function GestionDashboard() {
           // Reload data after successful delete
           try {
             const [niv, mat, thm, cmp, sc] = await Promise.all([
-              api.getNiveaux(),
-              api.getMatieres(),
-              api.getThematiques(),
-              api.getCompetences(),
-              api.getSousCompetences(),
+              allResults(api.getNiveaux()),
+              allResults(api.getMatieres()),
+              allResults(api.getThematiques()),
+              allResults(api.getCompetences()),
+              allResults(api.getSousCompetences()),
             ])
             
             // Check if any reload failed
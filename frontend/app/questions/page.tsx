@@ -19,6 +19,7 @@ import {
   DialogTrigger,
 } from "@/components/ui/dialog"
 import { api, Question, Reponse, Competence, Thematique } from "@/lib/api"
+import { allResults } from "@/lib/pagination"
 
 export default function QuestionsDashboard() {
   const [showAddDialog, setShowAddDialog] = useState(false)
@@ -43,9 +44,9 @@ export default function QuestionsDashboard() {
     setLoading(true)
     try {
       const [questionsResponse, competencesResponse, thematiquesResponse] = await Promise.all([
-        api.getQuestions(),
-        api.getCompetences(),
-        api.getThematiques()
+        allResults(api.getQuestions()),
+        allResults(api.getCompetences()),
+        allResults(api.getThematiques())
       ])
 
       if (questionsResponse.data) setQuestions(questionsResponse.data)
@@ -0,0 +1,47 @@
+// The API list endpoints are cursor-paginated (myapp.fieldsets.IdCursorPagination):
+// they return { next, previous, results } instead of an array. allResults() reads
+// `results` and follows `next` until the last page, so the pages keep working with arrays.
+
+export type Page<T> = {
+  next: string | null
+  previous: string | null
+  results: T[]
+}
+
+type ListResponse<T> = {
+  data?: T[] | Page<T>
+  error?: string
+}
+
+function isPage<T>(data: T[] | Page<T>): data is Page<T> {
+  return !Array.isArray(data) && Array.isArray(data?.results)
+}
+
+export async function allResults<T>(
+  request: Promise<ListResponse<T>>,
+): Promise<{ data?: T[]; error?: string }> {
+  const response = await request
+  if (response.error || !response.data) {
+    return { error: response.error }
+  }
+  if (!isPage(response.data)) {
+    return { data: response.data }
+  }
+
+  const items = [...response.data.results]
+  let next = response.data.next
+  while (next) {
+    try {
+      const res = await fetch(next, { headers: { "Content-Type": "application/json" } })
+      if (!res.ok) {
+        return { data: items, error: `HTTP ${res.status}` }
+      }
+      const page: Page<T> = await res.json()
+      items.push(...page.results)
+      next = page.next
+    } catch (error) {
+      return { data: items, error: error instanceof Error ? error.message : String(error) }
+    }
+  }
+  return { data: items }
+}
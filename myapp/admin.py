@@ -1,8 +1,19 @@
 from django.contrib import admin
 from .models import (
     Niveau, Matiere, Thematique, Competence, SousCompetence,
-    Question, Reponse
+    Question, Reponse, GenerationJob
 )
+from .search import full_text_filter
+
+
+class FullTextSearchMixin:
+    """Admin search through the full-text and trigram indexes instead of ILIKE scans."""
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(full_text_filter(search_term)), False
 
 
 class ReponseInline(admin.TabularInline):
@@ -11,15 +22,16 @@ class ReponseInline(admin.TabularInline):
 
 
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
-    list_display = ['id', 'description', 'type']
-    list_filter = ['type']
+class QuestionAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = ['id', 'description', 'type', 'difficulte', 'id_competence']
+    list_filter = ['type', 'difficulte']
+    list_select_related = ['id_competence']
     search_fields = ['description']
     inlines = [ReponseInline]
 
 
 @admin.register(Reponse)
-class ReponseAdmin(admin.ModelAdmin):
+class ReponseAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['id', 'description', 'valide', 'id_question']
     list_filter = ['valide', 'id_question__type']
     search_fields = ['description']
@@ -46,5 +58,12 @@ class ThematiqueAdmin(admin.ModelAdmin):
     search_fields = ['nom']
 
 
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'progress', 'created_at', 'expires_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'updated_at']
+
+
 admin.site.register(Niveau)
 admin.site.register(Matiere)
\ No newline at end of file
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, List, Optional
+
+# Deterministic stand-ins for the model backends, used by `manage.py benchmark_generation`:
+# - FakeOllamaServer: HTTP server speaking the Ollama /api/generate protocol (plain and
+#   streamed NDJSON), answering with valid question JSON;
+# - FakeModel: replaces a ctransformers model in the pool, with the same call signature.
+# Both sleep `token_latency` seconds per emitted token (4 characters), and every completion
+# is different (a counter is part of the text), so deduplication and caching behave as with
+# a real model. No Django import.
+
+_COUNT = re.compile(r'Génère (\d+) questions')
+_FILLER = ' Cette question vérifie la compréhension de la notion étudiée.'
+_WORDS = (
+    'fraction', 'triangle', 'volcan', 'photosynthèse', 'révolution', 'aimant', 'circuit', 'poème',
+    'continent', 'molécule', 'équation', 'climat', 'verbe', 'cellule', 'planète', 'récit',
+    'monnaie', 'énergie', 'frontière', 'rivière', 'pyramide', 'glacier', 'alphabet', 'boussole',
+)
+
+
+def _tokens(text: str) -> List[str]:
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def fake_question_text(n: int) -> str:
+    """A question whose words change with `n`, so that successive ones are not near-duplicates."""
+    a, b, c, d, e = random.Random(n).sample(_WORDS, 5)
+    return f"Question {n} : en quoi {a} et {b} éclairent-ils {c}, {d} et {e} ?"
+
+
+def fake_question(n: int) -> dict:
+    a, b = 3 + n % 97, 5 + n // 97
+    return {
+        'question': fake_question_text(n),
+        'answers': [
+            {'text': str(a + b), 'is_correct': True},
+            {'text': str(a + b + 1), 'is_correct': False},
+            {'text': str(a + b - 1), 'is_correct': False},
+            {'text': str(a * b), 'is_correct': False},
+        ],
+    }
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Ollama stand-in on 127.0.0.1 (random port by default); `url` is its /api/generate endpoint."""
+
+    daemon_threads = True
+
+    def __init__(self, token_latency: float = 0.005, port: int = 0) -> None:
+        super().__init__(('127.0.0.1', port), _OllamaHandler)
+        self.token_latency = token_latency
+        self.calls = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}/api/generate'
+
+    def completion(self, prompt: str) -> str:
+        match = _COUNT.search(prompt)
+        count = int(match.group(1)) if match else 1
+        with self._lock:
+            self.calls += 1
+            numbers = [next(self._counter) for _ in range(count)]
+        if count == 1:
+            return json.dumps(fake_question(numbers[0]), ensure_ascii=False)
+        return json.dumps({'questions': [fake_question(n) for n in numbers]}, ensure_ascii=False)
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients that stop reading a stream early reset the connection: expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> 'FakeOllamaServer':
+        threading.Thread(target=self.serve_forever, name='fake-ollama', daemon=True).start()
+        return self
+
+
+class _OllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: FakeOllamaServer
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        tokens = _tokens(self.server.completion(body.get('prompt', '')))
+        done = {'done': True, 'eval_count': len(tokens), 'prompt_eval_count': len(_tokens(body.get('prompt', '')))}
+        if not body.get('stream'):
+            time.sleep(self.server.token_latency * len(tokens))
+            self._send(json.dumps({'response': ''.join(tokens), **done}).encode('utf-8'))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(self.server.token_latency)
+                self._chunk({'response': token, 'done': False})
+            self._chunk({'response': '', **done})
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading: generation stops, as with Ollama
+            self.close_connection = True
+
+    def _chunk(self, data: dict) -> None:
+        line = (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+    def _send(self, body: bytes) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class FakeModel:
+    """
+    ctransformers model stand-in. Like a real replica it keeps the tokens of its last
+    prompt: only the part of a new prompt past their common prefix costs
+    `prompt_token_latency` per token, then each generated token costs `token_latency`.
+    """
+
+    _counter = itertools.count(1)
+
+    def __init__(self, token_latency: float = 0.005, prompt_token_latency: Optional[float] = None,
+                 tokens: int = 60) -> None:
+        self.token_latency = token_latency
+        self.prompt_token_latency = token_latency / 10 if prompt_token_latency is None else prompt_token_latency
+        self.tokens = tokens
+        self.calls = 0
+        self._past = ''
+
+    @classmethod
+    def loader(cls, **options: Any):
+        """`ModelPool(loader=...)`: one FakeModel per replica."""
+        return lambda path, **model_kwargs: cls(**options)
+
+    def __call__(self, prompt: str, max_new_tokens: int = 256, stream: bool = False, **kwargs: Any):
+        self.calls += 1
+        shared = len(os.path.commonprefix([self._past, prompt]))
+        self._past = prompt
+        time.sleep(self.prompt_token_latency * len(_tokens(prompt[shared:])))
+        text = fake_question_text(next(self._counter))
+        while len(_tokens(text)) < self.tokens:
+            text += _FILLER
+        tokens = _tokens(text)[:max(1, min(self.tokens, max_new_tokens))]
+        if stream:
+            return self._stream(tokens)
+        time.sleep(self.token_latency * len(tokens))
+        return ''.join(tokens)
+
+    def _stream(self, tokens: List[str]) -> Iterator[str]:
+        for token in tokens:
+            time.sleep(self.token_latency)
+            yield token
+
+
+@contextmanager
+def stub_backends(token_latency: float = 0.005, tokens: int = 60, replicas: int = 1) -> Iterator[FakeOllamaServer]:
+    """
+    Route the Ollama client, the local model pool and its scheduler to the stubs for the
+    duration of the block (previous instances are restored afterwards). Local generations
+    stay in-process even when CTRANSFORMERS_SERVER_URL is set.
+    """
+    from myapp.services import ctransformers_client, inference_scheduler, llm_client
+
+    ollama = FakeOllamaServer(token_latency).start()
+    saved = (
+        llm_client._CLIENT, ctransformers_client._POOL, inference_scheduler._SCHEDULER,
+        ctransformers_client.CTRANSFORMERS_SERVER_URL,
+    )
+    pool = ctransformers_client.ModelPool(
+        max_replicas=replicas,
+        max_waiting=int(os.getenv('CTRANSFORMERS_MAX_WAITING', '8')),
+        loader=FakeModel.loader(token_latency=token_latency, tokens=tokens),
+    )
+    llm_client._CLIENT = llm_client.OllamaClient([ollama.url], pool_size=llm_client.OLLAMA_POOL_SIZE)
+    ctransformers_client._POOL = pool
+    inference_scheduler._SCHEDULER = inference_scheduler.InferenceScheduler.from_env(pool)
+    ctransformers_client.CTRANSFORMERS_SERVER_URL = ''
+    try:
+        yield ollama
+    finally:
+        (llm_client._CLIENT, ctransformers_client._POOL, inference_scheduler._SCHEDULER,
+         ctransformers_client.CTRANSFORMERS_SERVER_URL) = saved
+        ollama.shutdown()
+        ollama.server_close()
@@ -0,0 +1,75 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db.models import Prefetch
+
+from .models import Competence, Matiere, Niveau, SousCompetence, Thematique
+
+# Curriculum hierarchy, from the top: (kind used in URLs, model, children relation, node attributes)
+LEVELS = [
+    ('matiere', Matiere, 'thematiques', ['nom']),
+    ('thematique', Thematique, 'competences', ['nom']),
+    ('competence', Competence, 'sous_competences', ['description']),
+    ('sous-competence', SousCompetence, None, ['description']),
+]
+LEVEL_KINDS = [kind for kind, _, _, _ in LEVELS]
+
+
+def _prefetches(start: int, depth: int) -> List[Prefetch]:
+    """One ordered Prefetch per level below `start`, i.e. one query per level whatever the tree size."""
+    lookups = []
+    path = ''
+    for index in range(start, min(start + depth, len(LEVELS) - 1)):
+        relation = LEVELS[index][2]
+        child_model = LEVELS[index + 1][1]
+        path = f"{path}__{relation}" if path else relation
+        lookups.append(Prefetch(path, queryset=child_model.objects.order_by('id')))
+    return lookups
+
+
+def _node(obj, level: int, depth: int, fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    kind, _, relation, attributes = LEVELS[level]
+    node: Dict[str, Any] = {'id': obj.id, 'type': kind}
+    for attribute in attributes:
+        if fields is None or attribute in fields:
+            node[attribute] = getattr(obj, attribute)
+    if relation and depth > 0:
+        node[relation] = [_node(child, level + 1, depth - 1, fields) for child in getattr(obj, relation).all()]
+    return node
+
+
+def build_tree(
+    root_kind: Optional[str] = None,
+    root_id: Optional[int] = None,
+    depth: Optional[int] = None,
+    fields: Optional[Iterable[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Arbre du référentiel en JSON imbriqué, construit en un nombre constant de requêtes.
+
+    - sans racine: {"niveaux": [...], "matieres": [arbre complet]};
+    - avec racine (`root_kind` parmi LEVEL_KINDS et `root_id`): le sous-arbre de ce nœud,
+      ou None s'il n'existe pas;
+    - `depth`: nombre de niveaux conservés sous la racine (défaut: tous);
+    - `fields`: attributs à garder sur chaque nœud (`id` et `type` sont toujours présents).
+    """
+    fields = set(fields) if fields is not None else None
+    start = LEVEL_KINDS.index(root_kind) if root_kind else 0
+    if depth is None:
+        depth = len(LEVELS)
+    model = LEVELS[start][1]
+    queryset = model.objects.order_by('id').prefetch_related(*_prefetches(start, depth))
+
+    if root_kind is None:
+        niveaux = [
+            {'id': niveau.id, 'type': 'niveau', **({'nom': niveau.nom} if fields is None or 'nom' in fields else {})}
+            for niveau in Niveau.objects.order_by('id')
+        ]
+        return {
+            'niveaux': niveaux,
+            'matieres': [_node(matiere, 0, depth, fields) for matiere in queryset],
+        }
+
+    root = queryset.filter(id=root_id).first()
+    if root is None:
+        return None
+    return _node(root, start, depth, fields)
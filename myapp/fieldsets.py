@@ -0,0 +1,109 @@
+from typing import List, Optional, Set, Tuple
+
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination
+
+# Sparse fieldsets and expansions for the ModelViewSets:
+# - `?fields=id,description` keeps only the listed fields;
+# - `?expand=id_competence` replaces a foreign key id with the nested object
+#   (only for the relations a serializer lists in `expandable_fields`).
+# The viewset querysets then select/prefetch exactly the relations the response needs.
+
+
+def _query_list(request, name: str) -> Optional[List[str]]:
+    if request is None:
+        return None
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def requested_fields(request) -> Optional[Set[str]]:
+    """Fields asked for with `?fields=`, or None for all of them."""
+    fields = _query_list(request, 'fields')
+    return set(fields) if fields is not None else None
+
+
+def requested_expansions(request) -> Set[str]:
+    return set(_query_list(request, 'expand') or [])
+
+
+class DynamicFieldsMixin:
+    """
+    ModelSerializer mixin applying `?fields=` / `?expand=` from the request in the context.
+    `expandable_fields` maps a field name to the name of a serializer class of myapp.serializers.
+    Expanded relations are serialized with all their fields.
+    """
+    expandable_fields: dict = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Nested serializers are built without context: only the top-level one (or the
+        # child of a `many=True` list) sees the request here
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        from . import serializers as app_serializers
+
+        for name in requested_expansions(request) & set(self.expandable_fields):
+            serializer_class = getattr(app_serializers, self.expandable_fields[name])
+            self.fields[name] = serializer_class(read_only=True)
+
+        fields = requested_fields(request)
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+def related_lookups(serializer, prefix: str = '', prefetching: bool = False) -> Tuple[List[str], List[str]]:
+    """(select_related, prefetch_related) lookups needed to serialize without a query per row."""
+    selected, prefetched = [], []
+    for field in serializer.fields.values():
+        if field.source == '*':
+            continue
+        path = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.ListSerializer):
+            prefetched.append(path)
+            child_selected, child_prefetched = related_lookups(field.child, path + '__', prefetching=True)
+            prefetched += child_selected + child_prefetched
+        elif isinstance(field, serializers.BaseSerializer):
+            (prefetched if prefetching else selected).append(path)
+            child_selected, child_prefetched = related_lookups(field, path + '__', prefetching)
+            selected += child_selected
+            prefetched += child_prefetched
+    return selected, prefetched
+
+
+def serializer_models(serializer) -> List:
+    """Models whose data appears in the serializer's output (itself first)."""
+    models = [serializer.Meta.model]
+    for field in serializer.fields.values():
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.ModelSerializer):
+            models += [model for model in serializer_models(nested) if model not in models]
+    return models
+
+
+class OptimizedQuerysetMixin:
+    """ModelViewSet mixin: select/prefetch the relations present in the (sparse) serializer."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        selected, prefetched = related_lookups(self.get_serializer())
+        if selected:
+            queryset = queryset.select_related(*selected)
+        if prefetched:
+            queryset = queryset.prefetch_related(*prefetched)
+        return queryset
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: each page is one indexed range scan, whatever
+    the table size. Page size: PAGE_SIZE setting, or `?page_size=` (up to max_page_size).
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import GenerationJob
+
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'GENERATION_JOB_WORKERS', 2),
+                thread_name_prefix='generation-job',
+            )
+        return _EXECUTOR
+
+
+def _run_in_thread(job_id: str) -> None:
+    from .tasks import run_generation_job_task
+
+    try:
+        run_generation_job_task(job_id)
+    finally:
+        # Worker threads get their own DB connections; do not leak them
+        connections.close_all()
+
+
+def dispatch_generation_job(job_id) -> None:
+    """
+    Hand the job over to Celery. In eager mode (dev) Celery would run it inline and
+    hold the HTTP worker, so an in-process thread pool is used instead.
+    """
+    if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        _get_executor().submit(_run_in_thread, str(job_id))
+    else:
+        from .tasks import run_generation_job_task
+
+        run_generation_job_task.delay(str(job_id))
+
+
+def create_generation_job(params: dict) -> GenerationJob:
+    now = timezone.now()
+    # Opportunistic purge: expired jobs are never served again
+    GenerationJob.objects.filter(expires_at__lte=now).delete()
+    job = GenerationJob.objects.create(
+        params=params,
+        expires_at=now + timedelta(seconds=getattr(settings, 'GENERATION_JOB_TTL', 86400)),
+    )
+    transaction.on_commit(lambda: dispatch_generation_job(job.id))
+    return job
+
+
+def cancel_generation_job(job: GenerationJob) -> bool:
+    """Mark the job cancelled; a running job stops before persisting anything."""
+    updated = GenerationJob.objects.filter(
+        id=job.id,
+        status__in=[GenerationJob.STATUS_PENDING, GenerationJob.STATUS_RUNNING],
+    ).update(status=GenerationJob.STATUS_CANCELLED, updated_at=timezone.now())
+    return bool(updated)
@@ -0,0 +1,384 @@
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+TARGETS = ('question', 'local', 'fastapi')
+
+
+class Command(BaseCommand):
+    help = ("Mesure les endpoints de génération sous charge concurrente (latences p50/p95/p99, débit, "
+            "requêtes SQL, RSS max), par défaut avec des modèles factices déterministes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', choices=TARGETS,
+                            help="Endpoint(s) mesuré(s): question (/api/generate/question/), local "
+                                 "(/api/generate/local/), fastapi (/generate-questions). Défaut: question et local")
+        parser.add_argument('--requests', type=int, default=50, help='Requêtes mesurées par endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Clients simultanés')
+        parser.add_argument('--warmup', type=int, default=2, help='Requêtes non mesurées avant chaque série')
+        parser.add_argument('--count', type=int, default=1, help='Questions par requête')
+        parser.add_argument('--stream', action='store_true',
+                            help='Réponses en streaming (mesure aussi le délai du premier octet)')
+        parser.add_argument('--backend', choices=('stub', 'real'), default='stub',
+                            help='stub: Ollama et modèle local factices; real: backends configurés')
+        parser.add_argument('--token-latency-ms', type=float, default=5.0, help='Latence par token des modèles factices')
+        parser.add_argument('--tokens', type=int, default=60, help='Tokens par complétion du modèle local factice')
+        parser.add_argument('--replicas', type=int, default=1, help='Répliques du modèle local factice')
+        parser.add_argument('--fastapi-url', help='Service FastAPI déjà lancé (sinon démarré pour la mesure)')
+        parser.add_argument('--startup-timeout', type=float, default=120.0,
+                            help='Attente maximale de /ready du service FastAPI lancé (secondes)')
+        parser.add_argument('--keep', action='store_true', help='Conserver les questions créées pendant la mesure')
+        parser.add_argument('--output', help='Écrire le rapport JSON dans ce fichier')
+        parser.add_argument('--json', action='store_true', help='Sortie JSON')
+
+    def handle(self, *args, **options):
+        from myapp.models import Question
+        from myapp.services.generation_cache import GENERATION_CACHE_BACKEND
+
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests et --concurrency doivent être positifs.")
+        targets = list(dict.fromkeys(options['target'] or ['question', 'local']))
+        context = self._context()
+        # Ids of the questions saved by the measured requests (read from their responses): only
+        # those are deleted afterwards, never questions created meanwhile by other clients
+        self.created = set()
+        self.created_lock = threading.Lock()
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'commit': self._commit(),
+            'python': platform.python_version(),
+            'backend': options['backend'],
+            'token_latency_ms': options['token_latency_ms'],
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'stream': options['stream'],
+            'cache_backend': GENERATION_CACHE_BACKEND,
+            'results': {},
+        }
+        try:
+            if options['backend'] == 'stub':
+                from myapp.benchmarks.stub_backends import stub_backends
+
+                with stub_backends(options['token_latency_ms'] / 1000, options['tokens'], options['replicas']):
+                    self._run_targets(targets, context, options, report)
+            else:
+                self._run_targets(targets, context, options, report)
+        finally:
+            if not options['keep'] and self.created:
+                Question.objects.filter(id__in=self.created).delete()
+        report['peak_rss_mb'] = _peak_rss_mb()
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        for target, result in report['results'].items():
+            latency = result['latency_ms']
+            line = (f"{target:>8}: {result['ok']}/{result['requests']} OK, p50 {latency['p50']} ms, "
+                    f"p95 {latency['p95']} ms, p99 {latency['p99']} ms, {result['throughput_rps']} req/s")
+            if result.get('db_queries'):
+                line += f", {result['db_queries']['per_request']} requêtes SQL/req"
+            style = self.style.SUCCESS if not result['errors'] else self.style.WARNING
+            self.stdout.write(style(line))
+        self.stdout.write(f"RSS max: {report['peak_rss_mb']} Mo")
+
+    def _run_targets(self, targets, context, options, report):
+        for target in targets:
+            if target == 'fastapi':
+                report['results'][target] = self._run_fastapi(context, options)
+            else:
+                call = self._django_call(target, context, options)
+                _run(call, options['warmup'], 1)
+                report['results'][target] = _run(call, options['requests'], options['concurrency'])
+
+    def _context(self):
+        """Curriculum entries used in the request payloads (the first complete chain in the database)."""
+        from myapp.models import Competence, Niveau, SousCompetence
+
+        niveau = Niveau.objects.order_by('id').first()
+        competence = Competence.objects.select_related('id_thematique__id_matiere').order_by('id').first()
+        if niveau is None or competence is None:
+            raise CommandError("Aucun niveau ou aucune compétence en base: chargez d'abord des données "
+                               "(load_default_data).")
+        sous_competence = SousCompetence.objects.filter(id_competence=competence).order_by('id').first()
+        return {'niveau': niveau, 'competence': competence, 'thematique': competence.id_thematique,
+                'sous_competence': sous_competence}
+
+    def _django_call(self, target, context, options):
+        sous_competence = context['sous_competence']
+        if target == 'question':
+            url = '/api/generate/question/'
+            payload = {
+                'niveau_id': context['niveau'].id,
+                'thematique_id': context['thematique'].id,
+                'competence_id': context['competence'].id,
+                'sous_competence_id': sous_competence.id if sous_competence else None,
+                'format': 'quiz',
+                'difficulte': 'medium',
+                'count': options['count'],
+            }
+        else:
+            url = '/api/generate/local/'
+            payload = {
+                'niveau': context['niveau'].nom,
+                'thematique': context['thematique'].nom,
+                'competence': context['competence'].description,
+                'sous_competence': sous_competence.description if sous_competence else '',
+            }
+        if options['stream']:
+            payload['stream'] = 'ndjson'
+        body = json.dumps(payload)
+        local = threading.local()
+
+        def call():
+            if not hasattr(local, 'client'):
+                local.client = Client(SERVER_NAME='localhost')
+            queries = [0]
+
+            def count_queries(execute, sql, params, many, context):
+                queries[0] += 1
+                return execute(sql, params, many, context)
+
+            started = time.perf_counter()
+            first_byte = None
+            chunks = []
+            with connection.execute_wrapper(count_queries):
+                response = local.client.post(url, data=body, content_type='application/json')
+                if response.streaming:
+                    for chunk in response.streaming_content:
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - started
+                        chunks.append(chunk)
+                else:
+                    chunks.append(response.content)
+            elapsed = time.perf_counter() - started
+            self._record_created(b''.join(chunks), response.streaming)
+            return response.status_code, elapsed, first_byte, queries[0]
+
+        return call
+
+    def _record_created(self, body, streamed):
+        """Remember the ids of the questions saved by one response (JSON, or the `done` NDJSON event)."""
+        payloads = []
+        for line in (body.splitlines() if streamed else [body]):
+            try:
+                payloads.append(json.loads(line))
+            except ValueError:
+                continue
+        ids = set()
+        for payload in payloads:
+            if not isinstance(payload, dict):
+                continue
+            for saved in [payload, *(payload.get('questions') or [])]:
+                question = saved.get('question') if isinstance(saved, dict) else None
+                if isinstance(question, dict) and question.get('id') is not None:
+                    ids.add(question['id'])
+        if ids:
+            with self.created_lock:
+                self.created.update(ids)
+
+    def _run_fastapi(self, context, options):
+        sous_competence = context['sous_competence']
+        payload = {
+            'school_level': context['niveau'].nom,
+            'module': context['thematique'].id_matiere.nom,
+            'thematic': context['thematique'].nom,
+            'competence': context['competence'].description,
+            'sous_competence': sous_competence.description if sous_competence else '',
+            'num_questions': options['count'],
+            'question_type': 'quiz',
+        }
+        if options['fastapi_url']:
+            result = self._measure_http(options['fastapi_url'], payload, options)
+            result['service'] = options['fastapi_url']
+            return result
+
+        model_server = None
+        env = dict(os.environ)
+        if options['backend'] == 'stub':
+            # The service process generates through a model server backed by the stub model pool
+            from myapp.services.model_server import ModelServer
+            from myapp.services.question_generation import LOCAL_MODEL_PATH
+
+            model_server = ModelServer(('127.0.0.1', 0), LOCAL_MODEL_PATH)
+            model_server.ready = True
+            threading.Thread(target=model_server.serve_forever, daemon=True).start()
+            env['CTRANSFORMERS_SERVER_URL'] = f'http://127.0.0.1:{model_server.server_port}'
+        port = _free_port()
+        url = f'http://127.0.0.1:{port}'
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, 'questionsGenerator.py', '--host', '127.0.0.1', '--port', str(port)],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        try:
+            startup = self._wait_ready(process, url, options['startup_timeout'])
+            result = self._measure_http(url, payload, options)
+            result['startup_s'] = round(startup - started, 3)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            if model_server is not None:
+                model_server.shutdown()
+                model_server.server_close()
+        result['service_peak_rss_mb'] = _peak_rss_mb(children=True)
+        return result
+
+    @staticmethod
+    def _wait_ready(process, url, timeout):
+        import requests
+
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                error = process.stderr.read().decode('utf-8', 'replace').strip().splitlines()
+                raise CommandError(f"Le service FastAPI s'est arrêté au démarrage: {error[-1] if error else process.returncode}")
+            try:
+                if requests.get(f'{url}/ready', timeout=1).status_code == 200:
+                    return time.perf_counter()
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.1)
+        raise CommandError(f"Service FastAPI pas prêt après {timeout:.0f} s.")
+
+    def _measure_http(self, base_url, payload, options):
+        import requests
+
+        url = base_url.rstrip('/') + ('/generate-questions/stream' if options['stream'] else '/generate-questions')
+        local = threading.local()
+
+        def call():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            started = time.perf_counter()
+            first_byte = None
+            with local.session.post(url, json=payload, stream=True, timeout=600) as response:
+                for _ in response.iter_content(chunk_size=None):
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                status = response.status_code
+                if status == 200 and not options['stream'] and response.json().get('status') != 'success':
+                    status = 502  # the service reports generation errors with a 200
+            return status, time.perf_counter() - started, first_byte if options['stream'] else None, None
+
+        _run(call, options['warmup'], 1)
+        return _run(call, options['requests'], options['concurrency'])
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+
+def _run(call, requests, concurrency):
+    """`requests` calls spread over `concurrency` threads; each thread closes its DB connection when done."""
+    samples = []
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                try:
+                    sample = call()
+                except Exception as exc:
+                    sample = (type(exc).__name__, 0.0, None, None)
+                with lock:
+                    samples.append(sample)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(min(concurrency, requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summary(samples, time.perf_counter() - started)
+
+
+def _summary(samples, elapsed):
+    ok = [sample for sample in samples if isinstance(sample[0], int) and sample[0] < 400]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample[0])] = statuses.get(str(sample[0]), 0) + 1
+    result = {
+        'requests': len(samples),
+        'ok': len(ok),
+        'errors': len(samples) - len(ok),
+        'status_codes': statuses,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else None,
+        'latency_ms': _percentiles([sample[1] for sample in ok]),
+    }
+    first_bytes = [sample[2] for sample in ok if sample[2] is not None]
+    if first_bytes:
+        result['first_byte_ms'] = _percentiles(first_bytes)
+    queries = [sample[3] for sample in samples if sample[3] is not None]
+    if queries:
+        result['db_queries'] = {
+            'total': sum(queries),
+            'per_request': round(sum(queries) / len(queries), 1),
+            'max': max(queries),
+        }
+    return result
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    values = sorted(values)
+
+    def rank(p):  # nearest-rank percentile
+        return round(values[max(0, math.ceil(p / 100 * len(values)) - 1)] * 1000, 1)
+
+    return {
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'mean': round(sum(values) / len(values) * 1000, 1),
+        'max': round(values[-1] * 1000, 1),
+    }
+
+
+def _peak_rss_mb(children=False):
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,103 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.services.sanitizer import StreamingQuestionSanitizer, sanitize_question
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[2] / 'benchmarks' / 'local_outputs.jsonl'
+
+
+class Command(BaseCommand):
+    help = 'Mesure le nettoyage des sorties brutes du modèle local sur un corpus (JSON lines)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS),
+                            help='Fichier JSONL: {"raw", "thematique"?, "competence"?, "expected"?, "baseline"?} par ligne')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--chunk-size', type=int, default=4,
+                            help='Taille des fragments pour le mode streaming (caractères)')
+        parser.add_argument('--json', action='store_true', help='Sortie JSON')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['corpus'], encoding='utf-8') as corpus_file:
+                samples = [json.loads(line) for line in corpus_file if line.strip()]
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Corpus illisible: {exc}')
+        if not samples:
+            raise CommandError('Corpus vide.')
+
+        # `expected`: the correctly cleaned question (quality, known gaps are reported);
+        # `baseline`: what the sanitizer returned before its rewrite (behaviour must not change)
+        outputs = [sanitize_question(sample['raw'], sample.get('thematique', ''), sample.get('competence', '')) for sample in samples]
+        mismatches = self._mismatches(samples, outputs, 'expected')
+        baseline_mismatches = self._mismatches(samples, outputs, 'baseline')
+        report = {
+            'samples': len(samples),
+            'iterations': options['iterations'],
+            'full': self._measure(samples, options['iterations'], self._full),
+            'streaming': self._measure(samples, options['iterations'], self._streaming(options['chunk_size'])),
+            'mismatches': mismatches,
+            'baseline_mismatches': baseline_mismatches,
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        for mode in ('full', 'streaming'):
+            stats = report[mode]
+            self.stdout.write(
+                f"{mode:>9}: p50 {stats['p50_us']} µs, p95 {stats['p95_us']} µs, {stats['calls_per_s']} appels/s"
+            )
+        for mismatch in mismatches:
+            self.stdout.write(self.style.WARNING(f"Écart: {mismatch['expected']!r} != {mismatch['got']!r}"))
+        for mismatch in baseline_mismatches:
+            self.stdout.write(self.style.ERROR(f"Régression: {mismatch['baseline']!r} != {mismatch['got']!r}"))
+        for key, label, found in (('expected', 'sorties conformes', mismatches), ('baseline', 'sorties identiques à la référence', baseline_mismatches)):
+            checked = sum(1 for sample in samples if key in sample)
+            if checked:
+                style = self.style.WARNING if found else self.style.SUCCESS
+                self.stdout.write(style(f"{checked - len(found)}/{checked} {label}."))
+
+    @staticmethod
+    def _mismatches(samples, outputs, key):
+        return [
+            {'raw': sample['raw'], key: sample[key], 'got': got}
+            for sample, got in zip(samples, outputs)
+            if key in sample and got != sample[key]
+        ]
+
+    @staticmethod
+    def _full(sample):
+        sanitize_question(sample['raw'], sample.get('thematique', ''), sample.get('competence', ''))
+
+    @staticmethod
+    def _streaming(chunk_size):
+        def run(sample):
+            raw = sample['raw']
+            sanitizer = StreamingQuestionSanitizer(sample.get('thematique', ''), sample.get('competence', ''))
+            for start in range(0, len(raw), chunk_size):
+                if sanitizer.feed(raw[start:start + chunk_size]):
+                    break
+            sanitizer.result()
+        return run
+
+    @staticmethod
+    def _measure(samples, iterations, run):
+        timings = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for sample in samples:
+                begin = time.perf_counter()
+                run(sample)
+                timings.append(time.perf_counter() - begin)
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        return {
+            'p50_us': round(statistics.median(timings) * 1e6, 1),
+            'p95_us': round(timings[int(len(timings) * 0.95) - 1] * 1e6, 1),
+            'calls_per_s': round(len(timings) / elapsed),
+        }
@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from myapp.models import Question
+from myapp.services.dedup import DEDUP_THRESHOLD, duplicate_clusters, index_questions
+
+
+class Command(BaseCommand):
+    help = 'Regroupe et signale les questions quasi identiques (MinHash + LSH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=DEDUP_THRESHOLD,
+                            help=f'Similarité de Jaccard minimale (défaut {DEDUP_THRESHOLD})')
+        parser.add_argument('--competence', type=int, help='Limiter à une compétence')
+        parser.add_argument('--rebuild', action='store_true', help="Reconstruire tout l'index avant l'analyse")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--json', action='store_true', help='Sortie JSON')
+
+    def handle(self, *args, **options):
+        indexed = self._index(options['rebuild'], options['batch_size'])
+        if indexed:
+            self.stderr.write(f'{indexed} question(s) indexée(s).')
+
+        clusters = duplicate_clusters(options['threshold'], competence_id=options['competence'])
+        descriptions = dict(
+            Question.objects.filter(id__in=[ids[0] for ids in clusters]).values_list('id', 'description')
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps([
+                {'size': len(ids), 'question_ids': ids, 'example': descriptions.get(ids[0], '')}
+                for ids in clusters
+            ], ensure_ascii=False, indent=2))
+            return
+
+        if not clusters:
+            self.stdout.write(self.style.SUCCESS('Aucun doublon trouvé.'))
+            return
+        for ids in clusters:
+            self.stdout.write(f"- {len(ids)} questions {ids}: {descriptions.get(ids[0], '')[:80]}")
+        self.stdout.write(self.style.WARNING(
+            f"{len(clusters)} groupe(s) de doublons, {sum(len(ids) - 1 for ids in clusters)} question(s) en trop."
+        ))
+
+    def _index(self, rebuild: bool, batch_size: int) -> int:
+        """Index the questions missing from the LSH table (all of them with --rebuild)."""
+        queryset = Question.objects.only('id', 'description').order_by('id')
+        if not rebuild:
+            queryset = queryset.filter(bands__isnull=True)
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return total
+            total += index_questions(batch, replace=rebuild)
+            last_id = batch[-1].id
@@ -0,0 +1,55 @@
+from django.urls import Resolver404, resolve
+
+from .services.metrics import METRICS_ENABLED, finish_trace, start_trace
+
+# Endpoints (url names) whose requests are traced by GenerationMetricsMiddleware
+TRACED_ENDPOINTS = ('generate-question', 'generate-local')
+
+
+class GenerationMetricsMiddleware:
+    """
+    Trace les requêtes de génération (services/metrics.py): durée de chaque étape dans
+    l'en-tête `Server-Timing`, une ligne JSON sur le logger `myapp.metrics` et les
+    métriques Prometheus de /metrics. Une réponse en streaming est tracée jusqu'à la fin
+    du flux (elle n'a pas d'en-tête Server-Timing, envoyé avant la génération).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        endpoint = self._endpoint(request) if METRICS_ENABLED else None
+        if endpoint is None:
+            return self.get_response(request)
+
+        trace = start_trace(endpoint)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            finish_trace(trace, 'error', method=request.method)
+            raise
+        if response.streaming:
+            response.streaming_content = self._finish_after(
+                response.streaming_content, trace, response.status_code, request.method,
+            )
+            return response
+        response['Server-Timing'] = trace.server_timing()
+        finish_trace(trace, response.status_code, method=request.method)
+        return response
+
+    @staticmethod
+    def _endpoint(request):
+        if not request.path_info.startswith('/api/generate/'):
+            return None
+        try:
+            name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        return name if name in TRACED_ENDPOINTS else None
+
+    @staticmethod
+    def _finish_after(content, trace, status, method):
+        try:
+            yield from content
+        finally:
+            finish_trace(trace, status, method=method, streamed=True)
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def _as_id(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_question_context(apps, schema_editor):
+    # Only questions created by a GenerationJob (migration 0002) have a recorded context:
+    # the job parameters. Questions created before, by hand or by the other generation
+    # endpoints have none, and nothing in their rows tells which niveau/compétence they
+    # belong to: they are left with NULL context (see README, "Contexte des questions").
+    Question = apps.get_model('myapp', 'Question')
+    GenerationJob = apps.get_model('myapp', 'GenerationJob')
+    Niveau = apps.get_model('myapp', 'Niveau')
+    Thematique = apps.get_model('myapp', 'Thematique')
+    Competence = apps.get_model('myapp', 'Competence')
+    SousCompetence = apps.get_model('myapp', 'SousCompetence')
+
+    # Questions produced by generation jobs: the job parameters hold their context
+    references = [
+        ('niveau_id', 'id_niveau_id', Niveau),
+        ('thematique_id', 'id_thematique_id', Thematique),
+        ('competence_id', 'id_competence_id', Competence),
+        ('sous_competence_id', 'id_sous_competence_id', SousCompetence),
+    ]
+    for job in GenerationJob.objects.filter(status='succeeded').exclude(question_ids=[]).iterator():
+        params = job.params or {}
+        fields = {'difficulte': str(params.get('difficulte') or '')[:20]}
+        for param, attname, model in references:
+            pk = _as_id(params.get(param))
+            if pk is not None and model.objects.filter(pk=pk).exists():
+                fields[attname] = pk
+        Question.objects.filter(id__in=job.question_ids, id_competence__isnull=True).update(**fields)
+
+    # Derive the missing levels of the rows linked above from the most specific one known
+    Question.objects.filter(id_competence__isnull=True, id_sous_competence__isnull=False).update(
+        id_competence_id=Subquery(
+            SousCompetence.objects.filter(pk=OuterRef('id_sous_competence_id')).values('id_competence_id')[:1]
+        )
+    )
+    Question.objects.filter(id_thematique__isnull=True, id_competence__isnull=False).update(
+        id_thematique_id=Subquery(
+            Competence.objects.filter(pk=OuterRef('id_competence_id')).values('id_thematique_id')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='difficulte',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='id_competence',
+            field=models.ForeignKey(blank=True, db_column='competence_id', db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='questions', to='myapp.competence'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='id_niveau',
+            field=models.ForeignKey(blank=True, db_column='niveau_id', db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='questions', to='myapp.niveau'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='id_sous_competence',
+            field=models.ForeignKey(blank=True, db_column='sous_competence_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='questions', to='myapp.souscompetence'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='id_thematique',
+            field=models.ForeignKey(blank=True, db_column='thematique_id', db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='questions', to='myapp.thematique'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['id_competence', 'id'], name='question_competence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['id_thematique', 'id'], name='question_thematique_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['id_niveau', 'id_competence', 'difficulte', 'type'], name='question_niveau_ctx_idx'),
+        ),
+        migrations.RunPython(backfill_question_context, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,7 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from django.utils import timezone
 
@@ -60,7 +64,67 @@ class SousCompetence(models.Model):
 
 class Question(models.Model):
     description = models.TextField()
+    # Question format ('quiz', 'true-false', 'question', 'qcm', ...)
     type = models.CharField(max_length=50)
+    # Curriculum context the question was generated for. Nullable: questions created
+    # by hand or before these columns existed may have no context.
+    id_niveau = models.ForeignKey(
+        Niveau,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='questions',
+        db_column='niveau_id',
+        db_index=False,  # covered by question_niveau_ctx_idx
+    )
+    id_thematique = models.ForeignKey(
+        Thematique,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='questions',
+        db_column='thematique_id',
+        db_index=False,  # covered by question_thematique_idx
+    )
+    id_competence = models.ForeignKey(
+        Competence,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='questions',
+        db_column='competence_id',
+        db_index=False,  # covered by question_competence_idx
+    )
+    id_sous_competence = models.ForeignKey(
+        SousCompetence,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='questions',
+        db_column='sous_competence_id',
+    )
+    difficulte = models.CharField(max_length=20, blank=True, default='')
+    # Full-text search document (French), maintained by PostgreSQL
+    search_vector = models.GeneratedField(
+        expression=SearchVector('description', config='french'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Search (see search.py): full-text, then trigram similarity for typos
+            GinIndex(fields=['search_vector'], name='question_search_idx'),
+            GinIndex(fields=['description'], opclasses=['gin_trgm_ops'], name='question_description_trgm_idx'),
+            # Listing by competence / thematique, in id order
+            models.Index(fields=['id_competence', 'id'], name='question_competence_idx'),
+            models.Index(fields=['id_thematique', 'id'], name='question_thematique_idx'),
+            # Filtering a competence's questions by niveau, difficulty and format
+            models.Index(
+                fields=['id_niveau', 'id_competence', 'difficulte', 'type'],
+                name='question_niveau_ctx_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Question {self.id} - {self.description[:50]}..."
@@ -70,6 +134,68 @@ class Reponse(models.Model):
     valide = models.BooleanField()
     description = models.TextField()
     id_question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='reponses')
+    search_vector = models.GeneratedField(
+        expression=SearchVector('description', config='french'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='reponse_search_idx'),
+            GinIndex(fields=['description'], opclasses=['gin_trgm_ops'], name='reponse_description_trgm_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"Réponse {self.id} - {'✓' if self.valide else '✗'} {self.description[:30]}..."
+
+
+class QuestionBand(models.Model):
+    """LSH bucket of a question's MinHash signature, for near-duplicate lookups (services/dedup.py)."""
+    id_question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='bands')
+    bucket = models.BigIntegerField(db_index=True)
+
+
+class ReferenceCacheVersion(models.Model):
+    """Compteur de version d'un modèle du référentiel, pour le cache de reference_cache.py."""
+    # Model label, e.g. "myapp.niveau"
+    model = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.model} v{self.version}"
+
+
+class GenerationJob(models.Model):
+    """Génération asynchrone de questions, suivie par /generate/jobs/<id>/."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_SUCCEEDED, 'Terminé'),
+        (STATUS_FAILED, 'Échec'),
+        (STATUS_CANCELLED, 'Annulé'),
+    ]
+    FINAL_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # Request payload (niveau_id, thematique_id, competence_id, ...)
+    params = models.JSONField(default=dict)
+    progress = models.PositiveSmallIntegerField(default=0)  # percentage
+    question_ids = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"Job {self.id} - {self.status} ({self.progress}%)"
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires_at <= timezone.now()
@@ -0,0 +1,112 @@
+import hashlib
+from typing import Any, Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .fieldsets import serializer_models
+from .models import ReferenceCacheVersion
+
+# Cache of pre-serialized JSON for the curriculum reference data (Matiere, Niveau,
+# Thematique, Competence, SousCompetence).
+#
+# Every model has a version counter; a cached response is stored under a key made of
+# the request path and the versions of the models it was built from. Saving or
+# deleting an instance bumps its model's version once the write is committed (see
+# signals.py), so exactly the responses depending on that model stop being served.
+#
+# The counters are rows of ReferenceCacheVersion, shared by all workers, so an
+# invalidation reaches every worker even when the responses themselves are cached per
+# process. Cost per request: a cached response runs one primary-key SELECT on that table
+# (nothing else); a miss adds the queries of the view. A write adds one UPDATE (an
+# INSERT the first time a model is written to) after its commit.
+
+CACHE_ALIAS = 'reference'
+KEY_PREFIX = 'refcache'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _label(model) -> str:
+    return model._meta.label_lower
+
+
+def current_versions(models: Iterable) -> str:
+    labels = [_label(model) for model in models]
+    versions = dict(ReferenceCacheVersion.objects.filter(model__in=labels).values_list('model', 'version'))
+    # No row yet: the model was never written to since the table was created
+    return '.'.join(str(versions.get(label, 0)) for label in labels)
+
+
+def bump_version(model) -> None:
+    """Invalidate every cached response built from `model`."""
+    counters = ReferenceCacheVersion.objects.filter(model=_label(model))
+    # Atomic increment in the database: concurrent bumps from several workers all count
+    if counters.update(version=F('version') + 1):
+        return
+    _, created = ReferenceCacheVersion.objects.get_or_create(model=_label(model), defaults={'version': 1})
+    if not created:
+        # Created meanwhile by another worker
+        counters.update(version=F('version') + 1)
+
+
+def json_response(request, body: bytes, etag: str) -> HttpResponse:
+    """JSON response with an ETag; 304 when the client's If-None-Match already matches."""
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def render_json(data: Any) -> tuple:
+    body = JSONRenderer().render(data)
+    return body, quote_etag(hashlib.sha1(body).hexdigest())
+
+
+def cached_json_response(request, models: Iterable, build: Callable[[], Any]) -> Optional[HttpResponse]:
+    """
+    Serve the JSON for this request from the cache, or build, render and store it.
+    `build` returns the data to serialize, or None when there is nothing to serve
+    (then None is returned and nothing is cached).
+    """
+    path_hash = hashlib.sha1(request.get_full_path().encode('utf-8')).hexdigest()
+    key = f"{KEY_PREFIX}:{path_hash}:{current_versions(models)}"
+    cache = _cache()
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        if data is None:
+            return None
+        entry = render_json(data)
+        cache.set(key, entry, timeout=getattr(settings, 'REFERENCE_CACHE_TTL', 3600))
+    return json_response(request, *entry)
+
+
+class CachedReferenceMixin:
+    """
+    For the reference-data ModelViewSets: `list` and `retrieve` are answered from the
+    reference cache. `cache_models` lists the models the serialized output depends on
+    (defaults to the models present in the serializer, expansions included).
+    """
+    cache_models = None
+
+    def get_cache_models(self):
+        return self.cache_models or serializer_models(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        return cached_json_response(
+            request, self.get_cache_models(), lambda: super(CachedReferenceMixin, self).list(request, *args, **kwargs).data,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_json_response(
+            request, self.get_cache_models(), lambda: super(CachedReferenceMixin, self).retrieve(request, *args, **kwargs).data,
+        )
@@ -0,0 +1,89 @@
+from typing import Any, Dict, List, Optional
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q, QuerySet
+
+from .models import Question
+
+# Search over the question bank, backed by the GIN indexes of the `search_vector`
+# (full-text, French configuration) and `description` (pg_trgm) columns.
+#
+# Full-text matches come first, ranked with ts_rank; when they do not fill the page,
+# trigram word similarity adds close spellings ("multiplcation" -> "multiplication").
+
+SEARCH_CONFIG = 'french'
+# Filters accepted by search_questions (query parameter -> lookup)
+SEARCH_FILTERS = {
+    'niveau_id': 'id_niveau_id',
+    'thematique_id': 'id_thematique_id',
+    'competence_id': 'id_competence_id',
+    'sous_competence_id': 'id_sous_competence_id',
+    'type': 'type',
+    'difficulte': 'difficulte',
+}
+# Filters on a foreign key: integer values only
+ID_FILTERS = ('niveau_id', 'thematique_id', 'competence_id', 'sous_competence_id')
+
+
+def search_filters(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    SEARCH_FILTERS values given in `params` (query parameters), ids converted to int.
+    Raises ValueError(param) for an id that is not an integer.
+    """
+    filters = {}
+    for param in SEARCH_FILTERS:
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        if param in ID_FILTERS:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(param) from None
+        filters[param] = value
+    return filters
+
+
+def search_query(text: str) -> SearchQuery:
+    # websearch syntax: quoted phrases, `or`, `-exclusion`; never raises on user input
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def full_text_filter(text: str, prefix: str = '') -> Q:
+    """Full-text or trigram match on `<prefix>search_vector` / `<prefix>description` (both indexed)."""
+    return Q(**{f'{prefix}search_vector': search_query(text)}) | Q(**{f'{prefix}description__trigram_word_similar': text})
+
+
+def search_questions(text: str, filters: Optional[Dict[str, Any]] = None, limit: int = 20) -> List[Question]:
+    """
+    Questions matching `text`, best first, with their réponses prefetched.
+    Each result carries `match` ('fulltext' | 'trigram') and `score`.
+    """
+    queryset: QuerySet = Question.objects.all()
+    for param, lookup in SEARCH_FILTERS.items():
+        value = (filters or {}).get(param)
+        if value not in (None, ''):
+            queryset = queryset.filter(**{lookup: value})
+
+    query = search_query(text)
+    ranked = list(
+        queryset.filter(search_vector=query)
+        .annotate(score=SearchRank(F('search_vector'), query))
+        .order_by('-score', 'id')
+        .prefetch_related('reponses')[:limit]
+    )
+    for question in ranked:
+        question.match = 'fulltext'
+
+    if len(ranked) < limit:
+        similar = list(
+            queryset.filter(description__trigram_word_similar=text)
+            .exclude(id__in=[question.id for question in ranked])
+            .annotate(score=TrigramWordSimilarity(text, 'description'))
+            .order_by('-score', 'id')
+            .prefetch_related('reponses')[:limit - len(ranked)]
+        )
+        for question in similar:
+            question.match = 'trigram'
+        ranked += similar
+    return ranked
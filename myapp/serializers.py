@@ -1,11 +1,12 @@
 from rest_framework import serializers
 from .models import (
     Niveau, Matiere, Thematique, Competence, SousCompetence,
-    Question, Reponse
+    Question, Reponse, GenerationJob
 )
+from .fieldsets import DynamicFieldsMixin
 
 
-class NiveauSerializer(serializers.ModelSerializer):
+class NiveauSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # Allow frontend to send a description even though the model doesn't store it
     description = serializers.CharField(required=False, allow_blank=True, write_only=True)
 
@@ -23,7 +24,7 @@ class NiveauSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class MatiereSerializer(serializers.ModelSerializer):
+class MatiereSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # Allow frontend to send a description even though the model doesn't store it
     description = serializers.CharField(required=False, allow_blank=True, write_only=True)
 
@@ -40,33 +41,53 @@ class MatiereSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class ThematiqueSerializer(serializers.ModelSerializer):
+class ThematiqueSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'id_matiere': 'MatiereSerializer'}
+
     class Meta:
         model = Thematique
         fields = '__all__'
 
 
-class CompetenceSerializer(serializers.ModelSerializer):
+class CompetenceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'id_thematique': 'ThematiqueSerializer'}
+
     class Meta:
         model = Competence
         fields = '__all__'
 
 
-class SousCompetenceSerializer(serializers.ModelSerializer):
+class SousCompetenceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'id_competence': 'CompetenceSerializer'}
+
     class Meta:
         model = SousCompetence
         fields = '__all__'
 
 
-class ReponseSerializer(serializers.ModelSerializer):
+class ReponseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'id_question': 'QuestionSerializer'}
+
     class Meta:
         model = Reponse
-        fields = '__all__'
+        exclude = ['search_vector']
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     reponses = ReponseSerializer(many=True, read_only=True)
+    expandable_fields = {
+        'id_niveau': 'NiveauSerializer',
+        'id_thematique': 'ThematiqueSerializer',
+        'id_competence': 'CompetenceSerializer',
+        'id_sous_competence': 'SousCompetenceSerializer',
+    }
     
     class Meta:
         model = Question
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['search_vector']
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = ['id', 'status', 'progress', 'question_ids', 'error', 'created_at', 'updated_at', 'expires_at']
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import random
+import weakref
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Constrained decoding: sampling restricted to the tokens that keep the output a valid
+# prefix of a grammar.
+#
+# A grammar is immutable; its states are plain tuples, so trying a candidate token
+# (`advance(state, text)`) costs one short walk over the token text and nothing else.
+# Two grammars are provided: JsonSchemaGrammar (the subset of JSON schema used for the
+# question payloads) and SentenceGrammar (one interrogative sentence).
+#
+# For Ollama the same schemas are sent as the `format` parameter and the server does the
+# masking; `constrained_tokens` does it for ctransformers models, step by step, from the
+# raw logits.
+#
+# No Django import: usable from any service.
+
+# Off by default: Ollama accepts JSON schemas in `format` from version 0.5 only
+CONSTRAINED_DECODING = os.getenv('CONSTRAINED_DECODING', '0').lower() in ('1', 'true', 'yes')
+# Highest-logit tokens tried against the grammar at each step before scanning the whole vocabulary
+CONSTRAINED_SCAN = int(os.getenv('CONSTRAINED_SCAN', '200'))
+
+State = Tuple[Any, ...]
+
+_WHITESPACE = ' \t\n\r'
+# Past this many trailing blank characters, whitespace-only tokens are only sampled when
+# nothing else fits (keeps the model from looping on indentation)
+_MAX_BLANK_RUN = 16
+
+
+class JsonSchemaGrammar:
+    """
+    Valid prefixes of a JSON document matching `schema`.
+
+    Supported: object (properties, required; no other key), array (items, minItems,
+    maxItems), string (minLength, maxLength), boolean, integer, number, null.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        digest = hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.name = f'json:{digest}'
+
+    def spec(self) -> Dict[str, Any]:
+        """JSON description, rebuilt by `grammar_from_spec` (model server requests)."""
+        return {'type': 'json_schema', 'schema': self.schema}
+
+    def initial(self) -> State:
+        # Stack of frames, innermost last; empty once the document is complete
+        return (('V', self.schema),)
+
+    def is_complete(self, state: State) -> bool:
+        return not state
+
+    def advance(self, state: State, text: str) -> Optional[State]:
+        """State after `text`, or None if `text` cannot follow."""
+        stack: Optional[State] = state
+        for ch in text:
+            if ch in _WHITESPACE and _accepts_whitespace(stack):
+                continue
+            stack = _step(stack, ch)
+            if stack is None:
+                return None
+        return stack
+
+
+def _accepts_whitespace(stack: Tuple[Any, ...]) -> bool:
+    """Whitespace is insignificant everywhere but inside strings, keys and numbers."""
+    return not stack or stack[-1][0] in ('V', 'O', 'A')
+
+
+def _complete(stack: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    """Pop the finished value and move its parent to the 'after a value' phase."""
+    stack = stack[:-1]
+    if not stack:
+        return stack
+    parent = stack[-1]
+    if parent[0] == 'O':
+        return stack[:-1] + (('O', parent[1], parent[2], 'next'),)
+    return stack[:-1] + (('A', parent[1], parent[2] + 1, 'next'),)
+
+
+def _start_value(stack: Tuple[Any, ...], schema: Dict[str, Any], ch: str) -> Optional[Tuple[Any, ...]]:
+    kind = schema.get('type')
+    if kind == 'object' and ch == '{':
+        return stack + (('O', schema, (), 'open'),)
+    if kind == 'array' and ch == '[':
+        return stack + (('A', schema, 0, 'open'),)
+    if kind == 'string' and ch == '"':
+        return stack + (('S', schema, 0, False),)
+    if kind == 'boolean' and ch in 'tf':
+        return stack + (('L', 'rue' if ch == 't' else 'alse'),)
+    if kind == 'null' and ch == 'n':
+        return stack + (('L', 'ull'),)
+    if kind in ('integer', 'number') and (ch == '-' or ch.isdigit()):
+        return stack + (('N', schema, ch),)
+    return None
+
+
+def _step(stack: Tuple[Any, ...], ch: str) -> Optional[Tuple[Any, ...]]:
+    if not stack:
+        return None  # only whitespace may follow a complete document
+    frame = stack[-1]
+    tag = frame[0]
+    below = stack[:-1]
+
+    if tag == 'V':
+        return _start_value(below, frame[1], ch)
+
+    if tag == 'S':
+        schema, length, escape = frame[1], frame[2], frame[3]
+        if escape:
+            return below + (('S', schema, length + 1, False),) if ch in '"\\/bfnrtu' else None
+        if ch == '\\':
+            return below + (('S', schema, length, True),)
+        if ch == '"':
+            return _complete(stack) if length >= schema.get('minLength', 0) else None
+        if ord(ch) < 0x20:
+            return None
+        if 'maxLength' in schema and length >= schema['maxLength']:
+            return None
+        return below + (('S', schema, length + 1, False),)
+
+    if tag == 'L':
+        remaining = frame[1]
+        if ch != remaining[0]:
+            return None
+        return below + (('L', remaining[1:]),) if len(remaining) > 1 else _complete(stack)
+
+    if tag == 'N':
+        schema, digits = frame[1], frame[2]
+        if ch.isdigit() or (schema.get('type') == 'number' and ch in '.eE+-'):
+            return below + (('N', schema, digits + ch),)
+        if not any(c.isdigit() for c in digits):
+            return None
+        # The number ends here: the character belongs to the parent
+        completed = _complete(stack)
+        return completed if ch in _WHITESPACE else _step(completed, ch)
+
+    if tag == 'K':
+        key = frame[1]
+        parent = below[-1]
+        properties = parent[1].get('properties', {})
+        if ch == '"':
+            if key not in properties or key in parent[2]:
+                return None
+            return below[:-1] + (('O', parent[1], parent[2] + (key,), 'colon'),)
+        if ch == '\\':
+            return None
+        key += ch
+        if not any(name.startswith(key) and name not in parent[2] for name in properties):
+            return None
+        return below + (('K', key),)
+
+    if tag == 'O':
+        schema, used, phase = frame[1], frame[2], frame[3]
+        properties = schema.get('properties', {})
+        remaining = [name for name in properties if name not in used]
+        required_done = all(name in used for name in schema.get('required', ()))
+        if phase in ('open', 'key') and ch == '"' and remaining:
+            return stack + (('K', ''),)
+        if phase in ('open', 'next') and ch == '}' and required_done:
+            return _complete(stack)
+        if phase == 'next' and ch == ',' and remaining:
+            return below + (('O', schema, used, 'key'),)
+        if phase == 'colon' and ch == ':':
+            return below + (('O', schema, used, 'value'), ('V', properties[used[-1]]))
+        return None
+
+    if tag == 'A':
+        schema, count, phase = frame[1], frame[2], frame[3]
+        max_items = schema.get('maxItems')
+        if phase in ('open', 'next') and ch == ']' and count >= schema.get('minItems', 0):
+            return _complete(stack)
+        if phase == 'next':
+            if ch == ',' and (max_items is None or count < max_items):
+                return below + (('A', schema, count, 'item'),)
+            return None
+        if max_items is not None and count >= max_items:
+            return None
+        return _step(below + (('A', schema, count, 'value'), ('V', schema.get('items', {}))), ch)
+
+    return None
+
+
+class SentenceGrammar:
+    """
+    One interrogative sentence on a single line: leading spaces, then at least
+    `min_words` words and a final '?'. Nothing may follow the question mark.
+    """
+
+    name = 'sentence'
+
+    def __init__(self, min_words: int = 3, max_chars: int = 300):
+        self.min_words = min_words
+        self.max_chars = max_chars
+
+    def spec(self) -> Dict[str, Any]:
+        return {'type': 'sentence', 'min_words': self.min_words, 'max_chars': self.max_chars}
+
+    def initial(self) -> State:
+        # (characters, completed words, inside a word, complete)
+        return (0, 0, False, False)
+
+    def is_complete(self, state: State) -> bool:
+        return state[3]
+
+    def advance(self, state: State, text: str) -> Optional[State]:
+        chars, words, in_word, complete = state
+        for ch in text:
+            if complete or ch in '\r\n':
+                return None
+            if ch.isspace():
+                if in_word:
+                    words, in_word = words + 1, False
+                continue
+            if not chars and not ch.isalnum():
+                return None
+            chars += 1
+            if chars > self.max_chars:
+                return None
+            if ch == '?':
+                if words + in_word < self.min_words:
+                    return None
+                complete = True
+            else:
+                in_word = True
+        return chars, words, in_word, complete
+
+
+def grammar_from_spec(spec: Dict[str, Any]) -> Any:
+    """Grammar described by `spec` (see the `spec()` methods). Raises ValueError for an unknown type."""
+    if spec.get('type') == 'json_schema' and isinstance(spec.get('schema'), dict):
+        return JsonSchemaGrammar(spec['schema'])
+    if spec.get('type') == 'sentence':
+        return SentenceGrammar(int(spec.get('min_words', 3)), int(spec.get('max_chars', 300)))
+    raise ValueError(f"Grammaire inconnue: {spec.get('type')!r}")
+
+
+_VOCABULARIES: 'weakref.WeakKeyDictionary[Any, List[str]]' = weakref.WeakKeyDictionary()
+
+
+def _vocabulary(model: Any) -> List[str]:
+    """Text of every token of `model`, computed once per loaded model."""
+    vocabulary = _VOCABULARIES.get(model)
+    if vocabulary is None:
+        # Byte-fallback tokens decode to '' on their own: they are never candidates
+        vocabulary = [model.detokenize([token]) for token in range(model.vocab_size)]
+        _VOCABULARIES[model] = vocabulary
+    return vocabulary
+
+
+def _sample(candidates: Sequence[Tuple[float, int]], temperature: float, top_p: float, rng: random.Random) -> int:
+    """Temperature / top-p sampling over (logit, token) pairs sorted by decreasing logit."""
+    if temperature <= 0 or len(candidates) == 1:
+        return candidates[0][1]
+    best = candidates[0][0]
+    weights = [math.exp((logit - best) / temperature) for logit, _ in candidates]
+    total = sum(weights)
+    kept, mass = 0, 0.0
+    while kept < len(weights) and mass < top_p * total:
+        mass += weights[kept]
+        kept += 1
+    return rng.choices([token for _, token in candidates[:kept]], weights[:kept])[0]
+
+
+def _candidates(
+    model: Any,
+    vocabulary: List[str],
+    grammar: Any,
+    state: State,
+    logits: Sequence[float],
+    top_k: int,
+    avoid_blank: bool,
+) -> Tuple[List[Tuple[float, int]], Dict[int, State]]:
+    """
+    Up to `top_k` (logit, token) pairs allowed by the grammar, by decreasing logit, with
+    the state each one leads to. The CONSTRAINED_SCAN best tokens are tried first; the
+    whole vocabulary only when none of them fits. With `avoid_blank`, whitespace-only
+    tokens are kept as a last resort.
+    """
+    candidates: List[Tuple[float, int]] = []
+    blanks: List[Tuple[float, int]] = []
+    states: Dict[int, State] = {}
+    ranked = heapq.nlargest(CONSTRAINED_SCAN, range(len(logits)), key=logits.__getitem__)
+    for tokens in (ranked, sorted(range(len(logits)), key=logits.__getitem__, reverse=True)):
+        for token in tokens:
+            text = vocabulary[token]
+            if not text or token in states or model.is_eos_token(token):
+                continue
+            next_state = grammar.advance(state, text)
+            if next_state is None:
+                continue
+            states[token] = next_state
+            if avoid_blank and text.isspace():
+                blanks.append((logits[token], token))
+                continue
+            candidates.append((logits[token], token))
+            if len(candidates) >= top_k:
+                return candidates, states
+        if candidates:
+            return candidates, states
+    return blanks[:top_k], states
+
+
+def constrained_tokens(
+    model: Any,
+    prompt: str,
+    grammar: Any,
+    max_new_tokens: int = 300,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    top_k: int = 40,
+    seed: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Generate with a ctransformers model, yielding token texts, while masking every
+    token that would take the output out of `grammar`. Stops as soon as the grammar
+    is complete (no end-of-sequence token needed), or after `max_new_tokens`.
+    """
+    vocabulary = _vocabulary(model)
+    rng = random.Random(seed)
+    state = grammar.initial()
+    blank_run = 0
+    model.eval(model.prepare_inputs_for_generation(model.tokenize(prompt), reset=True))
+    for _ in range(max_new_tokens):
+        logits = model.logits
+        candidates, states = _candidates(model, vocabulary, grammar, state, logits, top_k, blank_run >= _MAX_BLANK_RUN)
+        if not candidates:
+            return  # the grammar cannot be continued with this vocabulary
+        token = _sample(candidates, temperature, top_p, rng)
+        state = states[token]
+        text = vocabulary[token]
+        blank_run = blank_run + len(text) if text.isspace() else len(text) - len(text.rstrip())
+        yield text
+        if grammar.is_complete(state):
+            return
+        model.eval([token])
@@ -1,9 +1,17 @@
 from __future__ import annotations
 
+import json
+import logging
 import os
 import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
 
 try:
     # Lazy optional import; validated at first use
@@ -11,34 +19,537 @@ try:
 except Exception:  # pragma: no cover - dependency may not be installed yet
     AutoModelForCausalLM = None  # type: ignore
 
+from .constrained import CONSTRAINED_DECODING, JsonSchemaGrammar, constrained_tokens
+from .generation_cache import Uncacheable, get_generation_cache
+from .json_stream import JsonStreamExtractor
+from .metrics import GenerationTimer, observe, timed_chunks
+
+
+logger = logging.getLogger(__name__)
+
+# Out-of-process models (services/model_server.py), e.g. CTRANSFORMERS_SERVER_URL=http://127.0.0.1:8765
+CTRANSFORMERS_SERVER_URL = os.getenv("CTRANSFORMERS_SERVER_URL", "").strip()
+
+
+class ModelPoolBusy(RuntimeError):
+    """Aucune réplique du modèle n'est devenue disponible dans le délai imparti."""
+
+
+# Request priorities for the inference scheduler (lower runs first): interactive view
+# calls go ahead of background (Celery) jobs
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass(frozen=True)
+class ModelKey:
+    """Identifies a loaded model: same file with different settings is a different model."""
+    path: str
+    threads: Optional[int] = None
+    gpu_layers: Optional[int] = None
+
+
+class _ModelEntry:
+    """Replicas of one model plus the bookkeeping needed to lease them out."""
+
+    def __init__(self, key: ModelKey, max_replicas: int, size_bytes: int) -> None:
+        self.key = key
+        self.max_replicas = max(1, max_replicas)
+        self.size_bytes = size_bytes
+        self.condition = threading.Condition()
+        self.idle: List[Any] = []  # least recently used first
+        # Last prompt evaluated by each replica (by id): the replica still holds its tokens
+        self.prompts: Dict[int, str] = {}
+        self.prefix_hits = 0
+        self.loaded = 0
+        self.loading = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.in_use or self.loading or self.waiting)
+
+    def take_idle(self, prompt: Optional[str]) -> Any:
+        """
+        Pop the idle replica whose last prompt shares the longest prefix with `prompt`.
+        Without any shared prefix, the least recently used one is taken, so the warmest
+        states survive longest.
+        """
+        if prompt is None or len(self.idle) == 1:
+            return self.idle.pop()
+        shared = [len(os.path.commonprefix([self.prompts.get(id(r), ""), prompt])) for r in self.idle]
+        best = max(range(len(self.idle)), key=lambda i: (shared[i], i if shared[i] else -i))
+        if shared[best]:
+            self.prefix_hits += 1
+        return self.idle.pop(best)
+
+    def drop_replicas(self) -> None:
+        self.idle.clear()
+        self.prompts.clear()
+        self.loaded = 0
+
+
+class ModelPool:
+    """
+    Pool de modèles GGUF chargés en mémoire, indexés par chemin et réglages.
+
+    - chaque modèle peut avoir jusqu'à `max_replicas` répliques, chargées à la demande
+      quand toutes les répliques existantes sont occupées;
+    - chaque requête emprunte une réplique (une seule génération à la fois par réplique);
+    - une réplique garde les tokens de sa dernière requête et n'évalue que la partie d'un
+      nouveau prompt qui suit leur préfixe commun: `acquire(prompt=...)` choisit donc la
+      réplique libre dont le dernier prompt partage le plus long préfixe (ctransformers
+      ne sait pas sauvegarder/restaurer un état, chaque réplique en garde un seul);
+    - au-delà de `max_waiting` requêtes en attente, ou après `acquire_timeout` secondes,
+      `ModelPoolBusy` est levée;
+    - quand le budget RAM est dépassé, les modèles inactifs les moins récemment utilisés
+      sont déchargés;
+    - `loader(path, **kwargs)` remplace le chargement ctransformers (modèles factices des
+      benchmarks); le fichier n'a alors pas besoin d'exister.
+
+    Réglages par variables d'environnement (voir `from_env`):
+    CTRANSFORMERS_REPLICAS, CTRANSFORMERS_THREADS (par réplique), CTRANSFORMERS_GPU_LAYERS,
+    CTRANSFORMERS_MAX_WAITING, CTRANSFORMERS_ACQUIRE_TIMEOUT, CTRANSFORMERS_RAM_BUDGET_MB.
+    """
+
+    def __init__(
+        self,
+        max_replicas: int = 1,
+        threads_per_replica: Optional[int] = None,
+        gpu_layers: Optional[int] = None,
+        max_waiting: int = 8,
+        acquire_timeout: float = 60.0,
+        ram_budget_bytes: int = 0,
+        loader: Optional[Callable[..., Any]] = None,
+    ) -> None:
+        self.max_replicas = max(1, max_replicas)
+        self.threads_per_replica = threads_per_replica
+        self.gpu_layers = gpu_layers
+        self.max_waiting = max(0, max_waiting)
+        self.acquire_timeout = acquire_timeout
+        self.ram_budget_bytes = max(0, ram_budget_bytes)
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[ModelKey, _ModelEntry]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "ModelPool":
+        replicas = max(1, _env_int("CTRANSFORMERS_REPLICAS", 1))
+        # Each replica gets its own thread budget; by default the CPUs are split evenly.
+        threads = _env_int("CTRANSFORMERS_THREADS", 0) or None
+        if threads is None and replicas > 1:
+            threads = max(1, (os.cpu_count() or 1) // replicas)
+        gpu_layers = _env_int("CTRANSFORMERS_GPU_LAYERS", 0) or None
+        return cls(
+            max_replicas=replicas,
+            threads_per_replica=threads,
+            gpu_layers=gpu_layers,
+            max_waiting=_env_int("CTRANSFORMERS_MAX_WAITING", 8),
+            acquire_timeout=_env_float("CTRANSFORMERS_ACQUIRE_TIMEOUT", 60.0),
+            ram_budget_bytes=_env_int("CTRANSFORMERS_RAM_BUDGET_MB", 0) * 1024 * 1024,
+        )
+
+    def key_for(self, model_path: str | Path) -> ModelKey:
+        resolved = Path(model_path).expanduser().resolve()
+        return ModelKey(path=str(resolved), threads=self.threads_per_replica, gpu_layers=self.gpu_layers)
+
+    def _entry_for(self, key: ModelKey) -> _ModelEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                path = Path(key.path)
+                if path.exists():
+                    size_bytes = path.stat().st_size
+                elif self.loader is None:
+                    raise FileNotFoundError(f"Fichier modèle introuvable: {path}")
+                else:
+                    size_bytes = 0
+                entry = _ModelEntry(key, self.max_replicas, size_bytes)
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            return entry
+
+    def _resident_bytes(self) -> int:
+        return sum(e.size_bytes * (e.loaded + e.loading) for e in self._entries.values())
+
+    def _make_room(self, keep: _ModelEntry) -> None:
+        """Unload least-recently-used idle models until the resident estimate fits in the budget."""
+        if not self.ram_budget_bytes:
+            return
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if self._resident_bytes() <= self.ram_budget_bytes:
+                    return
+                if entry is keep or entry.busy:
+                    continue
+                with entry.condition:
+                    if entry.busy:
+                        continue
+                    entry.drop_replicas()
+                del self._entries[key]
+                logger.info("Modèle déchargé (budget RAM): %s", key.path)
+            if self._resident_bytes() > self.ram_budget_bytes:
+                logger.warning("Budget RAM dépassé: aucun modèle inactif à décharger")
+
+    def _load_replica(self, entry: _ModelEntry) -> Any:
+        if self.loader is None and AutoModelForCausalLM is None:
+            raise RuntimeError("Le paquet 'ctransformers' n'est pas installé.")
+        self._make_room(keep=entry)
+        model_kwargs: Dict[str, Any] = {}
+        if entry.key.threads is not None:
+            model_kwargs["threads"] = entry.key.threads
+        if entry.key.gpu_layers is not None and entry.key.gpu_layers > 0:
+            model_kwargs["gpu_layers"] = entry.key.gpu_layers
+        if self.loader is not None:
+            return self.loader(entry.key.path, **model_kwargs)
+        return AutoModelForCausalLM.from_pretrained(entry.key.path, **model_kwargs)
+
+    @contextmanager
+    def acquire(
+        self, model_path: str | Path, timeout: Optional[float] = None, prompt: Optional[str] = None,
+    ) -> Iterator[Any]:
+        """
+        Emprunte une réplique du modèle pour la durée du bloc `with`.
+        `prompt` (celui qui sera évalué) oriente le choix vers la réplique qui en a déjà
+        évalué le plus long préfixe.
+        """
+        entry = self._entry_for(self.key_for(model_path))
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        must_load = False
+
+        with entry.condition:
+            can_grow = entry.loaded + entry.loading < entry.max_replicas
+            if not entry.idle and not can_grow and entry.waiting >= self.max_waiting:
+                raise ModelPoolBusy("File d'attente du modèle local pleine, réessayez plus tard.")
+            entry.waiting += 1
+            try:
+                while True:
+                    if entry.idle:
+                        replica = entry.take_idle(prompt)
+                        break
+                    if entry.loaded + entry.loading < entry.max_replicas:
+                        entry.loading += 1
+                        must_load = True
+                        replica = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise ModelPoolBusy("Aucune réplique du modèle local disponible, réessayez plus tard.")
+                    entry.condition.wait(remaining)
+            finally:
+                entry.waiting -= 1
+            entry.in_use += 1
+
+        if must_load:
+            try:
+                replica = self._load_replica(entry)
+            except BaseException:
+                with entry.condition:
+                    entry.loading -= 1
+                    entry.in_use -= 1
+                    entry.condition.notify()
+                raise
+            with entry.condition:
+                entry.loading -= 1
+                entry.loaded += 1
+
+        try:
+            yield replica
+        finally:
+            with entry.condition:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                # An entry evicted meanwhile has loaded == 0: drop the replica instead of reusing it.
+                if entry.loaded:
+                    entry.idle.append(replica)
+                    if prompt is not None:
+                        entry.prompts[id(replica)] = prompt
+                    else:
+                        entry.prompts.pop(id(replica), None)
+                entry.condition.notify()
+
+    def evict(self, model_path: str | Path | None = None) -> None:
+        """Décharge un modèle inactif (ou tous les modèles inactifs si aucun chemin n'est donné)."""
+        target = self.key_for(model_path).path if model_path is not None else None
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if target is not None and key.path != target:
+                    continue
+                with entry.condition:
+                    if entry.busy:
+                        continue
+                    entry.drop_replicas()
+                del self._entries[key]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "path": key.path,
+                    "threads": key.threads,
+                    "replicas": entry.loaded,
+                    "in_use": entry.in_use,
+                    "waiting": entry.waiting,
+                    "prefix_hits": entry.prefix_hits,
+                    "size_bytes": entry.size_bytes,
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+_POOL_LOCK = threading.Lock()
+_POOL: Optional[ModelPool] = None
+
+
+def get_model_pool() -> ModelPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ModelPool.from_env()
+        return _POOL
+
+
+def _cache_key(prompt: str, model_path: str | Path, **params: Any) -> str:
+    return get_generation_cache().make_key(prompt, f"local:{Path(model_path).name}", params)
+
+
+def _cache_params(max_new_tokens: int, temperature: float, top_p: float, constraint: Optional[Any]) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"max_new_tokens": max_new_tokens, "temperature": temperature, "top_p": top_p}
+    if constraint is not None:
+        # Unconstrained keys are left unchanged so existing cache entries stay valid
+        params["constraint"] = constraint.name
+    return params
+
+
+def _run_on_replica(
+    model_path: str | Path,
+    prompt: str,
+    work: Callable[[Any], Any],
+    priority: int,
+    timeout: Optional[float],
+    key: Optional[str] = None,
+) -> Any:
+    """`work(model)` on a replica: through the inference scheduler, or straight from the pool when it is disabled."""
+    from .inference_scheduler import SCHEDULER_ENABLED, get_scheduler
+
+    if SCHEDULER_ENABLED:
+        return get_scheduler().run(model_path, prompt, work, priority=priority, timeout=timeout, key=key)
+    started = time.perf_counter()
+    with get_model_pool().acquire(model_path, timeout=timeout, prompt=prompt) as model:
+        observe("queue_wait", time.perf_counter() - started, "local")
+        return work(model)
 
-_MODEL_SINGLETON_LOCK = threading.Lock()
-_MODEL_SINGLETON: Optional["AutoModelForCausalLM"] = None
 
+@contextmanager
+def _lease_replica(model_path: str | Path, prompt: str, priority: int, timeout: Optional[float]) -> Iterator[Any]:
+    from .inference_scheduler import SCHEDULER_ENABLED, get_scheduler
 
-def _load_model(model_path: str | Path) -> "AutoModelForCausalLM":
-    global _MODEL_SINGLETON
-    if AutoModelForCausalLM is None:
-        raise RuntimeError("Le paquet 'ctransformers' n'est pas installé.")
+    if SCHEDULER_ENABLED:
+        with get_scheduler().lease(model_path, prompt, priority=priority, timeout=timeout) as model:
+            yield model
+    else:
+        started = time.perf_counter()
+        with get_model_pool().acquire(model_path, timeout=timeout, prompt=prompt) as model:
+            observe("queue_wait", time.perf_counter() - started, "local")
+            yield model
 
-    with _MODEL_SINGLETON_LOCK:
-        if _MODEL_SINGLETON is None:
-            resolved = Path(model_path).expanduser().resolve()
-            if not resolved.exists():
-                raise FileNotFoundError(f"Fichier modèle introuvable: {resolved}")
-            # Optional performance knobs via env
-            # CTRANSFORMERS_THREADS: int, CTRANSFORMERS_GPU_LAYERS: int
-            threads = int(os.getenv("CTRANSFORMERS_THREADS", "0")) or None
-            gpu_layers = int(os.getenv("CTRANSFORMERS_GPU_LAYERS", "0")) or None
 
-            model_kwargs = {}
-            if threads is not None:
-                model_kwargs["threads"] = threads
-            if gpu_layers is not None and gpu_layers > 0:
-                model_kwargs["gpu_layers"] = gpu_layers
+def _timer(model: Any, prompt: str) -> GenerationTimer:
+    tokenize = getattr(model, "tokenize", None)
+    return GenerationTimer("local", prompt_tokens=len(tokenize(prompt)) if tokenize else None)
 
-            _MODEL_SINGLETON = AutoModelForCausalLM.from_pretrained(str(resolved), **model_kwargs)
-        return _MODEL_SINGLETON
+
+def generate_in_process(
+    prompt: str,
+    model_path: str | Path,
+    max_new_tokens: int = 300,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    constraint: Optional[Any] = None,
+    priority: int = PRIORITY_BATCH,
+    timeout: Optional[float] = None,
+    key: Optional[str] = None,
+) -> str:
+    """Generation on this process's model pool (no cache); `key` merges identical queued requests."""
+    def work(model: Any) -> str:
+        # Streamed internally so the time to the first token (prompt evaluation) is measured
+        if constraint is not None:
+            chunks = constrained_tokens(
+                model, prompt, constraint, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+            )
+        else:
+            chunks = model(
+                prompt,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stream=True,
+            )
+        return "".join(timed_chunks(chunks, _timer(model, prompt))).strip()
+
+    return _run_on_replica(model_path, prompt, work, priority, timeout, key)
+
+
+def stream_in_process(
+    prompt: str,
+    model_path: str | Path,
+    max_new_tokens: int = 300,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    constraint: Optional[Any] = None,
+    priority: int = PRIORITY_BATCH,
+    timeout: Optional[float] = None,
+) -> Iterator[str]:
+    """Streaming generation on this process's model pool; the replica is held until the generator ends or is closed."""
+    with _lease_replica(model_path, prompt, priority, timeout) as model:
+        if constraint is not None:
+            chunks = constrained_tokens(
+                model, prompt, constraint, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+            )
+        else:
+            chunks = model(
+                prompt,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stream=True,
+            )
+        yield from timed_chunks(chunks, _timer(model, prompt))
+
+
+class ModelServerClient:
+    """
+    Client du serveur de modèles (services/model_server.py), utilisé à la place du pool local
+    quand CTRANSFORMERS_SERVER_URL est défini: les poids ne sont alors chargés qu'une fois,
+    dans le serveur, quel que soit le nombre de workers Django / Celery / FastAPI.
+    Les erreurs du serveur sont relevées comme en local (ModelPoolBusy, FileNotFoundError,
+    RuntimeError).
+    """
+
+    def __init__(self, base_url: str, connect_timeout: float = 3.05, read_timeout: float = 300.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+
+    def _payload(
+        self,
+        prompt: str,
+        model_path: str | Path,
+        params: Dict[str, Any],
+        constraint: Optional[Any],
+        priority: int,
+        timeout: Optional[float],
+        key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"prompt": prompt, "model": Path(model_path).name, "priority": priority, **params}
+        if constraint is not None:
+            payload["constraint"] = constraint.spec()
+        if timeout is not None:
+            payload["timeout"] = timeout
+        if key is not None:
+            payload["key"] = key
+        return payload
+
+    def _post(self, payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+        try:
+            resp = self.session.post(f"{self.base_url}/generate", json=payload, timeout=self.timeout, stream=stream)
+        except requests.exceptions.RequestException as exc:
+            raise RuntimeError(f"Serveur de modèle local injoignable: {exc}")
+        if resp.status_code < 400:
+            return resp
+        try:
+            message = resp.json().get("error") or resp.reason
+        except ValueError:
+            message = resp.reason
+        resp.close()
+        if resp.status_code == 503:
+            raise ModelPoolBusy(message)
+        if resp.status_code == 404:
+            raise FileNotFoundError(message)
+        raise RuntimeError(message)
+
+    def generate(
+        self,
+        prompt: str,
+        model_path: str | Path,
+        params: Dict[str, Any],
+        constraint: Optional[Any] = None,
+        priority: int = PRIORITY_BATCH,
+        timeout: Optional[float] = None,
+        key: Optional[str] = None,
+    ) -> str:
+        payload = self._payload(prompt, model_path, params, constraint, priority, timeout, key)
+        timer = GenerationTimer("model_server")
+        text = self._post(payload).json().get("text", "")
+        timer.finish()
+        return text
+
+    def stream(
+        self,
+        prompt: str,
+        model_path: str | Path,
+        params: Dict[str, Any],
+        constraint: Optional[Any] = None,
+        priority: int = PRIORITY_BATCH,
+        timeout: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Chunks as the server produces them; closing the generator makes the server stop generating."""
+        payload = {**self._payload(prompt, model_path, params, constraint, priority, timeout), "stream": True}
+        timer = GenerationTimer("model_server")
+        resp = self._post(payload, stream=True)
+        try:
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                if data.get("done"):
+                    break
+                timer.token()
+                yield data.get("text", "")
+        finally:
+            resp.close()
+            timer.finish()
+
+    def ready(self) -> bool:
+        try:
+            return self.session.get(f"{self.base_url}/readyz", timeout=self.timeout).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+
+_CLIENT_LOCK = threading.Lock()
+_CLIENT: Optional[ModelServerClient] = None
+
+
+def get_model_server_client() -> Optional[ModelServerClient]:
+    """Client of the model server, or None when CTRANSFORMERS_SERVER_URL is not set (in-process models)."""
+    global _CLIENT
+    if not CTRANSFORMERS_SERVER_URL:
+        return None
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = ModelServerClient(
+                CTRANSFORMERS_SERVER_URL, read_timeout=_env_float("CTRANSFORMERS_SERVER_TIMEOUT", 300.0),
+            )
+        return _CLIENT
 
 
 def generate_locally(
@@ -47,17 +558,106 @@ def generate_locally(
     max_new_tokens: int = 300,
     temperature: float = 0.7,
     top_p: float = 0.9,
+    use_cache: bool = True,
+    constraint: Optional[Any] = None,
+    priority: int = PRIORITY_BATCH,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    Génère un texte en local via ctransformers, sur une réplique du pool de modèles attribuée
+    par l'ordonnanceur (services/inference_scheduler.py) selon `priority` (PRIORITY_INTERACTIVE
+    pour les vues); `timeout` borne l'attente avant démarrage (ModelPoolBusy au-delà).
+    Avec `constraint` (grammaire de services/constrained.py), seuls les tokens qui respectent
+    la grammaire peuvent être échantillonnés.
+    Avec CTRANSFORMERS_SERVER_URL, la génération est déléguée au serveur de modèles.
+    """
+    params = _cache_params(max_new_tokens, temperature, top_p, None)
+
+    def run(key: Optional[str] = None) -> str:
+        client = get_model_server_client()
+        if client is not None:
+            return client.generate(prompt, model_path, params, constraint, priority, timeout, key)
+        return generate_in_process(prompt, model_path, **params, constraint=constraint,
+                                   priority=priority, timeout=timeout, key=key)
+
+    if not use_cache:
+        return run()
+    key = _cache_key(prompt, model_path, **_cache_params(max_new_tokens, temperature, top_p, constraint))
+    # Identical requests queued at the same time share one generation
+    return get_generation_cache().get_or_generate(key, lambda: run(key))
+
+
+def stream_locally(
+    prompt: str,
+    model_path: str | Path,
+    max_new_tokens: int = 300,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    use_cache: bool = True,
+    constraint: Optional[Any] = None,
+    priority: int = PRIORITY_BATCH,
+    timeout: Optional[float] = None,
+) -> Iterator[str]:
+    """
+    Variante streaming de `generate_locally`: la réplique reste empruntée jusqu'à
+    l'épuisement (ou la fermeture) du générateur.
+    """
+    params = _cache_params(max_new_tokens, temperature, top_p, None)
+
+    def run() -> Iterator[str]:
+        client = get_model_server_client()
+        if client is not None:
+            return client.stream(prompt, model_path, params, constraint, priority, timeout)
+        return stream_in_process(prompt, model_path, **params, constraint=constraint, priority=priority, timeout=timeout)
+
+    if not use_cache:
+        yield from run()
+        return
+    key = _cache_key(prompt, model_path, **_cache_params(max_new_tokens, temperature, top_p, constraint))
+    yield from get_generation_cache().stream_through(key, run)
+
+
+def generate_json_locally(
+    prompt: str,
+    model_path: str | Path,
+    accept: Optional[Callable[[Any], bool]] = None,
+    schema: Optional[Dict[str, Any]] = None,
+    max_new_tokens: int = 300,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    use_cache: bool = True,
+    priority: int = PRIORITY_BATCH,
+    timeout: Optional[float] = None,
+    constraint: Optional[Any] = None,
 ) -> str:
     """
-    Génère un texte en local via ctransformers, en réutilisant un singleton du modèle.
+    Variante de `generate_locally` pour les réponses JSON (comme
+    llm_client.generate_json_with_model): la génération s'arrête dès qu'une valeur JSON
+    acceptée par `accept` est sortie. `schema` contraint l'échantillonnage
+    (JsonSchemaGrammar) si CONSTRAINED_DECODING est actif, sauf si `constraint` est donné.
     """
-    model = _load_model(model_path)
-    output = model(
-        prompt,
-        max_new_tokens=max_new_tokens,
-        temperature=temperature,
-        top_p=top_p,
-    )
-    return (output or "").strip()
+    if constraint is None and schema is not None and CONSTRAINED_DECODING:
+        constraint = JsonSchemaGrammar(schema)
 
+    def run(cached: bool = False) -> str:
+        extractor = JsonStreamExtractor(accept)
+        stream = stream_locally(
+            prompt, model_path, max_new_tokens, temperature, top_p,
+            use_cache=False, constraint=constraint, priority=priority, timeout=timeout,
+        )
+        try:
+            for chunk in stream:
+                if extractor.feed(chunk):
+                    break
+        finally:
+            # Releases the replica (or stops the model server) right away
+            stream.close()
+        if cached and not extractor.done:
+            # No accepted value: the raw text goes back to the caller but is never served again
+            raise Uncacheable(extractor.text())
+        return extractor.text()
 
+    if not use_cache:
+        return run()
+    key = _cache_key(prompt, model_path, **_cache_params(max_new_tokens, temperature, top_p, constraint), extract="json")
+    return get_generation_cache().get_or_generate(key, lambda: run(cached=True))
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+import re
+import struct
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Count
+
+from ..models import Question, QuestionBand
+from .metrics import stage
+
+# Near-duplicate detection for the question bank (MinHash + LSH banding).
+#
+# Each question description is reduced to its character shingles, summarized by a
+# MinHash signature whose bands are hashed into buckets stored in QuestionBand. Two
+# questions sharing at least one bucket are candidates; candidates are confirmed with
+# the exact Jaccard similarity of their shingles. A lookup is therefore one indexed
+# `bucket IN (...)` query, whatever the size of the bank.
+#
+# With DEDUP_BANDS bands of DEDUP_ROWS rows, pairs above ~(1/bands)^(1/rows) similarity
+# become candidates (0.5 with the defaults), so pairs above DEDUP_THRESHOLD are found
+# with near certainty.
+#
+# Env config:
+# - DEDUP_THRESHOLD: Jaccard similarity from which two questions are duplicates (default 0.8)
+# - DEDUP_BANDS / DEDUP_ROWS: LSH banding (default 16 x 4, i.e. 64 hash functions)
+# - DEDUP_SHINGLE_SIZE: shingle length in characters (default 4)
+# - DEDUP_ENABLED: set to 0 to let generation keep duplicates (the index is still maintained)
+
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.8'))
+DEDUP_BANDS = int(os.getenv('DEDUP_BANDS', '16'))
+DEDUP_ROWS = int(os.getenv('DEDUP_ROWS', '4'))
+DEDUP_SHINGLE_SIZE = int(os.getenv('DEDUP_SHINGLE_SIZE', '4'))
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MASK_32 = (1 << 32) - 1
+# Fixed seed: signatures must stay comparable across processes and restarts
+_rng = random.Random(20240501)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(DEDUP_BANDS * DEDUP_ROWS)
+]
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return re.sub(r'[\W_]+', ' ', text).strip()
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_SIZE) -> Set[str]:
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _hash32(value: str) -> int:
+    return struct.unpack('<I', hashlib.blake2b(value.encode('utf-8'), digest_size=4).digest())[0]
+
+
+def minhash(shingle_set: Set[str]) -> List[int]:
+    hashes = [_hash32(shingle) for shingle in shingle_set] or [0]
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MASK_32
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_buckets(signature: Sequence[int]) -> List[int]:
+    """One signed 64-bit bucket per band (the band index is part of the hash)."""
+    buckets = []
+    for band in range(DEDUP_BANDS):
+        rows = signature[band * DEDUP_ROWS:(band + 1) * DEDUP_ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<H{len(rows)}I', band, *rows), digest_size=8).digest()
+        buckets.append(struct.unpack('<q', digest)[0])
+    return buckets
+
+
+def text_buckets(text: str) -> List[int]:
+    return band_buckets(minhash(shingles(text)))
+
+
+def index_questions(questions: Iterable[Question], replace: bool = False) -> int:
+    """Store the LSH buckets of `questions`; `replace` drops their previous buckets first."""
+    questions = list(questions)
+    if not questions:
+        return 0
+    rows = [
+        QuestionBand(id_question=question, bucket=bucket)
+        for question in questions
+        for bucket in text_buckets(question.description)
+    ]
+    with transaction.atomic():
+        if replace:
+            QuestionBand.objects.filter(id_question__in=questions).delete()
+        QuestionBand.objects.bulk_create(rows)
+    return len(questions)
+
+
+def find_similar(
+    text: str,
+    threshold: float = DEDUP_THRESHOLD,
+    competence_id: Optional[int] = None,
+    exclude_ids: Iterable[int] = (),
+    limit: int = 5,
+) -> List[Tuple[int, float]]:
+    """
+    Existing questions similar to `text` (optionally within one competence):
+    [(question_id, similarity), ...], most similar first.
+    """
+    candidates = Question.objects.filter(bands__bucket__in=text_buckets(text)).exclude(id__in=list(exclude_ids))
+    if competence_id:
+        candidates = candidates.filter(id_competence_id=competence_id)
+    reference = shingles(text)
+    matches = []
+    with stage('dedup'):
+        for question_id, description in candidates.distinct().values_list('id', 'description'):
+            similarity = jaccard(reference, shingles(description))
+            if similarity >= threshold:
+                matches.append((question_id, round(similarity, 3)))
+    matches.sort(key=lambda match: -match[1])
+    return matches[:limit]
+
+
+class DuplicateChecker:
+    """
+    Callable used by the generation pipeline: `checker(text)` returns True when `text`
+    nearly duplicates an existing question, or one already accepted by this checker.
+    """
+
+    def __init__(self, competence_id: Optional[int] = None, threshold: float = DEDUP_THRESHOLD):
+        self.competence_id = competence_id
+        self.threshold = threshold
+        self.accepted: List[Set[str]] = []
+        self.rejected: Dict[str, int] = {}  # text -> id of the existing question it duplicates
+
+    def __call__(self, text: str) -> bool:
+        reference = shingles(text)
+        if any(jaccard(reference, other) >= self.threshold for other in self.accepted):
+            return True
+        similar = find_similar(text, self.threshold, competence_id=self.competence_id, limit=1)
+        if similar:
+            self.rejected[text] = similar[0][0]
+            return True
+        self.accepted.append(reference)
+        return False
+
+
+def duplicate_checker(competence_id: Optional[int] = None) -> Optional[Callable[[str], bool]]:
+    """Checker for a generation call, or None when deduplication is disabled."""
+    return DuplicateChecker(competence_id) if DEDUP_ENABLED else None
+
+
+def duplicate_clusters(threshold: float = DEDUP_THRESHOLD, competence_id: Optional[int] = None) -> List[List[int]]:
+    """
+    Groups of near-duplicate questions over the whole bank, largest first.
+    Only questions sharing an LSH bucket are compared, each against the first member
+    of the bucket, so the cost grows with the number of collisions rather than n².
+    """
+    bands = QuestionBand.objects.all()
+    if competence_id:
+        bands = bands.filter(id_question__id_competence_id=competence_id)
+    shared = bands.values('bucket').annotate(size=Count('id')).filter(size__gt=1).values('bucket')
+    bands = bands.filter(bucket__in=shared).order_by('bucket', 'id_question_id')
+
+    parent: Dict[int, int] = {}
+
+    def find(node: int) -> int:
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    shingle_cache: Dict[int, Set[str]] = {}
+
+    def question_shingles(ids: Iterable[int]) -> None:
+        missing = [qid for qid in ids if qid not in shingle_cache]
+        for qid, description in Question.objects.filter(id__in=missing).values_list('id', 'description'):
+            shingle_cache[qid] = shingles(description)
+
+    def process(members: List[int]) -> None:
+        if len(members) < 2:
+            return
+        question_shingles(members)
+        head = members[0]
+        for other in members[1:]:
+            if find(other) != find(head) and jaccard(shingle_cache[head], shingle_cache[other]) >= threshold:
+                parent[find(other)] = find(head)
+
+    current_bucket, members = None, []
+    for bucket, question_id in bands.values_list('bucket', 'id_question_id').iterator(chunk_size=10000):
+        if bucket != current_bucket:
+            process(members)
+            current_bucket, members = bucket, []
+        members.append(question_id)
+    process(members)
+
+    clusters: Dict[int, List[int]] = {}
+    for node in list(parent):
+        clusters.setdefault(find(node), []).append(node)
+    return sorted((sorted(ids) for ids in clusters.values() if len(ids) > 1), key=lambda ids: (-len(ids), ids[0]))
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import abc
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .metrics import count
+
+# Configuration via environment variables:
+# GENERATION_CACHE_BACKEND=lru | django | sqlite | none
+# GENERATION_CACHE_TTL (seconds, 0 = no expiry), GENERATION_CACHE_MAX_ENTRIES
+# GENERATION_CACHE_VARIANTS: number of distinct completions collected per key before
+#   cached ones are served (in rotation) instead of generating anew
+# GENERATION_CACHE_PATH (sqlite backend), GENERATION_CACHE_ALIAS (django backend)
+GENERATION_CACHE_BACKEND = os.getenv('GENERATION_CACHE_BACKEND', 'lru')
+GENERATION_CACHE_TTL = int(os.getenv('GENERATION_CACHE_TTL', '3600'))
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', '1024'))
+GENERATION_CACHE_VARIANTS = int(os.getenv('GENERATION_CACHE_VARIANTS', '3'))
+GENERATION_CACHE_PATH = os.getenv('GENERATION_CACHE_PATH', './generation_cache.sqlite3')
+GENERATION_CACHE_ALIAS = os.getenv('GENERATION_CACHE_ALIAS', 'default')
+
+
+class Uncacheable(Exception):
+    """
+    Raised by the `generate` callable of `GenerationCache.get_or_generate` for an output that
+    must not be stored (rejected or malformed): `text` is returned to the caller as is.
+    """
+
+    def __init__(self, text: str) -> None:
+        super().__init__(text)
+        self.text = text
+
+
+class CacheBackend(abc.ABC):
+    """Stockage des entrées du cache: clé -> {"variants": [textes], "complete": bool}."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The entry stored under `key`, or None."""
+
+    @abc.abstractmethod
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store `entry` under `key`, replacing the previous one."""
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Drop every entry."""
+
+
+class NullBackend(CacheBackend):
+    """Stores nothing (backend 'none')."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class LRUBackend(CacheBackend):
+    """In-process LRU with TTL; each worker process has its own copy."""
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 3600) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return {**entry, 'variants': list(entry['variants'])}
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            previous = self._data.get(key)
+            # Adding a variant keeps the original expiry: TTL counts from the first generation
+            expires_at = previous[0] if previous else (time.time() + self.ttl if self.ttl else 0)
+            self._data[key] = (expires_at, entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend(CacheBackend):
+    """Shared across workers through a Django cache (size limits come from its MAX_ENTRIES option)."""
+
+    prefix = 'generation:'
+
+    def __init__(self, alias: str = 'default', ttl: int = 3600) -> None:
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+        self.ttl = ttl or None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self.cache.set(self.prefix + key, entry, timeout=self.ttl)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+class SQLiteBackend(CacheBackend):
+    """On-disk cache that survives restarts; least recently read entries are evicted first."""
+
+    def __init__(self, path: str | Path, max_entries: int = 1024, ttl: int = 3600) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generation_cache ("
+                " key TEXT PRIMARY KEY, entry TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS generation_cache_last_access ON generation_cache (last_access)"
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT entry, expires_at FROM generation_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] and row[1] < now:
+                self._conn.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE generation_cache SET last_access = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else 0
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO generation_cache (key, entry, expires_at, last_access) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET entry = excluded.entry, last_access = excluded.last_access",
+                (key, json.dumps(entry, ensure_ascii=False), expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM generation_cache WHERE key IN ("
+                " SELECT key FROM generation_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM generation_cache")
+
+
+class GenerationCache:
+    """
+    Cache de générations adressé par contenu: la clé est un hash du prompt final,
+    du modèle et des paramètres d'échantillonnage.
+
+    Tant que moins de `variants` complétions distinctes sont connues pour une clé,
+    chaque appel génère à nouveau (et enrichit le cache); ensuite les variantes
+    en cache sont servies à tour de rôle. Si le modèle renvoie une complétion déjà
+    connue, il est considéré comme épuisé pour cette clé et le cache sert dès lors.
+    """
+
+    def __init__(self, backend: CacheBackend, variants: int = 1) -> None:
+        self.backend = backend
+        self.variants = max(1, variants)
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt: str, model: str, params: Dict[str, Any] | None = None) -> str:
+        material = json.dumps(
+            {'prompt': prompt, 'model': model, 'params': params or {}},
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def lookup(self, key: str) -> Optional[str]:
+        entry = self.backend.get(key)
+        with self._lock:
+            if not entry or not entry['complete']:
+                self.misses += 1
+                text = None
+            else:
+                self.hits += 1
+                variants = entry['variants']
+                text = variants[next(self._rotation) % len(variants)]
+        count('cache_misses' if text is None else 'cache_hits')
+        return text
+
+    def store(self, key: str, text: str) -> None:
+        if not text:
+            return
+        entry = self.backend.get(key) or {'variants': [], 'complete': False}
+        if entry['complete']:
+            return
+        if text in entry['variants']:
+            entry['complete'] = True
+        else:
+            entry['variants'].append(text)
+            entry['complete'] = len(entry['variants']) >= self.variants
+        self.backend.set(key, entry)
+
+    def get_or_generate(self, key: str, generate: Callable[[], str]) -> str:
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+        try:
+            text = generate()
+        except Uncacheable as output:
+            return output.text
+        self.store(key, text)
+        return text
+
+    def stream_through(self, key: str, stream: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Streaming counterpart of `get_or_generate`: only fully consumed streams are stored."""
+        cached = self.lookup(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in stream():
+            chunks.append(chunk)
+            yield chunk
+        self.store(key, ''.join(chunks))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / total) if total else 0.0,
+            }
+
+
+class _NullCache(GenerationCache):
+    """Backend 'none': every call generates, nothing is counted."""
+
+    def __init__(self) -> None:
+        super().__init__(backend=NullBackend())
+
+    def lookup(self, key: str) -> Optional[str]:
+        return None
+
+    def store(self, key: str, text: str) -> None:
+        return None
+
+
+def build_generation_cache(backend: str = GENERATION_CACHE_BACKEND) -> GenerationCache:
+    if backend == 'none':
+        return _NullCache()
+    if backend == 'django':
+        store: CacheBackend = DjangoCacheBackend(GENERATION_CACHE_ALIAS, ttl=GENERATION_CACHE_TTL)
+    elif backend == 'sqlite':
+        store = SQLiteBackend(GENERATION_CACHE_PATH, max_entries=GENERATION_CACHE_MAX_ENTRIES, ttl=GENERATION_CACHE_TTL)
+    elif backend == 'lru':
+        store = LRUBackend(max_entries=GENERATION_CACHE_MAX_ENTRIES, ttl=GENERATION_CACHE_TTL)
+    else:
+        raise ValueError(f"Backend de cache inconnu: {backend}")
+    return GenerationCache(store, variants=GENERATION_CACHE_VARIANTS)
+
+
+_CACHE_LOCK = threading.Lock()
+_CACHE: Optional[GenerationCache] = None
+
+
+def get_generation_cache() -> GenerationCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = build_generation_cache()
+        return _CACHE
@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional
+
+from .ctransformers_client import PRIORITY_BATCH, ModelPool, ModelPoolBusy, get_model_pool
+from .metrics import observe
+
+
+SCHEDULER_ENABLED = os.getenv('CTRANSFORMERS_SCHEDULER', '1').lower() not in ('0', 'false', 'no')
+SCHEDULER_MAX_QUEUE = int(os.getenv('CTRANSFORMERS_MAX_QUEUE', '32'))
+SCHEDULER_BATCH_WINDOW = int(os.getenv('CTRANSFORMERS_BATCH_WINDOW_MS', '5')) / 1000
+SCHEDULER_MAX_BATCH = int(os.getenv('CTRANSFORMERS_MAX_BATCH', '4'))
+
+
+class DeadlineExceeded(ModelPoolBusy):
+    """La requête n'a pas pu démarrer avant son échéance."""
+
+
+@dataclass(order=True)
+class _Request:
+    priority: int
+    deadline: float
+    seq: int
+    model_path: str = field(compare=False)
+    prompt: str = field(compare=False)
+    work: Callable[[Any], Any] = field(compare=False)
+    key: Optional[str] = field(compare=False)
+    futures: List[Future] = field(compare=False, default_factory=list)
+
+
+def _shared_prefix(a: str, b: str) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+
+class InferenceScheduler:
+    """
+    File de priorité devant le pool de modèles locaux.
+
+    - une requête est une fonction `work(model)` exécutée sur une réplique; l'appelant
+      récupère son résultat (ou son exception) via un `Future`;
+    - ordre: priorité, puis échéance la plus proche; une requête dont l'échéance est
+      passée avant son démarrage échoue avec `DeadlineExceeded`;
+    - au-delà de `max_queue` requêtes en attente, `ModelPoolBusy` est levée tout de suite;
+    - un worker par réplique: après une courte fenêtre (`batch_window`), il prend la
+      requête en tête et jusqu'à `max_batch - 1` requêtes de même priorité dont le prompt
+      partage le plus long préfixe avec elle, et les exécute à la suite sur la même
+      réplique, qui n'évalue que la partie non partagée de chaque prompt;
+    - les requêtes en attente de même clé (`key`, ex. clé du cache de génération) sont
+      fusionnées: une seule génération sert tous les appelants.
+
+    ctransformers ne génère qu'une séquence à la fois par modèle: le débit augmente avec
+    le nombre de répliques et la réutilisation des préfixes, pas avec un batch de tenseurs.
+    """
+
+    def __init__(
+        self,
+        pool: ModelPool,
+        workers: int = 1,
+        max_queue: int = 32,
+        batch_window: float = 0.005,
+        max_batch: int = 4,
+    ) -> None:
+        self.pool = pool
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.batch_window = max(0.0, batch_window)
+        self.max_batch = max(1, max_batch)
+        self._condition = threading.Condition()
+        self._heap: List[_Request] = []
+        self._by_key: dict = {}
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self.completed = 0
+        self.merged = 0
+        self.expired = 0
+
+    @classmethod
+    def from_env(cls, pool: Optional[ModelPool] = None) -> 'InferenceScheduler':
+        pool = pool or get_model_pool()
+        return cls(
+            pool,
+            workers=pool.max_replicas,
+            max_queue=SCHEDULER_MAX_QUEUE,
+            batch_window=SCHEDULER_BATCH_WINDOW,
+            max_batch=SCHEDULER_MAX_BATCH,
+        )
+
+    def submit(
+        self,
+        model_path: str,
+        prompt: str,
+        work: Callable[[Any], Any],
+        priority: int = PRIORITY_BATCH,
+        timeout: Optional[float] = None,
+        key: Optional[str] = None,
+    ) -> Future:
+        """Met `work(model)` en file; `timeout` (secondes) borne l'attente avant démarrage."""
+        future: Future = Future()
+        timeout = self.pool.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            pending = self._by_key.get(key) if key is not None else None
+            if pending is not None:
+                pending.futures.append(future)
+                self.merged += 1
+                if priority < pending.priority or deadline < pending.deadline:
+                    # The merged request inherits the most urgent of its callers
+                    pending.priority = min(priority, pending.priority)
+                    pending.deadline = min(deadline, pending.deadline)
+                    heapq.heapify(self._heap)
+                return future
+            if len(self._heap) >= self.max_queue:
+                raise ModelPoolBusy("File d'attente du modèle local pleine, réessayez plus tard.")
+            request = _Request(
+                priority, deadline, next(self._seq), str(model_path), prompt,
+                _in_context(work, contextvars.copy_context()), key, [future],
+            )
+            heapq.heappush(self._heap, request)
+            if key is not None:
+                self._by_key[key] = request
+            self._start_workers()
+            self._condition.notify()
+        return future
+
+    def run(self, *args: Any, **kwargs: Any) -> Any:
+        """`submit` puis attend le résultat (les exceptions de `work` sont relancées)."""
+        return self.submit(*args, **kwargs).result()
+
+    @contextmanager
+    def lease(
+        self,
+        model_path: str,
+        prompt: str,
+        priority: int = PRIORITY_BATCH,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Any]:
+        """
+        Réplique prêtée à l'appelant pour la durée du bloc `with` (génération en streaming),
+        attribuée dans le même ordre que les autres requêtes.
+        """
+        handoff: 'queue.Queue[Any]' = queue.Queue()
+        released = threading.Event()
+
+        def work(model: Any) -> None:
+            handoff.put(model)
+            released.wait()
+
+        future = self.submit(model_path, prompt, work, priority=priority, timeout=timeout)
+        future.add_done_callback(lambda _: handoff.put(None))
+        model = handoff.get()
+        if model is None:
+            future.result()  # raises the failure (deadline, busy pool, missing file...)
+        try:
+            yield model
+        finally:
+            released.set()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                'queued': len(self._heap),
+                'workers': len(self._threads),
+                'completed': self.completed,
+                'merged': self.merged,
+                'expired': self.expired,
+            }
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._worker, name=f'inference-worker-{len(self._threads)}', daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _pop(self) -> _Request:
+        request = heapq.heappop(self._heap)
+        if request.key is not None:
+            self._by_key.pop(request.key, None)
+        return request
+
+    def _next_batch(self) -> List[_Request]:
+        """Head of the queue plus the queued requests that share the longest prompt prefix with it."""
+        with self._condition:
+            while not self._heap:
+                self._condition.wait()
+            if self.batch_window and len(self._heap) < self.max_batch:
+                # Let requests arriving together be grouped
+                self._condition.wait(self.batch_window)
+                if not self._heap:
+                    return []
+            head = self._pop()
+            companions = sorted(
+                (r for r in self._heap
+                 if r.priority == head.priority and r.model_path == head.model_path
+                 and _shared_prefix(r.prompt, head.prompt)),
+                key=lambda r: (-_shared_prefix(r.prompt, head.prompt), r),
+            )[:self.max_batch - 1]
+            for request in companions:
+                self._heap.remove(request)
+                if request.key is not None:
+                    self._by_key.pop(request.key, None)
+            if companions:
+                heapq.heapify(self._heap)
+            return [head] + companions
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._next_batch()
+            live = [r for r in batch if not self._expire(r)]
+            if not live:
+                continue
+            try:
+                remaining = max(0.0, max(r.deadline for r in live) - time.monotonic())
+                with self.pool.acquire(live[0].model_path, timeout=remaining, prompt=live[0].prompt) as model:
+                    for index, request in enumerate(live):
+                        if index and self._requeue_if_preempted(live[index:]):
+                            break
+                        if self._expire(request):
+                            continue
+                        self._execute(request, model)
+            except BaseException as exc:  # acquisition failed: every request still pending gets the error
+                for request in live:
+                    self._resolve(request, exception=exc)
+
+    def _requeue_if_preempted(self, rest: List[_Request]) -> bool:
+        """Put the rest of a batch back in the queue when a more urgent request is waiting."""
+        with self._condition:
+            if not self._heap or self._heap[0].priority >= rest[0].priority:
+                return False
+            for request in rest:
+                heapq.heappush(self._heap, request)
+                if request.key is not None:
+                    self._by_key.setdefault(request.key, request)
+            self._condition.notify_all()
+            return True
+
+    def _expire(self, request: _Request) -> bool:
+        if time.monotonic() <= request.deadline:
+            return False
+        with self._condition:
+            self.expired += 1
+        self._resolve(request, exception=DeadlineExceeded(
+            "Délai dépassé avant qu'une réplique du modèle local soit disponible, réessayez plus tard."
+        ))
+        return True
+
+    def _execute(self, request: _Request, model: Any) -> None:
+        try:
+            result = request.work(model)
+        except Exception as exc:
+            self._resolve(request, exception=exc)
+            return
+        with self._condition:
+            self.completed += 1
+        self._resolve(request, result=result)
+
+    @staticmethod
+    def _resolve(request: _Request, result: Any = None, exception: Optional[BaseException] = None) -> None:
+        for future in request.futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+
+def _in_context(work: Callable[[Any], Any], context: contextvars.Context) -> Callable[[Any], Any]:
+    """`work` run in the submitter's context (its metrics trace), recording how long it waited."""
+    enqueued = time.perf_counter()
+
+    def run(model: Any) -> Any:
+        observe('queue_wait', time.perf_counter() - enqueued, 'local')
+        return work(model)
+
+    return lambda model: context.run(run, model)
+
+
+_SCHEDULER_LOCK = threading.Lock()
+_SCHEDULER: Optional[InferenceScheduler] = None
+
+
+def get_scheduler() -> InferenceScheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = InferenceScheduler.from_env()
+        return _SCHEDULER
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, List, Optional
+
+# Incremental extraction of JSON values from model output.
+#
+# JsonStreamExtractor is fed the completion chunk by chunk (or all at once) and tracks
+# bracket depth and string state, so it knows the moment a top-level object or array
+# closes, without re-parsing. Each complete value is parsed leniently (see repair_json)
+# and offered to `accept`; the first accepted value ends the extraction, so callers can
+# stop the generation right there instead of waiting for the end of the completion.
+#
+# No Django import: usable from any service.
+
+_STRUCTURAL = '{[,:'
+_PYTHON_LITERALS = (('True', 'true'), ('False', 'false'), ('None', 'null'))
+_STRING_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+
+def repair_json(text: str) -> str:
+    """
+    Fix the defects models commonly produce, in one pass: single-quoted strings,
+    raw newlines/tabs inside strings, trailing commas, Python literals (True/False/None).
+    """
+    out: List[str] = []
+    quote: Optional[str] = None
+    escape = False
+    previous = ''  # last significant character outside strings
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if escape:
+                escape = False
+                # \' is not a valid JSON escape
+                out.append("'" if ch == "'" else '\\' + ch)
+            elif ch == '\\':
+                escape = True
+            elif ch == quote:
+                quote = None
+                out.append('"')
+                previous = '"'
+            elif ch == '"':
+                out.append('\\"')
+            else:
+                out.append(_STRING_ESCAPES.get(ch, ch))
+            i += 1
+            continue
+
+        if ch == '"' or (ch == "'" and previous in _STRUCTURAL):
+            quote = ch
+            out.append('"')
+        elif ch in '}]':
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            out.append(ch)
+            previous = ch
+        else:
+            literal = next(((word, fixed) for word, fixed in _PYTHON_LITERALS if text.startswith(word, i)), None)
+            if literal and previous in _STRUCTURAL:
+                out.append(literal[1])
+                previous = literal[1][-1]
+                i += len(literal[0])
+                continue
+            out.append(ch)
+            if not ch.isspace():
+                previous = ch
+        i += 1
+    return ''.join(out)
+
+
+def loads_lenient(text: str) -> Any:
+    """`json.loads`, retried on the repaired text. Raises ValueError when both fail."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(repair_json(text))
+
+
+class JsonStreamExtractor:
+    """
+    `feed(chunk)` returns True once a complete top-level JSON value accepted by
+    `accept(value)` has been seen; it is then available as `value`. Text outside JSON
+    values and values that fail to parse or are rejected are skipped.
+    """
+
+    def __init__(self, accept: Optional[Callable[[Any], bool]] = None):
+        self.accept = accept or (lambda value: True)
+        self.value: Any = None
+        self.done = False
+        self.rejected = 0  # complete values that parsed but were not accepted
+        self._chunks: List[str] = []
+        self._current: List[str] = []
+        self._depth = 0
+        self._quote: Optional[str] = None
+        self._escape = False
+        self._previous = ''
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self._chunks.append(chunk)
+        for ch in chunk:
+            if self._depth == 0:
+                if ch in '{[':
+                    self._current = [ch]
+                    self._depth = 1
+                    self._previous = ch
+                continue
+            self._current.append(ch)
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+                    self._previous = '"'
+                continue
+            if ch == '"' or (ch == "'" and self._previous in _STRUCTURAL):
+                self._quote = ch
+                continue
+            if ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0 and self._complete(''.join(self._current)):
+                    return True
+            if not ch.isspace():
+                self._previous = ch
+        return False
+
+    def _complete(self, text: str) -> bool:
+        try:
+            value = loads_lenient(text)
+        except ValueError:
+            return False
+        if not self.accept(value):
+            self.rejected += 1
+            return False
+        self.value = value
+        self.done = True
+        return True
+
+    def raw_text(self) -> str:
+        return ''.join(self._chunks)
+
+    def text(self) -> str:
+        """The accepted value as compact JSON, or the raw text fed so far when none was accepted."""
+        if self.done:
+            return json.dumps(self.value, ensure_ascii=False)
+        return self.raw_text()
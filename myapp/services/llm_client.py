@@ -1,31 +1,308 @@
+import itertools
+import json
 import os
+import threading
+import time
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
 import requests
-from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+
+from .constrained import CONSTRAINED_DECODING
+from .generation_cache import Uncacheable, get_generation_cache
+from .json_stream import JsonStreamExtractor
+from .metrics import GenerationTimer, count
 
 # Allow overriding the Ollama endpoint via environment variable
 # Example: OLLAMA_URL=http://remote-host:11434/api/generate
 DEFAULT_OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434/api/generate')
 
+# Several Ollama hosts can share the load (comma separated), e.g.
+# OLLAMA_URLS=http://gpu-1:11434/api/generate,http://gpu-2:11434/api/generate
+# OLLAMA_ROUTING=round_robin | least_outstanding
+OLLAMA_URLS = [u.strip() for u in os.getenv('OLLAMA_URLS', '').split(',') if u.strip()] or [DEFAULT_OLLAMA_URL]
+OLLAMA_ROUTING = os.getenv('OLLAMA_ROUTING', 'round_robin')
 
-def generate_with_model(prompt: str, model_name: str = 'mistral', params: Dict[str, Any] | None = None) -> str:
-    params = params or {}
-    if model_name.startswith('ollama:'):
-        model = model_name.split(':', 1)[1]
-    else:
-        model = model_name
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '3.05'))
+OLLAMA_READ_TIMEOUT = float(os.getenv('OLLAMA_READ_TIMEOUT', '120'))
+OLLAMA_MAX_RETRIES = int(os.getenv('OLLAMA_MAX_RETRIES', '2'))
+OLLAMA_RETRY_BACKOFF = float(os.getenv('OLLAMA_RETRY_BACKOFF', '0.5'))
+OLLAMA_POOL_SIZE = int(os.getenv('OLLAMA_POOL_SIZE', '16'))
 
-    payload = {
-        'model': model,
-        'prompt': prompt,
-        'stream': False,
-    }
-    payload.update(params)
 
-    try:
-        resp = requests.post(DEFAULT_OLLAMA_URL, json=payload, timeout=120)
-        resp.raise_for_status()
-        data = resp.json()
+class OllamaClient:
+    """
+    Client HTTP réutilisable pour Ollama.
+
+    - une `requests.Session` partagée garde les connexions keep-alive ouvertes (pool par hôte);
+    - timeouts de connexion et de lecture distincts;
+    - seules les erreurs de connexion sont rejouées (avec backoff exponentiel, sur un autre hôte
+      si possible): une requête qui a atteint le modèle n'est jamais renvoyée;
+    - plusieurs endpoints, routés en `round_robin` ou `least_outstanding`.
+    """
+
+    ROUTING_STRATEGIES = ('round_robin', 'least_outstanding')
+
+    def __init__(
+        self,
+        endpoints: List[str],
+        routing: str = 'round_robin',
+        connect_timeout: float = 3.05,
+        read_timeout: float = 120.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+        pool_size: int = 16,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("Au moins un endpoint Ollama est requis.")
+        if routing not in self.ROUTING_STRATEGIES:
+            raise ValueError(f"Stratégie de routage inconnue: {routing}")
+        self.endpoints = list(endpoints)
+        self.routing = routing
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=len(self.endpoints),
+            pool_maxsize=pool_size,
+            max_retries=0,  # retries are handled below, on connection errors only
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(self.endpoints)
+        self._outstanding: Dict[str, int] = {url: 0 for url in self.endpoints}
+
+    @classmethod
+    def from_env(cls, endpoints: Optional[List[str]] = None) -> 'OllamaClient':
+        """Client configured from the OLLAMA_* variables; `endpoints` replaces OLLAMA_URLS."""
+        return cls(
+            endpoints or OLLAMA_URLS,
+            routing=OLLAMA_ROUTING,
+            connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+            read_timeout=OLLAMA_READ_TIMEOUT,
+            max_retries=OLLAMA_MAX_RETRIES,
+            retry_backoff=OLLAMA_RETRY_BACKOFF,
+            pool_size=OLLAMA_POOL_SIZE,
+        )
+
+    def _pick_endpoint(self, avoid: Optional[str] = None) -> str:
+        with self._lock:
+            candidates = [u for u in self.endpoints if u != avoid] or self.endpoints
+            if self.routing == 'least_outstanding':
+                url = min(candidates, key=lambda u: self._outstanding[u])
+            else:
+                url = next(self._cycle)
+                while url not in candidates:
+                    url = next(self._cycle)
+            self._outstanding[url] += 1
+            return url
+
+    def _release_endpoint(self, url: str) -> None:
+        with self._lock:
+            self._outstanding[url] -= 1
+
+    def _send(self, payload: Dict[str, Any], **kwargs) -> tuple[str, requests.Response]:
+        """
+        POST `payload` to one endpoint, failing over to another one on connection errors.
+        The chosen endpoint stays counted as outstanding until `_release_endpoint` is called.
+        """
+        last_url = None
+        attempt = 0
+        while True:
+            url = self._pick_endpoint(avoid=last_url)
+            try:
+                resp = self.session.post(url, json=payload, timeout=self.timeout, **kwargs)
+                resp.raise_for_status()
+                return url, resp
+            except requests.exceptions.ConnectionError:
+                self._release_endpoint(url)
+                if attempt >= self.max_retries:
+                    raise
+                count('retries', backend='ollama')
+                time.sleep(self.retry_backoff * (2 ** attempt))
+                attempt += 1
+                last_url = url
+            except BaseException:
+                self._release_endpoint(url)
+                raise
+
+    def post(self, payload: Dict[str, Any], **kwargs) -> requests.Response:
+        url, resp = self._send(payload, **kwargs)
+        self._release_endpoint(url)
+        return resp
+
+    def generate(self, model: str, prompt: str, params: Dict[str, Any] | None = None) -> str:
+        payload = {
+            'model': model,
+            'prompt': prompt,
+            'stream': False,
+        }
+        payload.update(params or {})
+        timer = GenerationTimer('ollama')
+        data = self.post(payload).json()
+        # Ollama reports its own token counts and durations (nanoseconds)
+        timer.finish(
+            completion_tokens=data.get('eval_count'),
+            prompt_tokens=data.get('prompt_eval_count'),
+            prompt_seconds=_seconds(data.get('prompt_eval_duration')),
+            generation_seconds=_seconds(data.get('eval_duration')),
+        )
         # Ollama returns {"response": "..."}
         return data.get('response', '')
+
+    def stream(self, model: str, prompt: str, params: Dict[str, Any] | None = None) -> Iterator[str]:
+        """
+        Yield the completion chunk by chunk (Ollama streams one JSON object per line).
+        Closing the generator early closes the connection, which stops the generation server-side.
+        """
+        payload = {
+            'model': model,
+            'prompt': prompt,
+            'stream': True,
+        }
+        payload.update(params or {})
+        timer = GenerationTimer('ollama')
+        url, resp = self._send(payload, stream=True)
+        final: Dict[str, Any] = {}
+        try:
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get('error'):
+                    raise RuntimeError(data['error'])
+                chunk = data.get('response', '')
+                if chunk:
+                    timer.token()
+                    yield chunk
+                if data.get('done'):
+                    final = data
+                    break
+        finally:
+            resp.close()
+            self._release_endpoint(url)
+            timer.finish(completion_tokens=final.get('eval_count'), prompt_tokens=final.get('prompt_eval_count'))
+
+
+def _seconds(nanoseconds: Optional[int]) -> Optional[float]:
+    return nanoseconds / 1e9 if nanoseconds else None
+
+
+_CLIENT_LOCK = threading.Lock()
+_CLIENT: Optional[OllamaClient] = None
+
+
+def get_ollama_client() -> OllamaClient:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = OllamaClient.from_env()
+        return _CLIENT
+
+
+def _ollama_model(model_name: str) -> str:
+    if model_name.startswith('ollama:'):
+        return model_name.split(':', 1)[1]
+    return model_name
+
+
+def _with_schema(params: Dict[str, Any], schema: Dict[str, Any] | None) -> Dict[str, Any]:
+    """Ask Ollama to constrain sampling to `schema` (JSON schema) when constrained decoding is on."""
+    if schema is None or not CONSTRAINED_DECODING:
+        return params
+    return {**params, 'format': schema}
+
+
+def generate_with_model(
+    prompt: str,
+    model_name: str = 'mistral',
+    params: Dict[str, Any] | None = None,
+    use_cache: bool = True,
+    client: Optional[OllamaClient] = None,
+) -> str:
+    params = params or {}
+    model = _ollama_model(model_name)
+    cache = get_generation_cache() if use_cache else None
+    client = client or get_ollama_client()
+
+    try:
+        if cache is None:
+            return client.generate(model, prompt, params)
+        key = cache.make_key(prompt, f'ollama:{model}', params)
+        return cache.get_or_generate(key, lambda: client.generate(model, prompt, params))
+    except Exception as exc:
+        raise RuntimeError(f"Appel au modèle échoué: {exc}")
+
+
+def generate_json_with_model(
+    prompt: str,
+    model_name: str = 'mistral',
+    params: Dict[str, Any] | None = None,
+    use_cache: bool = True,
+    accept: Optional[Callable[[Any], bool]] = None,
+    schema: Dict[str, Any] | None = None,
+    client: Optional[OllamaClient] = None,
+) -> str:
+    """
+    Variante de `generate_with_model` pour les réponses JSON: la complétion est lue en
+    streaming et interrompue dès qu'une valeur JSON complète acceptée par `accept` est
+    sortie (voir json_stream.py). Renvoie ce JSON, ou le texte brut si aucune valeur
+    n'a été acceptée (texte brut qui n'est alors pas mis en cache).
+    `schema` (JSON schema) contraint le décodage côté Ollama si CONSTRAINED_DECODING est actif.
+    `client` remplace le client partagé (hôtes Ollama d'un fournisseur, voir providers.py).
+    """
+    params = _with_schema(params or {}, schema)
+    model = _ollama_model(model_name)
+    cache = get_generation_cache() if use_cache else None
+    client = client or get_ollama_client()
+
+    def run(cached: bool = False) -> str:
+        extractor = JsonStreamExtractor(accept)
+        stream = client.stream(model, prompt, params)
+        try:
+            for chunk in stream:
+                if extractor.feed(chunk):
+                    break
+        finally:
+            # Closing the connection makes Ollama stop generating
+            stream.close()
+        if cached and not extractor.done:
+            # No accepted value: the raw text goes back to the caller but is never served again
+            raise Uncacheable(extractor.text())
+        return extractor.text()
+
+    try:
+        if cache is None:
+            return run()
+        key = cache.make_key(prompt, f'ollama:{model}', {**params, 'extract': 'json'})
+        return cache.get_or_generate(key, lambda: run(cached=True))
+    except Exception as exc:
+        raise RuntimeError(f"Appel au modèle échoué: {exc}")
+
+
+def stream_with_model(
+    prompt: str,
+    model_name: str = 'mistral',
+    params: Dict[str, Any] | None = None,
+    use_cache: bool = True,
+    schema: Dict[str, Any] | None = None,
+    client: Optional[OllamaClient] = None,
+) -> Iterator[str]:
+    """Variante streaming de `generate_with_model`: produit le texte au fil des tokens."""
+    params = _with_schema(params or {}, schema)
+    model = _ollama_model(model_name)
+    cache = get_generation_cache() if use_cache else None
+    client = client or get_ollama_client()
+
+    try:
+        if cache is None:
+            yield from client.stream(model, prompt, params)
+            return
+        key = cache.make_key(prompt, f'ollama:{model}', params)
+        yield from cache.stream_through(key, lambda: client.stream(model, prompt, params))
     except Exception as exc:
-        raise RuntimeError(f"Appel au modèle échoué: {exc}") 
\ No newline at end of file
+        raise RuntimeError(f"Appel au modèle échoué: {exc}")
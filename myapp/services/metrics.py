@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Instrumentation of the generation pipeline.
+#
+# - stage(name) / observe(name, seconds): duration of a step (queue_wait, prompt_eval,
+#   generation, parse, dedup, db_write);
+# - GenerationTimer: one model call, split at the first token into prompt_eval and
+#   generation, with prompt/completion token counts and tokens per second;
+# - count(name): events (cache_hits, cache_misses, retries, regenerations, fallbacks).
+#
+# Everything is aggregated in a process-wide registry rendered in the Prometheus text
+# format (render_prometheus, served by the /metrics view; each worker process exposes its
+# own numbers). During trace(...) (or between start_trace/finish_trace, see the
+# GenerationMetricsMiddleware) the same measures are also collected per request, for the
+# Server-Timing header and one JSON log line on the `myapp.metrics` logger.
+#
+# Models run on scheduler threads: the scheduler runs their work in the submitting
+# request's context, so it lands in the right trace. No Django import.
+
+METRICS_ENABLED = os.getenv('GENERATION_METRICS', '1').lower() not in ('0', 'false', 'no')
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_HELP = {
+    'generation_stage_seconds': 'Duration of the generation pipeline stages.',
+    'generation_tokens_per_second': 'Completion tokens per second of generation.',
+    'generation_request_seconds': 'Duration of traced requests and tasks.',
+    'generation_requests_total': 'Traced requests and tasks.',
+    'generation_prompt_tokens_total': 'Prompt tokens sent to the models.',
+    'generation_completion_tokens_total': 'Completion tokens produced by the models.',
+    'generation_cache_hits_total': 'Generation cache hits.',
+    'generation_cache_misses_total': 'Generation cache misses.',
+    'generation_retries_total': 'Model calls retried after a connection error.',
+    'generation_regenerations_total': 'Extra generations for invalid or duplicate outputs.',
+    'generation_fallbacks_total': 'Calls served by a fallback provider, or by another one than the preferred one.',
+}
+
+logger = logging.getLogger('myapp.metrics')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class Registry:
+    """Counters and histograms with labels, rendered in the Prometheus text format (0.0.4)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()),
+                key=lambda item: item[0],
+            )
+        lines: List[str] = []
+        described = set()
+
+        def describe(name: str, kind: str) -> None:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = Registry()
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
+
+
+class GenerationTrace:
+    """Measures collected for one request or task."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def server_timing(self) -> str:
+        """`Server-Timing` header value: summed duration of each stage, then the total."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed * 1000:.1f}")
+        return ', '.join(parts)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            'duration_ms': round(self.elapsed * 1000, 1),
+            'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+        }
+        data.update({name: int(value) if float(value).is_integer() else value for name, value in self.counters.items()})
+        completion = self.counters.get('completion_tokens')
+        generation = self.stages.get('generation')
+        if completion and generation:
+            data['tokens_per_second'] = round(completion / generation, 1)
+        return data
+
+
+_CURRENT: contextvars.ContextVar[Optional[GenerationTrace]] = contextvars.ContextVar('generation_trace', default=None)
+
+
+def current_trace() -> Optional[GenerationTrace]:
+    return _CURRENT.get()
+
+
+def start_trace(name: str) -> GenerationTrace:
+    trace = GenerationTrace(name)
+    trace._token = _CURRENT.set(trace)
+    return trace
+
+
+def finish_trace(trace: GenerationTrace, status: Any = 'ok', **fields: Any) -> None:
+    """Stop collecting for `trace`, count it and log it as one JSON line."""
+    if trace._token is not None:
+        try:
+            _CURRENT.reset(trace._token)
+        except ValueError:  # finished from another context (end of a streamed response)
+            _CURRENT.set(None)
+        trace._token = None
+    if not METRICS_ENABLED:
+        return
+    elapsed = trace.elapsed
+    REGISTRY.inc('generation_requests_total', endpoint=trace.name, status=str(status))
+    REGISTRY.observe('generation_request_seconds', elapsed, endpoint=trace.name)
+    logger.info(json.dumps(
+        {'event': 'generation', 'endpoint': trace.name, 'status': status, **fields, **trace.as_dict()},
+        ensure_ascii=False,
+    ))
+
+
+@contextmanager
+def trace(name: str, **fields: Any) -> Iterator[GenerationTrace]:
+    """Collect the measures of the block, logged when it ends (status "error" if it raised)."""
+    current = start_trace(name)
+    status = 'ok'
+    try:
+        yield current
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        finish_trace(current, status, **fields)
+
+
+def observe(name: str, seconds: float, backend: str = '') -> None:
+    if not METRICS_ENABLED:
+        return
+    REGISTRY.observe('generation_stage_seconds', seconds, stage=name, backend=backend)
+    current = _CURRENT.get()
+    if current is not None:
+        current.add_stage(name, seconds)
+
+
+def count(name: str, value: float = 1, backend: str = '') -> None:
+    if not METRICS_ENABLED or not value:
+        return
+    REGISTRY.inc(f'generation_{name}_total', value, backend=backend)
+    current = _CURRENT.get()
+    if current is not None:
+        current.add(name, value)
+
+
+@contextmanager
+def stage(name: str, backend: str = '') -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, backend)
+
+
+class GenerationTimer:
+    """
+    One model call: `token()` for each chunk received, then `finish()`. Prompt evaluation
+    is the time to the first token, generation the time after it; without chunks (blocking
+    call) the whole call counts as generation unless the backend reports its own durations.
+    """
+
+    def __init__(self, backend: str, prompt_tokens: Optional[int] = None) -> None:
+        self.backend = backend
+        self.prompt_tokens = prompt_tokens
+        self.tokens = 0
+        self.started = time.perf_counter()
+        self.first: Optional[float] = None
+        self.done = False
+
+    def token(self, n: int = 1) -> None:
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.tokens += n
+
+    def finish(
+        self,
+        completion_tokens: Optional[int] = None,
+        prompt_tokens: Optional[int] = None,
+        prompt_seconds: Optional[float] = None,
+        generation_seconds: Optional[float] = None,
+    ) -> None:
+        if self.done:
+            return
+        self.done = True
+        ended = time.perf_counter()
+        if generation_seconds is None:
+            if self.first is None:
+                generation_seconds = ended - self.started
+            else:
+                prompt_seconds = self.first - self.started
+                generation_seconds = ended - self.first
+        if prompt_seconds is not None:
+            observe('prompt_eval', prompt_seconds, self.backend)
+        observe('generation', generation_seconds, self.backend)
+
+        completion_tokens = self.tokens if completion_tokens is None else completion_tokens
+        count('prompt_tokens', prompt_tokens if prompt_tokens is not None else self.prompt_tokens or 0, self.backend)
+        count('completion_tokens', completion_tokens, self.backend)
+        if METRICS_ENABLED and completion_tokens and generation_seconds > 0:
+            REGISTRY.observe('generation_tokens_per_second', completion_tokens / generation_seconds,
+                             RATE_BUCKETS, backend=self.backend)
+
+
+def timed_chunks(chunks: Iterator[str], timer: GenerationTimer) -> Iterator[str]:
+    """Pass `chunks` through, one token each, finishing `timer` when they end or the consumer stops."""
+    try:
+        for chunk in chunks:
+            timer.token()
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()  # stops the model when the consumer stopped early
+        timer.finish()
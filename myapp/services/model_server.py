@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .constrained import grammar_from_spec
+from .ctransformers_client import (
+    PRIORITY_BATCH, ModelPoolBusy, generate_in_process, get_model_pool, stream_in_process,
+)
+
+# Local inference server: one process holds the GGUF models (memory-mapped by ctransformers,
+# so the replicas of a model share the same pages) and the Django, Celery and FastAPI
+# workers call it over HTTP (CTRANSFORMERS_SERVER_URL, see ModelServerClient).
+#
+#   python -m myapp.services.model_server --port 8765 --model ./models/llama-2-7b-chat.Q4_K_M.gguf
+#
+# GET  /healthz  process alive
+# GET  /readyz   200 once the default model is loaded, 503 before (or if loading failed)
+# GET  /stats    model pool and scheduler counters
+# POST /generate {"prompt", "model"?, "max_new_tokens"?, "temperature"?, "top_p"?,
+#                 "constraint"?, "priority"?, "timeout"?, "key"?, "stream"?}
+#      -> {"text"}, or NDJSON lines {"text"} ... {"done": true} with "stream": true
+#
+# Requests go through the same scheduler and pool as in-process generation (priorities,
+# deadlines, queue limits). No Django import: the server runs on its own.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv('CTRANSFORMERS_MODEL', './models/llama-2-7b-chat.Q4_K_M.gguf')
+
+
+class ModelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], default_model: str | Path = DEFAULT_MODEL) -> None:
+        super().__init__(address, ModelRequestHandler)
+        self.default_model = Path(default_model).expanduser().resolve()
+        self.models_dir = self.default_model.parent
+        self.ready = False
+        self.load_error: Optional[str] = None
+
+    def warm_up(self) -> None:
+        """Load one replica of the default model; /readyz answers 200 afterwards."""
+        try:
+            with get_model_pool().acquire(self.default_model):
+                pass
+        except Exception as exc:
+            self.load_error = str(exc)
+            logger.error("Chargement du modèle impossible: %s", exc)
+            return
+        self.ready = True
+        logger.info("Modèle prêt: %s", self.default_model)
+
+    def resolve_model(self, name: Optional[str]) -> Path:
+        """Models are looked up by file name, next to the default model only."""
+        if not name:
+            return self.default_model
+        if Path(name).name != name or name in ('.', '..'):
+            raise ValueError("Nom de modèle invalide.")
+        return self.models_dir / name
+
+
+class ModelRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: ModelServer
+
+    def do_GET(self) -> None:
+        if self.path == '/healthz':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/readyz':
+            if self.server.ready:
+                self._send_json(200, {'status': 'ready', 'model': self.server.default_model.name})
+            else:
+                self._send_json(503, {'status': 'error' if self.server.load_error else 'loading',
+                                      'error': self.server.load_error})
+        elif self.path == '/stats':
+            from .inference_scheduler import get_scheduler
+
+            self._send_json(200, {'pool': get_model_pool().stats(), 'scheduler': get_scheduler().stats()})
+        else:
+            self._send_json(404, {'error': 'Route inconnue.'})
+
+    def do_POST(self) -> None:
+        if self.path != '/generate':
+            self._send_json(404, {'error': 'Route inconnue.'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            prompt = body['prompt']
+            if not isinstance(prompt, str) or not prompt:
+                raise ValueError("'prompt' doit être une chaîne non vide.")
+            kwargs = self._generation_kwargs(body)
+        except (KeyError, TypeError, ValueError) as exc:
+            self._send_json(400, {'error': f"Requête invalide: {exc}"})
+            return
+
+        if body.get('stream'):
+            self._stream(prompt, kwargs)
+            return
+        try:
+            text = generate_in_process(prompt, key=body.get('key'), **kwargs)
+        except Exception as exc:
+            self._send_error(exc)
+            return
+        self._send_json(200, {'text': text})
+
+    def _generation_kwargs(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            'model_path': self.server.resolve_model(body.get('model')),
+            'priority': int(body.get('priority', PRIORITY_BATCH)),
+        }
+        for name, cast in (('max_new_tokens', int), ('temperature', float), ('top_p', float), ('timeout', float)):
+            if body.get(name) is not None:
+                kwargs[name] = cast(body[name])
+        if body.get('constraint'):
+            kwargs['constraint'] = grammar_from_spec(body['constraint'])
+        return kwargs
+
+    def _stream(self, prompt: str, kwargs: Dict[str, Any]) -> None:
+        stream = stream_in_process(prompt, **kwargs)
+        try:
+            # The first chunk surfaces queueing errors (busy pool, deadline, missing model) as a status code
+            first = next(stream, None)
+        except Exception as exc:
+            self._send_error(exc)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            if first is not None:
+                self._write_chunk({'text': first})
+                for chunk in stream:
+                    self._write_chunk({'text': chunk})
+            self._write_chunk({'done': True})
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # Client gone: closing the generator below stops the generation and frees the replica
+            self.close_connection = True
+        except Exception as exc:
+            self._write_chunk({'error': str(exc)})
+            self.wfile.write(b'0\r\n\r\n')
+        finally:
+            stream.close()
+
+    def _write_chunk(self, data: Dict[str, Any]) -> None:
+        line = (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+    def _send_error(self, exc: Exception) -> None:
+        if isinstance(exc, ModelPoolBusy):
+            self._send_json(503, {'error': str(exc)}, headers={'Retry-After': '1'})
+        elif isinstance(exc, FileNotFoundError):
+            self._send_json(404, {'error': str(exc)})
+        else:
+            logger.exception("Échec de génération")
+            self._send_json(500, {'error': str(exc)})
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serveur d'inférence local (modèles GGUF via ctransformers)")
+    parser.add_argument('--host', default=os.getenv('CTRANSFORMERS_SERVER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('CTRANSFORMERS_SERVER_PORT', '8765')))
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='Modèle par défaut, chargé au démarrage')
+    parser.add_argument('--no-warm-up', action='store_true', help='Charger le modèle à la première requête')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    server = ModelServer((args.host, args.port), args.model)
+    if args.no_warm_up:
+        server.ready = True
+    else:
+        threading.Thread(target=server.warm_up, name='model-warm-up', daemon=True).start()
+    logger.info("Serveur de modèles sur http://%s:%s", args.host, server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import abc
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .constrained import CONSTRAINED_DECODING, JsonSchemaGrammar
+from .ctransformers_client import (
+    PRIORITY_BATCH, ModelPoolBusy, generate_json_locally, generate_locally, get_model_pool,
+    get_model_server_client, stream_locally,
+)
+from .llm_client import OllamaClient, generate_json_with_model, generate_with_model, stream_with_model
+from .metrics import count
+
+# Model providers behind one interface: generate / stream, and their async variants
+# agenerate / astream. They are configured by settings.LLM_PROVIDERS (DEFAULT_PROVIDERS
+# outside Django), for example:
+#   {'name': 'ollama', 'backend': 'ollama', 'model': 'mistral', 'max_concurrency': 8}
+#   {'name': 'gpu-2', 'backend': 'ollama', 'model': 'mistral', 'urls': ['http://gpu-2:11434/api/generate']}
+#   {'name': 'local', 'backend': 'ctransformers', 'model': './models/llama-2-7b-chat.Q4_K_M.gguf',
+#    'params': {'max_new_tokens': 1024}, 'fallback': True}
+#
+# ProviderRegistry sends each call to the healthy provider with the lowest latency (EWMA of
+# its recent calls) that has a free slot (at most `max_concurrency` calls at once), and
+# moves on to the next one when a call fails. `fallback` providers (the local model by
+# default) only take the calls the others cannot: all saturated or down. A provider whose
+# calls fail LLM_PROVIDER_MAX_FAILURES times in a row is skipped for LLM_PROVIDER_COOLDOWN
+# seconds. No Django import at module level (also used by the FastAPI service).
+
+LATENCY_ALPHA = float(os.getenv('LLM_PROVIDER_LATENCY_ALPHA', '0.3'))
+MAX_FAILURES = int(os.getenv('LLM_PROVIDER_MAX_FAILURES', '2'))
+COOLDOWN = float(os.getenv('LLM_PROVIDER_COOLDOWN', '30'))
+# Seconds a call waits for a slot when every provider is saturated
+QUEUE_TIMEOUT = float(os.getenv('LLM_PROVIDER_QUEUE_TIMEOUT', '30'))
+
+DEFAULT_PROVIDERS: List[Dict[str, Any]] = [
+    {
+        'name': 'ollama',
+        'backend': 'ollama',
+        'model': os.getenv('OLLAMA_MODEL', 'mistral'),
+        'max_concurrency': int(os.getenv('LLM_OLLAMA_CONCURRENCY', '8')),
+    },
+    {
+        'name': 'local',
+        'backend': 'ctransformers',
+        'model': os.getenv('CTRANSFORMERS_MODEL', './models/llama-2-7b-chat.Q4_K_M.gguf'),
+        'max_concurrency': int(os.getenv('LLM_LOCAL_CONCURRENCY', '2')),
+        'params': {'max_new_tokens': 1024},
+        'fallback': True,
+    },
+]
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class ProviderBusy(RuntimeError):
+    """Aucun fournisseur de modèle n'a pu prendre la requête dans le délai imparti."""
+
+
+async def _aiterate(stream: Iterator[str]) -> AsyncIterator[str]:
+    """Chunks of a blocking generator, each one read on the loop's default executor."""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, next, stream, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        await loop.run_in_executor(None, stream.close)
+
+
+class _AsyncCalls:
+    """`agenerate` / `astream`: `generate` / `stream` run off the event loop."""
+
+    generate: Callable[..., str]
+    stream: Callable[..., Iterator[str]]
+
+    async def agenerate(self, prompt: str, **kwargs: Any) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.generate, prompt, **kwargs))
+
+    async def astream(self, prompt: str, **kwargs: Any) -> AsyncIterator[str]:
+        async for chunk in _aiterate(self.stream(prompt, **kwargs)):
+            yield chunk
+
+
+class Provider(_AsyncCalls, abc.ABC):
+    """
+    Fournisseur de modèle. `generate` renvoie le texte complet, ou la première valeur JSON
+    acceptée par `accept` (`schema` contraint alors le décodage si CONSTRAINED_DECODING est
+    actif); `stream` produit le texte au fil des tokens. Au plus `max_concurrency` appels
+    simultanés: au-delà, un appel attend une place `wait` secondes (QUEUE_TIMEOUT par
+    défaut), puis ProviderBusy. `params` sont les paramètres d'échantillonnage par défaut,
+    complétés ou remplacés par ceux de chaque appel. Latence et échecs sont suivis pour le
+    routage (ProviderRegistry).
+    """
+
+    backend = ''
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        params: Optional[Dict[str, Any]] = None,
+        max_concurrency: int = 1,
+        fallback: bool = False,
+    ) -> None:
+        self.name = name
+        self.model = model
+        self.params = dict(params or {})
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.fallback = fallback
+        self.latency: Optional[float] = None  # EWMA of call durations, seconds
+        self.in_flight = 0
+        self.failures = 0  # consecutive
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+
+    # -- backend calls, implemented by subclasses
+
+    @abc.abstractmethod
+    def _generate(
+        self, prompt: str, params: Dict[str, Any], use_cache: bool,
+        schema: Optional[Dict[str, Any]], accept: Optional[Callable[[Any], bool]], priority: int,
+    ) -> str:
+        """The completion of `prompt`; with `accept`, the text of its first accepted JSON value."""
+
+    @abc.abstractmethod
+    def _stream(
+        self, prompt: str, params: Dict[str, Any], use_cache: bool, schema: Optional[Dict[str, Any]], priority: int,
+    ) -> Iterator[str]:
+        """The completion of `prompt`, chunk by chunk; closing the iterator stops the generation."""
+
+    def load(self) -> None:
+        """Load the model now rather than at the first call (nothing to do for remote backends)."""
+
+    # -- slots and health
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def acquire(self, timeout: float) -> bool:
+        if not self._slots.acquire(timeout=max(0.0, timeout)):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _succeeded(self, seconds: float) -> None:
+        with self._lock:
+            self.latency = seconds if self.latency is None else (
+                LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency
+            )
+            self.failures = 0
+            self.down_until = 0.0
+
+    def _failed(self, exc: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(exc)
+            if self.failures < MAX_FAILURES:
+                return
+            self.down_until = time.monotonic() + COOLDOWN
+        logger.warning("Fournisseur %s écarté pour %.0f s: %s", self.name, COOLDOWN, exc)
+
+    # -- calls with a slot held
+
+    def _call(self, prompt: str, use_cache: bool, schema, accept, priority: int, params: Dict[str, Any]) -> str:
+        started = time.perf_counter()
+        try:
+            text = self._generate(prompt, {**self.params, **params}, use_cache, schema, accept, priority)
+        except ModelPoolBusy:
+            raise  # saturated, not failing
+        except Exception as exc:
+            self._failed(exc)
+            raise
+        self._succeeded(time.perf_counter() - started)
+        return text
+
+    def _call_stream(self, prompt: str, use_cache: bool, schema, priority: int, params: Dict[str, Any]) -> Iterator[str]:
+        started = time.perf_counter()
+        stream = self._stream(prompt, {**self.params, **params}, use_cache, schema, priority)
+        try:
+            for chunk in stream:
+                yield chunk
+        except ModelPoolBusy:
+            raise
+        except Exception as exc:
+            self._failed(exc)
+            raise
+        except GeneratorExit:
+            # The consumer stopped reading: it got what it needed
+            self._succeeded(time.perf_counter() - started)
+            raise
+        else:
+            self._succeeded(time.perf_counter() - started)
+        finally:
+            stream.close()
+
+    # -- public interface
+
+    def generate(
+        self,
+        prompt: str,
+        use_cache: bool = True,
+        schema: Optional[Dict[str, Any]] = None,
+        accept: Optional[Callable[[Any], bool]] = None,
+        priority: int = PRIORITY_BATCH,
+        wait: Optional[float] = None,
+        **params: Any,
+    ) -> str:
+        if not self.acquire(QUEUE_TIMEOUT if wait is None else wait):
+            raise ProviderBusy(f"Fournisseur de modèle {self.name} saturé, réessayez plus tard.")
+        try:
+            return self._call(prompt, use_cache, schema, accept, priority, params)
+        finally:
+            self.release()
+
+    def stream(
+        self,
+        prompt: str,
+        use_cache: bool = True,
+        schema: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_BATCH,
+        wait: Optional[float] = None,
+        **params: Any,
+    ) -> Iterator[str]:
+        """Closing the generator stops the generation and frees the slot."""
+        if not self.acquire(QUEUE_TIMEOUT if wait is None else wait):
+            raise ProviderBusy(f"Fournisseur de modèle {self.name} saturé, réessayez plus tard.")
+        try:
+            yield from self._call_stream(prompt, use_cache, schema, priority, params)
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'name': self.name,
+                'backend': self.backend,
+                'model': self.model,
+                'fallback': self.fallback,
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+                'healthy': self.healthy,
+                'failures': self.failures,
+                'last_error': self.last_error,
+            }
+
+
+class OllamaProvider(Provider):
+    """Modèle servi par Ollama; `urls` donne au fournisseur ses propres hôtes (sinon OLLAMA_URLS)."""
+
+    backend = 'ollama'
+
+    def __init__(self, name: str, model: str, urls: Optional[Sequence[str]] = None, **options: Any) -> None:
+        super().__init__(name, model, **options)
+        self.client = OllamaClient.from_env(list(urls)) if urls else None  # None: shared client
+
+    def _generate(self, prompt, params, use_cache, schema, accept, priority):
+        if accept is None and schema is None:
+            return generate_with_model(prompt, self.model, params, use_cache, client=self.client)
+        return generate_json_with_model(
+            prompt, self.model, params, use_cache, accept=accept, schema=schema, client=self.client,
+        )
+
+    def _stream(self, prompt, params, use_cache, schema, priority):
+        return stream_with_model(prompt, self.model, params, use_cache, schema=schema, client=self.client)
+
+
+class LocalProvider(Provider):
+    """
+    Modèle GGUF local: pool de répliques ctransformers et ordonnanceur de ce processus, ou
+    serveur de modèles si CTRANSFORMERS_SERVER_URL est défini. `params`: max_new_tokens,
+    temperature, top_p, timeout (attente d'une réplique), constraint (grammaire).
+    """
+
+    backend = 'ctransformers'
+
+    def load(self) -> None:
+        if get_model_server_client() is None:
+            with get_model_pool().acquire(self.model):
+                pass
+
+    def _generate(self, prompt, params, use_cache, schema, accept, priority):
+        if accept is None and schema is None:
+            return generate_locally(prompt, self.model, use_cache=use_cache, priority=priority, **params)
+        return generate_json_locally(
+            prompt, self.model, accept, schema, use_cache=use_cache, priority=priority, **params,
+        )
+
+    def _stream(self, prompt, params, use_cache, schema, priority):
+        if schema is not None and CONSTRAINED_DECODING and 'constraint' not in params:
+            params = {**params, 'constraint': JsonSchemaGrammar(schema)}
+        return stream_locally(prompt, self.model, use_cache=use_cache, priority=priority, **params)
+
+
+PROVIDER_BACKENDS = {
+    'ollama': OllamaProvider,
+    'ctransformers': LocalProvider,
+}
+
+
+def build_provider(config: Dict[str, Any]) -> Provider:
+    """Provider from one entry of LLM_PROVIDERS."""
+    options = dict(config)
+    backend = options.pop('backend', 'ollama')
+    provider_class = PROVIDER_BACKENDS.get(backend)
+    if provider_class is None:
+        raise ValueError(f"Backend de fournisseur inconnu: {backend}")
+    return provider_class(**options)
+
+
+class ProviderRegistry(_AsyncCalls):
+    """
+    Fournisseurs configurés, derrière la même interface qu'un fournisseur (`generate`,
+    `stream`, `agenerate`, `astream`) plus `providers=[noms]` pour restreindre le choix.
+    Chaque appel va au fournisseur sain le plus rapide qui a une place libre, puis aux
+    suivants s'il échoue (avant le premier chunk pour un stream); les fournisseurs
+    `fallback` ne servent que si les autres sont saturés ou en panne. Quand tous sont
+    saturés, l'appel attend une place `wait` secondes, puis ProviderBusy.
+    """
+
+    def __init__(self, providers: Sequence[Provider]) -> None:
+        if not providers:
+            raise ValueError("Au moins un fournisseur de modèle est requis.")
+        self.providers = list(providers)
+        self._by_name = {provider.name: provider for provider in self.providers}
+        if len(self._by_name) != len(self.providers):
+            raise ValueError("Les noms des fournisseurs de modèle doivent être uniques.")
+
+    @classmethod
+    def from_config(cls, configs: Iterable[Dict[str, Any]]) -> 'ProviderRegistry':
+        return cls([build_provider(config) for config in configs])
+
+    @classmethod
+    def from_settings(cls) -> 'ProviderRegistry':
+        """settings.LLM_PROVIDERS when Django is configured, DEFAULT_PROVIDERS otherwise."""
+        configs = None
+        try:
+            from django.conf import settings
+
+            if settings.configured:
+                configs = getattr(settings, 'LLM_PROVIDERS', None)
+        except ImportError:
+            pass
+        return cls.from_config(configs or DEFAULT_PROVIDERS)
+
+    def provider(self, name: str) -> Provider:
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise ValueError(f"Fournisseur de modèle inconnu: {name}") from None
+
+    def route(self, names: Optional[Iterable[str]] = None) -> List[Provider]:
+        """
+        Providers in the order they are tried: healthy ones first, primaries before
+        fallbacks, fastest first (a provider not measured yet is tried first, once, so that
+        added capacity gets used); providers in cooldown come last.
+        """
+        candidates = self.providers if names is None else [self.provider(name) for name in names]
+        ranked = sorted(enumerate(candidates), key=lambda item: (
+            not item[1].healthy,
+            item[1].fallback,
+            item[1].latency or 0.0,
+            item[0],
+        ))
+        return [provider for _, provider in ranked]
+
+    @staticmethod
+    def _acquired(order: List[Provider], wait: Optional[float]) -> Iterator[Provider]:
+        """Providers of `order` with a slot held (to release); saturated ones are waited for last."""
+        saturated = []
+        for provider in order:
+            if provider.acquire(0):
+                yield provider
+            else:
+                saturated.append(provider)
+        deadline = time.monotonic() + (QUEUE_TIMEOUT if wait is None else wait)
+        for provider in saturated:
+            if provider.acquire(deadline - time.monotonic()):
+                yield provider
+
+    @staticmethod
+    def _served(provider: Provider, order: List[Provider]) -> None:
+        if provider.fallback or provider is not order[0]:
+            count('fallbacks', backend=provider.name)
+
+    @staticmethod
+    def _unavailable(errors: List[str], busy: bool) -> RuntimeError:
+        if busy:
+            return ProviderBusy("Tous les fournisseurs de modèle sont saturés, réessayez plus tard.")
+        return RuntimeError("Aucun fournisseur de modèle disponible: " + "; ".join(errors))
+
+    def generate(
+        self,
+        prompt: str,
+        use_cache: bool = True,
+        schema: Optional[Dict[str, Any]] = None,
+        accept: Optional[Callable[[Any], bool]] = None,
+        priority: int = PRIORITY_BATCH,
+        wait: Optional[float] = None,
+        providers: Optional[Iterable[str]] = None,
+        **params: Any,
+    ) -> str:
+        order = self.route(providers)
+        errors: List[str] = []
+        busy = True
+        for provider in self._acquired(order, wait):
+            try:
+                text = provider._call(prompt, use_cache, schema, accept, priority, params)
+            except Exception as exc:
+                errors.append(f"{provider.name}: {exc}")
+                busy = busy and isinstance(exc, ModelPoolBusy)
+                continue
+            finally:
+                provider.release()
+            self._served(provider, order)
+            return text
+        raise self._unavailable(errors, busy)
+
+    def stream(
+        self,
+        prompt: str,
+        use_cache: bool = True,
+        schema: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_BATCH,
+        wait: Optional[float] = None,
+        providers: Optional[Iterable[str]] = None,
+        **params: Any,
+    ) -> Iterator[str]:
+        """Closing the generator stops the generation and frees the slot."""
+        order = self.route(providers)
+        errors: List[str] = []
+        busy = True
+        for provider in self._acquired(order, wait):
+            started = False
+            stream = provider._call_stream(prompt, use_cache, schema, priority, params)
+            try:
+                for chunk in stream:
+                    if not started:
+                        started = True
+                        self._served(provider, order)
+                    yield chunk
+                return
+            except Exception as exc:
+                if started:
+                    raise  # part of the text was already sent: no fallback
+                errors.append(f"{provider.name}: {exc}")
+                busy = busy and isinstance(exc, ModelPoolBusy)
+            finally:
+                stream.close()
+                provider.release()
+        raise self._unavailable(errors, busy)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [provider.stats() for provider in self.providers]
+
+
+_REGISTRY_LOCK = threading.Lock()
+_REGISTRY: Optional[ProviderRegistry] = None
+
+
+def get_provider_registry() -> ProviderRegistry:
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ProviderRegistry.from_settings()
+        return _REGISTRY
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .json_stream import JsonStreamExtractor, loads_lenient
+from .sanitizer import normalize_question_text
+
+# Même chemin que dans le notebook
+LOCAL_MODEL_PATH = "./models/llama-2-7b-chat.Q4_K_M.gguf"
+
+# Follow-up calls allowed to top up a multi-question generation
+MAX_TOPUP_CALLS = 2
+
+
+# JSON schemas of the payloads asked for by the prompts below, for constrained decoding
+# (Ollama `format`, or services/constrained.JsonSchemaGrammar for a local model)
+ANSWER_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string", "minLength": 1, "maxLength": 200},
+        "is_correct": {"type": "boolean"},
+    },
+    "required": ["text", "is_correct"],
+}
+QUESTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string", "minLength": 1, "maxLength": 400},
+        "answers": {"type": "array", "items": ANSWER_SCHEMA, "minItems": 2, "maxItems": 6},
+    },
+    "required": ["question", "answers"],
+}
+
+
+class GenerationError(Exception):
+    """La génération n'a produit aucune question exploitable."""
+
+
+def resolve_generation_context(niveau_id, thematique_id, competence_id, sous_competence_id=None) -> Dict[str, Any]:
+    """
+    Charge les objets du référentiel pour une génération et compose le texte de contexte.
+    Lève `ObjectDoesNotExist` / `ValueError` si un identifiant est invalide.
+    """
+    from ..models import Competence, Niveau, SousCompetence, Thematique
+
+    niveau = Niveau.objects.get(id=niveau_id)
+    thematique = Thematique.objects.get(id=thematique_id)
+    competence = Competence.objects.get(id=competence_id)
+    sous_competence = None
+    if sous_competence_id:
+        sous_competence = SousCompetence.objects.get(id=sous_competence_id)
+
+    topic_text = f"Niveau: {niveau.nom} | Thématique: {thematique.nom} | Compétence: {competence.description}"
+    if sous_competence:
+        topic_text += f" | Sous-compétence: {sous_competence.description}"
+    return {
+        'niveau': niveau,
+        'thematique': thematique,
+        'competence': competence,
+        'sous_competence': sous_competence,
+        'topic_text': topic_text,
+    }
+
+
+def build_question_prompt(
+    topic_text: str,
+    format_: str,
+    difficulte: str,
+) -> str:
+    """Prompt demandant au modèle une question et ses réponses au format JSON strict."""
+    return (
+        "Tu es un expert en pédagogie. Génère une question et des réponses au format JSON strict.\n"
+        f"Contexte: {topic_text}.\n"
+        f"Format de question: {format_}. Difficulté: {difficulte}.\n"
+        "Contraintes:\n"
+        "- Réponds UNIQUEMENT avec du JSON valide, sans texte additionnel.\n"
+        "- Schéma attendu: {\n"
+        "  \"question\": \"texte de la question\",\n"
+        "  \"answers\": [ { \"text\": \"réponse\", \"is_correct\": true|false }, ... ]\n"
+        "}.\n"
+        "- Pour 'quiz': 1 bonne réponse et 3 distracteurs.\n"
+        "- Pour 'true-false': donne 2 entrées (Vrai et Faux) avec la bonne marquée is_correct=true.\n"
+        "- Pour 'question' (ouverte): fournis 1 \"réponse modèle\" (is_correct=true) et 2 pistes incorrectes.\n"
+    )
+
+
+def build_questions_prompt(
+    topic_text: str,
+    format_: str,
+    difficulte: str,
+    count: int,
+    avoid: Iterable[str] = (),
+) -> str:
+    """Prompt demandant `count` questions distinctes (avec réponses) en une seule complétion."""
+    avoid = list(avoid)
+    if count == 1 and not avoid:
+        return build_question_prompt(topic_text, format_, difficulte)
+    prompt = (
+        f"Tu es un expert en pédagogie. Génère {count} questions distinctes et leurs réponses au format JSON strict.\n"
+        f"Contexte: {topic_text}.\n"
+        f"Format de question: {format_}. Difficulté: {difficulte}.\n"
+        "Contraintes:\n"
+        "- Réponds UNIQUEMENT avec du JSON valide, sans texte additionnel.\n"
+        "- Schéma attendu: {\n"
+        "  \"questions\": [\n"
+        "    { \"question\": \"texte de la question\",\n"
+        "      \"answers\": [ { \"text\": \"réponse\", \"is_correct\": true|false }, ... ] },\n"
+        "    ...\n"
+        "  ]\n"
+        "}.\n"
+        f"- Exactement {count} éléments dans \"questions\".\n"
+        "- Pour 'quiz': 1 bonne réponse et 3 distracteurs.\n"
+        "- Pour 'true-false': donne 2 entrées (Vrai et Faux) avec la bonne marquée is_correct=true.\n"
+        "- Pour 'question' (ouverte): fournis 1 \"réponse modèle\" (is_correct=true) et 2 pistes incorrectes.\n"
+    )
+    if avoid:
+        prompt += "- Ne répète aucune de ces questions déjà posées:\n"
+        prompt += "".join(f"  * {text}\n" for text in avoid)
+    return prompt
+
+
+def extract_json_object(raw: str) -> Dict[str, Any]:
+    """Parse the JSON object between the first '{' and the last '}' of `raw` (repaired if needed)."""
+    json_str = (raw or "").strip()
+    first_brace = json_str.find('{')
+    last_brace = json_str.rfind('}')
+    if first_brace != -1 and last_brace != -1:
+        json_str = json_str[first_brace:last_brace+1]
+    return loads_lenient(json_str)
+
+
+def normalize_question_payload(data: Dict[str, Any]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Valide la sortie JSON du modèle.
+    Retourne (texte de la question, [{"text", "is_correct"}, ...]) ou None si la sortie est inutilisable.
+    """
+    question_text = normalize_question_text(str(data.get('question', '')))
+    answers = data.get('answers') or []
+    if not question_text or not isinstance(answers, list) or len(answers) == 0:
+        return None
+
+    cleaned = []
+    for ans in answers:
+        try:
+            ans_text = str(ans.get('text', '')).strip()
+            is_correct = bool(ans.get('is_correct', False))
+        except Exception:
+            continue
+        if not ans_text:
+            continue
+        cleaned.append({'text': ans_text, 'is_correct': is_correct})
+    return question_text, cleaned
+
+
+def questions_from_data(data: Any) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Items of a single-question object, a {"questions": [...]} object or a bare list,
+    keeping only those that validate (question text and at least one answer).
+    """
+    if isinstance(data, dict) and isinstance(data.get('questions'), list):
+        data = data['questions']
+    candidates = data if isinstance(data, list) else [data]
+
+    items = []
+    for candidate in candidates:
+        if not isinstance(candidate, dict):
+            continue
+        parsed = normalize_question_payload(candidate)
+        if parsed is not None and parsed[1]:
+            items.append(parsed)
+    return items
+
+
+def is_questions_payload(data: Any) -> bool:
+    """Schema check for JsonStreamExtractor: the value holds at least one valid question."""
+    return bool(questions_from_data(data))
+
+
+def parse_generated_questions(raw: str) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Questions of the first complete JSON value of `raw` that holds valid items (common
+    defects repaired), falling back to the text between the outermost braces.
+    Lève ValueError si la sortie ne contient aucun JSON exploitable.
+    """
+    extractor = JsonStreamExtractor(is_questions_payload)
+    if extractor.feed(raw or ""):
+        return questions_from_data(extractor.value)
+    return questions_from_data(extract_json_object(raw))
+
+
+def questions_schema(count: int, avoid: Iterable[str] = ()) -> Dict[str, Any]:
+    """JSON schema of the output requested by `build_questions_prompt` with the same arguments."""
+    if count == 1 and not list(avoid):
+        return QUESTION_SCHEMA
+    return {
+        "type": "object",
+        "properties": {
+            "questions": {"type": "array", "items": QUESTION_SCHEMA, "minItems": count, "maxItems": count},
+        },
+        "required": ["questions"],
+    }
+
+
+def generate_question_items(
+    generate: Callable[..., str],
+    topic_text: str,
+    format_: str,
+    difficulte: str,
+    count: int = 1,
+    first_output: Optional[str] = None,
+    max_topups: int = MAX_TOPUP_CALLS,
+    is_duplicate: Optional[Callable[[str], bool]] = None,
+) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Obtient jusqu'à `count` questions valides: un premier appel pour tout le lot, puis
+    au plus `max_topups` appels complémentaires pour les questions manquantes ou invalides.
+
+    `generate(prompt, use_cache=..., schema=...)` appelle le modèle (`schema`: JSON schema
+    de la sortie attendue, pour le décodage contraint); les appels complémentaires
+    contournent le cache pour ne pas resservir une sortie rejetée.
+    `first_output` permet de fournir la première complétion (déjà obtenue en streaming).
+    `is_duplicate(texte)` (voir services/dedup.py) écarte les quasi-doublons, qui sont
+    alors régénérés comme les questions invalides.
+    Lève `GenerationError` si aucune question n'est exploitable.
+    """
+    items: List[Tuple[str, List[Dict[str, Any]]]] = []
+    duplicates: List[str] = []
+    seen = set()
+    last_error: Optional[GenerationError] = None
+    for attempt in range(max_topups + 1):
+        missing = count - len(items)
+        if missing <= 0:
+            break
+        try:
+            if attempt == 0 and first_output is not None:
+                raw = first_output
+            else:
+                avoid = [text for text, _ in items] + duplicates
+                prompt = build_questions_prompt(topic_text, format_, difficulte, missing, avoid=avoid)
+                if attempt > 0:
+                    metrics.count('regenerations')
+                raw = generate(prompt, use_cache=attempt == 0, schema=questions_schema(missing, avoid))
+            with metrics.stage('parse'):
+                parsed = parse_generated_questions(raw)
+        except Exception as exc:
+            last_error = GenerationError(f"Échec génération/parsing: {exc}")
+            continue
+        if not parsed:
+            last_error = GenerationError('Sortie du modèle invalide.')
+        for question_text, answers in parsed:
+            key = question_text.casefold()
+            if key in seen:
+                continue
+            seen.add(key)
+            if is_duplicate is not None and is_duplicate(question_text):
+                duplicates.append(question_text)
+                last_error = GenerationError('Les questions générées existent déjà (doublons).')
+                continue
+            items.append((question_text, answers))
+            if len(items) >= count:
+                break
+    if not items:
+        raise last_error or GenerationError('Sortie du modèle invalide.')
+    return items
+
+
+# Fixed instructions of the local prompt. They come first so that consecutive prompts share
+# them as a prefix: a ctransformers replica only evaluates the part of a new prompt past the
+# tokens it already holds (see ModelPool.acquire).
+LOCAL_QUESTION_INSTRUCTIONS = "\n".join([
+    "You are a question generator for pedagogy.",
+    "Your task is to produce EXACTLY ONE clear, well‑formed question in ENGLISH.",
+    "Write in simple English suitable for the specified level so a student can self‑assess.",
+    "",
+    "Strict rules:",
+    "- Produce a DIRECT academic content question about the topic that assesses the competence.",
+    "- Use concrete values/examples where natural; for math, include numbers.",
+    "- Do NOT use meta language (no 'Can you', 'Could you', 'Please', 'Write', 'Create', 'Give me', 'Make', 'Formulate', 'Answer', 'about', 'regarding').",
+    "- Do NOT start with phrases like 'Here is', 'Thanks', 'Thank you', 'Sure', etc.",
+    "- Do NOT provide explanations, introductions, or justifications.",
+    "- Do NOT provide any answers, only the question.",
+    "- Output must be ONE interrogative sentence ending with a question mark '?'.",
+    "- The question must be appropriate for the level, topic and competence given below.",
+    "",
+    "Bad examples (do NOT write like this):",
+    "- Can you answer a simple question about numbers?",
+    "- Please create a question about place value.",
+    "",
+    "Good examples (structure to imitate):",
+    "- What is 37 + 25?",
+    "- Which digit shows the tens place in 84?",
+    "",
+    "Expected example:",
+    "Which number is greater: 243 or 578?",
+    "",
+    "Context:",
+])
+
+
+def build_local_question_prompt(niveau: str, thematique: str, competence: str, sous_competence: str = "") -> str:
+    """Prompt du modèle local: une seule question interrogative, sans réponse."""
+    prompt_parts = [
+        LOCAL_QUESTION_INSTRUCTIONS,
+        f"- The question must be appropriate for the level: {niveau}.",
+        f"- The topic is: {thematique}.",
+        f"- The targeted competence is: {competence}.",
+    ]
+    if sous_competence:
+        prompt_parts.append(f"- The sub‑competence to respect is: {sous_competence}.")
+    prompt_parts.extend([
+        "",
+        "Now generate exactly one suitable question:",
+    ])
+    return "\n".join(prompt_parts)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from django.db import transaction
+
+from ..models import Question, Reponse
+from ..serializers import QuestionSerializer, ReponseSerializer
+from .dedup import index_questions
+from .metrics import stage
+
+
+# Optional curriculum context keys of an item -> Question attribute
+CONTEXT_FIELDS = {
+    'niveau_id': 'id_niveau_id',
+    'thematique_id': 'id_thematique_id',
+    'competence_id': 'id_competence_id',
+    'sous_competence_id': 'id_sous_competence_id',
+    'difficulte': 'difficulte',
+}
+
+
+def generation_context_fields(context: Dict[str, Any], difficulte: str = '') -> Dict[str, Any]:
+    """Context keys for `save_questions` items, from a `resolve_generation_context` result."""
+    sous_competence = context.get('sous_competence')
+    return {
+        'niveau_id': context['niveau'].id,
+        'thematique_id': context['thematique'].id,
+        'competence_id': context['competence'].id,
+        'sous_competence_id': sous_competence.id if sous_competence else None,
+        'difficulte': difficulte or '',
+    }
+
+
+def _question_from_item(item: Dict[str, Any]) -> Question:
+    context = {attname: item[key] for key, attname in CONTEXT_FIELDS.items() if item.get(key) is not None}
+    return Question(description=item['question'], type=item['type'], **context)
+
+
+def _attach_reponses(question: Question, reponses: List[Reponse]) -> None:
+    """Prime the `reponses` prefetch cache so serializing the question does not query again."""
+    queryset = question.reponses.all()
+    queryset._result_cache = reponses
+    queryset._prefetch_done = True
+    question._prefetched_objects_cache = {'reponses': queryset}
+
+
+def save_questions(items: List[Dict[str, Any]]) -> List[Tuple[Question, List[Reponse]]]:
+    """
+    Enregistre un lot de questions générées et leurs réponses en deux `bulk_create`
+    dans une seule transaction.
+
+    `items`: [{"question": str, "type": str, "answers": [{"text": str, "is_correct": bool}, ...]}, ...]
+    Each item may also carry its curriculum context (keys of CONTEXT_FIELDS).
+    """
+    if not items:
+        return []
+    with stage('db_write'), transaction.atomic():
+        questions = Question.objects.bulk_create([_question_from_item(item) for item in items])
+        per_question = [
+            [
+                Reponse(description=ans['text'], valide=ans['is_correct'], id_question=question)
+                for ans in item.get('answers', [])
+            ]
+            for question, item in zip(questions, items)
+        ]
+        Reponse.objects.bulk_create([reponse for reponses in per_question for reponse in reponses])
+        # bulk_create sends no post_save: index for near-duplicate lookups here
+        index_questions(questions)
+
+    for question, reponses in zip(questions, per_question):
+        _attach_reponses(question, reponses)
+    return list(zip(questions, per_question))
+
+
+def save_question(question_text: str, answers: List[Dict[str, Any]], type_: str) -> Tuple[Question, List[Reponse]]:
+    """Enregistre une question générée et ses réponses ({"text", "is_correct"}) dans une transaction."""
+    return save_questions([{'question': question_text, 'type': type_, 'answers': answers}])[0]
+
+
+def serialize_saved(question: Question, reponses: List[Reponse]) -> Dict[str, Any]:
+    """Serialized form returned by the generation endpoints, built without re-querying."""
+    return {
+        'question': QuestionSerializer(question).data,
+        'reponses': ReponseSerializer(reponses, many=True).data,
+    }
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import re
+from typing import Callable, List, Sequence, Tuple
+
+# Normalization of raw model output into a single clean question.
+#
+# Every pattern is compiled once at import time. The pipeline is table-driven:
+# clean_output() drops filler lines and prefaces, find_candidate() picks the question
+# sentence, then the CANDIDATE_STAGES are applied in order. When no usable candidate
+# comes out, fallback_question() searches again and, as a last resort, synthesizes a
+# question from the context.
+#
+# No Django import here: the FastAPI service (pedagogieQuestions_logic.py) uses it too.
+
+Stage = Callable[[str], str]
+
+QUOTES = '"\'“”‘’'
+
+FILLER_LINE_RE = re.compile(r"^(?:merci|thanks|ok|bien\s*s[uû]r)\s*[!\.?]*$", re.IGNORECASE)
+# Prefaces like "Pas de problème, voici la question :" at the start of the output
+PREFACE_RE = re.compile(
+    r"^(?:[\"'“”‘’\s]*(?:pas de problème|voici|here is|ok[:,]?|bien sûr[:,]?)[^\n]*?[:\-]\s*)",
+    re.IGNORECASE,
+)
+QUOTED_QUESTION_RE = re.compile(r"[\"“]([^\"”\n]{3,}?\?)[\"”]")
+QUESTION_SENTENCE_RE = re.compile(r"([A-ZÀ-ÖØ-Þ\"“‘'\(][^?]{3,}?\?)")
+ANY_QUESTION_RE = re.compile(r"([^?]{3,}?\?)")
+LEADING_LABEL_RE = re.compile(r"^\s*(?:\d+[\).:]\s*|[-*]\s*|Q\s*[:\-]\s*|Question\s*[:\-]\s*)")
+EXAMPLE_PREFIX_RE = re.compile(r"^(exemple\s*[:\-]\s*)", re.IGNORECASE)
+META_START_RE = re.compile(
+    r"^(can|could|please|write|create|give|make|formulate|answer|about|regarding)\b", re.IGNORECASE,
+)
+ARITHMETIC_TOPIC_RE = re.compile(r"(number|digit|add|plus|sum|place\s*value|tens|ones|arithmetic|count)", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+NUMBERED_LINE_RE = re.compile(r"^(?:\d|Q)")
+
+
+# ---- Stages: each one takes and returns the candidate text ----
+
+def strip_label(text: str) -> str:
+    """Numbering, bullets and 'Question:' labels."""
+    return LEADING_LABEL_RE.sub("", text, count=1)
+
+
+def strip_quotes(text: str) -> str:
+    return text.strip().strip(QUOTES).strip()
+
+
+def strip_example_prefix(text: str) -> str:
+    return EXAMPLE_PREFIX_RE.sub("", text, count=1)
+
+
+def cut_after_question_mark(text: str) -> str:
+    """Everything after the first '?' is dropped."""
+    if '?' in text:
+        return text.split('?', 1)[0].strip() + '?'
+    return text
+
+
+CANDIDATE_STAGES: Tuple[Stage, ...] = (strip_label, strip_quotes, strip_example_prefix, cut_after_question_mark)
+FALLBACK_STAGES: Tuple[Stage, ...] = (strip_label, strip_quotes)
+
+
+def apply_stages(text: str, stages: Sequence[Stage]) -> str:
+    for stage in stages:
+        text = stage(text)
+    return text
+
+
+# ---- Pipeline ----
+
+def is_filler(text: str) -> bool:
+    return bool(FILLER_LINE_RE.match(text or ""))
+
+
+def clean_output(raw_text: str) -> Tuple[str, List[str]]:
+    """(text without filler lines nor leading preface, its non-empty lines)."""
+    lines = [line for line in (ln.strip() for ln in (raw_text or "").splitlines()) if line and not is_filler(line)]
+    text = PREFACE_RE.sub("", " \n".join(lines), count=1)
+    return text, lines
+
+
+def find_candidate(text: str, lines: Sequence[str]) -> str:
+    """A quoted question if there is one, else the first question sentence, else the first line."""
+    quoted = QUOTED_QUESTION_RE.search(text)
+    if quoted:
+        return quoted.group(1).strip()
+    sentence = QUESTION_SENTENCE_RE.search(text)
+    if sentence:
+        return sentence.group(1).strip()
+    return lines[0] if lines else ""
+
+
+def is_usable(candidate: str) -> bool:
+    return bool(candidate) and not is_filler(candidate) and len(candidate.split()) >= 3
+
+
+def fallback_question(text: str, lines: Sequence[str], thematique: str = "", competence: str = "") -> str:
+    """Any non-filler question sentence, else the first line, else a question synthesized from the context."""
+    chosen = next((match.group(1).strip() for match in ANY_QUESTION_RE.finditer(text) if not is_filler(match.group(1))), "")
+    fallback = apply_stages(chosen or (lines[0] if lines else text).strip(), FALLBACK_STAGES)
+    if is_filler(fallback) or len(fallback.split()) < 3 or META_START_RE.match(fallback):
+        # Prefer a concrete arithmetic pattern when relevant
+        if ARITHMETIC_TOPIC_RE.search(f"{thematique or 'this topic'} {competence}"):
+            fallback = "What is 7 + 8?"
+        else:
+            fallback = f"Which statement is true about {thematique or 'this topic'}?"
+    elif fallback and not fallback.endswith('?'):
+        fallback = fallback.rstrip('.!;:') + '?'
+    return cut_after_question_mark(FILLER_LINE_RE.sub("", fallback).strip())
+
+
+def sanitize_question(raw_text: str, thematique: str = "", competence: str = "") -> str:
+    """Keep only a single clean question sentence from the local model output."""
+    text, lines = clean_output(raw_text)
+    candidate = apply_stages(find_candidate(text, lines), CANDIDATE_STAGES)
+    if is_usable(candidate):
+        return candidate if candidate.endswith('?') else candidate + '?'
+    return fallback_question(text, lines, thematique, competence)
+
+
+def normalize_question_text(text: str) -> str:
+    """Light cleanup of a question text already extracted from JSON output (labels, quotes, spaces)."""
+    return strip_example_prefix(strip_quotes(strip_label(WHITESPACE_RE.sub(" ", text or "").strip())))
+
+
+def extract_numbered_questions(text: str) -> List[str]:
+    """Lines of a numbered list of questions ("1. ...", "Q1: ..."), in order."""
+    return [line for line in (ln.strip() for ln in (text or "").splitlines()) if line and NUMBERED_LINE_RE.match(line)]
+
+
+class StreamingQuestionSanitizer:
+    """
+    Sanitizer for streamed output. `feed(chunk)` returns True as soon as a usable
+    question has been closed by a '?': everything after it would be dropped anyway,
+    so the caller can stop generating. `result()` gives the sanitized question.
+    """
+
+    def __init__(self, thematique: str = "", competence: str = ""):
+        self.thematique = thematique
+        self.competence = competence
+        self.chunks: List[str] = []
+        self.complete = False
+
+    def feed(self, chunk: str) -> bool:
+        self.chunks.append(chunk)
+        # A question can only be completed by a chunk containing '?'
+        if not self.complete and '?' in chunk:
+            self.complete = '?' in self.partial()
+        return self.complete
+
+    def partial(self) -> str:
+        """Best question found so far, or '' while none is usable."""
+        text, lines = clean_output(''.join(self.chunks))
+        candidate = apply_stages(find_candidate(text, lines), CANDIDATE_STAGES)
+        return candidate if is_usable(candidate) else ""
+
+    def result(self) -> str:
+        return sanitize_question(''.join(self.chunks), self.thematique, self.competence)
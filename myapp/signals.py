@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Competence, Matiere, Niveau, Question, SousCompetence, Thematique
+from .reference_cache import bump_version
+
+
+@receiver([post_save, post_delete], sender=Matiere)
+@receiver([post_save, post_delete], sender=Niveau)
+@receiver([post_save, post_delete], sender=Thematique)
+@receiver([post_save, post_delete], sender=Competence)
+@receiver([post_save, post_delete], sender=SousCompetence)
+def invalidate_reference_cache(sender, **kwargs):
+    """Any write to reference data invalidates the cached responses built from that model."""
+    # Once the write is committed: bumped earlier, another worker could read the old rows
+    # and cache them under the new version until the TTL expires
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+@receiver(post_save, sender=Question)
+def index_question_for_dedup(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the near-duplicate index in step with question descriptions."""
+    if raw or (update_fields is not None and 'description' not in update_fields):
+        return
+    from .services.dedup import index_questions
+
+    index_questions([instance], replace=True)
@@ -0,0 +1,65 @@
+import json
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+
+# Opt-in streaming formats for the generation endpoints:
+# - "sse": server-sent events (`event: token` / `event: done` / `event: error`)
+# - "ndjson": one JSON object per line ({"event": "token", ...})
+STREAM_CONTENT_TYPES = {
+    'sse': 'text/event-stream',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def requested_stream_format(request) -> Optional[str]:
+    """
+    Return the streaming format asked for by the client, or None for a regular JSON response.
+    Accepted: body/query `stream` = true | "sse" | "ndjson", or an `Accept: text/event-stream` header.
+    """
+    value = request.data.get('stream') if hasattr(request, 'data') else None
+    if value in (None, '', False):
+        value = request.query_params.get('stream')
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in STREAM_CONTENT_TYPES:
+            return value
+        value = value in ('1', 'true', 'yes')
+    if value:
+        return 'sse'
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        return 'sse'
+    return None
+
+
+class StreamingContentNegotiation(DefaultContentNegotiation):
+    """
+    Content negotiation of the streaming views: `Accept: text/event-stream` selects the
+    streamed response (see requested_stream_format), so DRF must not answer it with a 406;
+    the non-streamed responses of these views (errors) are then rendered as JSON.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            return renderers[0], renderers[0].media_type
+        return super().select_renderer(request, renderers, format_suffix)
+
+
+def encode_event(event: str, data: Dict[str, Any], fmt: str) -> bytes:
+    if fmt == 'ndjson':
+        return (json.dumps({'event': event, **data}, ensure_ascii=False) + '\n').encode('utf-8')
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n".encode('utf-8')
+
+
+def streaming_response(events: Iterable[Tuple[str, Dict[str, Any]]], fmt: str) -> StreamingHttpResponse:
+    """Wrap an iterator of (event, data) pairs into a streamed HTTP response."""
+    response = StreamingHttpResponse(
+        (encode_event(event, data, fmt) for event, data in events),
+        content_type=STREAM_CONTENT_TYPES[fmt],
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so tokens reach the browser as they are produced
+    response['X-Accel-Buffering'] = 'no'
+    return response
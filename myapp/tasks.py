@@ -1,88 +1,328 @@
-from celery import shared_task
-from django.db import transaction
-from .models import Question, Reponse
-from .services.llm_client import generate_with_model
-import json
+from celery import chord, shared_task
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import GenerationJob
+from .services.dedup import duplicate_checker
+from .services.json_stream import loads_lenient
+from .services.metrics import trace
+from .services.providers import get_provider_registry
+from .services.question_store import generation_context_fields, save_questions
+from .services.sanitizer import normalize_question_text
+from pathlib import Path
+import time
+
+
+def _task_result(competence_id: int, question_id: int | None, message: str) -> dict:
+    return {
+        'competence_id': competence_id,
+        'status': 'success' if question_id is not None else 'error',
+        'question_id': question_id,
+        'message': message,
+    }
+
+
+def _is_task_payload(data) -> bool:
+    """Schema asked for by the task prompt: a question text and a list of réponses."""
+    return (
+        isinstance(data, dict)
+        and bool(str(data.get('question') or '').strip())
+        and isinstance(data.get('reponses'), list)
+    )
+
+
+# JSON schema of the payload requested by the task prompt, for constrained decoding
+TASK_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'question': {'type': 'string', 'minLength': 1, 'maxLength': 400},
+        'type': {'type': 'string'},
+        'reponses': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {'description': {'type': 'string', 'minLength': 1, 'maxLength': 200}, 'valide': {'type': 'boolean'}},
+                'required': ['description', 'valide'],
+            },
+            'minItems': 1,
+            'maxItems': 6,
+        },
+    },
+    'required': ['question', 'type', 'reponses'],
+}
+
+
+def _task_providers(model_name: str) -> list:
+    """
+    Names of the settings.LLM_PROVIDERS entries a task's `model_name` selects: a provider
+    name; `local:<model>` for the local models (all of them if none has that file name);
+    otherwise the Ollama providers serving that model, all of them if none does, plus the
+    fallback providers.
+    """
+    providers = get_provider_registry().providers
+    if any(provider.name == model_name for provider in providers):
+        return [model_name]
+    if model_name.startswith('local:'):
+        local = [provider for provider in providers if provider.backend == 'ctransformers']
+        wanted = model_name[len('local:'):]
+        named = [provider for provider in local if Path(provider.model).stem == wanted]
+        return [provider.name for provider in named or local]
+    ollama = [provider for provider in providers if provider.backend == 'ollama' and not provider.fallback]
+    serving = [provider for provider in ollama if provider.model == model_name]
+    return [provider.name for provider in providers if provider in (serving or ollama) or provider.fallback]
+
+
+def _generate_question_item(competence_id: int, question_type: str, model_name: str) -> dict:
+    """
+    Ask the model for one question on a competence.
+    Returns an item for `save_questions` (nothing is written to the database here).
+    """
+    # Create a prompt based on the competence
+    from .models import Competence
+    competence = Competence.objects.get(id=competence_id)
+    
+    prompt = f"""
+    Créez une question de type {question_type} pour la compétence suivante:
+    
+    Compétence: {competence.description}
+    
+    Veuillez générer:
+    1. Une question claire et appropriée
+    2. Plusieurs réponses possibles (si QCM)
+    3. Indiquez quelle(s) réponse(s) est/sont correcte(s)
+    
+    Format de réponse attendu (JSON):
+    {{
+        "question": "Texte de la question",
+        "type": "{question_type}",
+        "reponses": [
+            {{"description": "Réponse 1", "valide": true}},
+            {{"description": "Réponse 2", "valide": false}},
+            {{"description": "Réponse 3", "valide": false}},
+            {{"description": "Réponse 4", "valide": false}}
+        ]
+    }}
+    """
+    
+    context = {'competence_id': competence.id, 'thematique_id': competence.id_thematique_id}
+
+    # Generate with AI, stopping at the end of the first valid JSON object
+    # Each call must yield a new question: bypass the generation cache
+    output_text = get_provider_registry().generate(
+        prompt, use_cache=False, schema=TASK_SCHEMA, accept=_is_task_payload, providers=_task_providers(model_name),
+    )
+
+    # Parse the JSON response (common defects repaired); raw text is never saved as a question
+    try:
+        generated_data = loads_lenient(output_text)
+    except ValueError:
+        generated_data = None
+    if not _is_task_payload(generated_data):
+        raise ValueError("la sortie du modèle ne contient pas de JSON valide")
+
+    return {
+        'question': normalize_question_text(str(generated_data.get("question", ""))),
+        'type': generated_data.get("type", question_type),
+        'answers': [
+            {'text': reponse_data.get("description", ""), 'is_correct': reponse_data.get("valide", False)}
+            for reponse_data in generated_data["reponses"]
+            if isinstance(reponse_data, dict)
+        ],
+        **context,
+    }
+
+
+def _success_message(question_id: int) -> str:
+    return f"Question générée avec succès (ID: {question_id})"
+
+
+def _duplicate_message(checker, item: dict) -> str:
+    message = "Question en double, non enregistrée"
+    existing_id = checker.rejected.get(item['question'])
+    if existing_id is not None:
+        message += f" (similaire à la question {existing_id})"
+    return message
 
 
 @shared_task
-def generate_question_task(competence_id: int, question_type: str = "qcm", model_name: str = "mistral") -> None:
+@trace('task:generate_question')
+def generate_question_task(competence_id: int, question_type: str = "qcm", model_name: str = "mistral") -> dict:
     """
     Generate a question based on a competence using AI
     """
     try:
-        # Create a prompt based on the competence
-        from .models import Competence
-        competence = Competence.objects.get(id=competence_id)
-        
-        prompt = f"""
-        Créez une question de type {question_type} pour la compétence suivante:
-        
-        Compétence: {competence.description}
-        
-        Veuillez générer:
-        1. Une question claire et appropriée
-        2. Plusieurs réponses possibles (si QCM)
-        3. Indiquez quelle(s) réponse(s) est/sont correcte(s)
-        
-        Format de réponse attendu (JSON):
-        {{
-            "question": "Texte de la question",
-            "type": "{question_type}",
-            "reponses": [
-                {{"description": "Réponse 1", "valide": true}},
-                {{"description": "Réponse 2", "valide": false}},
-                {{"description": "Réponse 3", "valide": false}},
-                {{"description": "Réponse 4", "valide": false}}
-            ]
-        }}
-        """
-        
-        # Generate with AI
-        output_text = generate_with_model(prompt=prompt, model_name=model_name)
-        
-        # Parse the JSON response
-        try:
-            generated_data = json.loads(output_text)
-            
-            # Create the question
-            with transaction.atomic():
-                question = Question.objects.create(
-                    description=generated_data.get("question", ""),
-                    type=generated_data.get("type", question_type)
-                )
-                
-                # Create the responses
-                for reponse_data in generated_data.get("reponses", []):
-                    Reponse.objects.create(
-                        description=reponse_data.get("description", ""),
-                        valide=reponse_data.get("valide", False),
-                        id_question=question
-                    )
-                
-                return f"Question générée avec succès (ID: {question.id})"
-                
-        except json.JSONDecodeError:
-            # If JSON parsing fails, create a simple question
-            with transaction.atomic():
-                question = Question.objects.create(
-                    description=output_text,
-                    type=question_type
-                )
-                return f"Question générée avec succès (ID: {question.id}) - Format JSON invalide, question simple créée"
-                
+        item = _generate_question_item(competence_id, question_type, model_name)
+        checker = duplicate_checker(competence_id)
+        if checker is not None and checker(item['question']):
+            return _task_result(competence_id, None, _duplicate_message(checker, item))
+        question, _ = save_questions([item])[0]
+        return _task_result(competence_id, question.id, _success_message(question.id))
     except Exception as exc:
-        return f"Erreur lors de la génération: {exc}"
+        return _task_result(competence_id, None, f"Erreur lors de la génération: {exc}")
+
+
+def _batch_backend(model_name: str) -> str:
+    """'local' when `model_name` selects only local providers, 'ollama' otherwise."""
+    registry = get_provider_registry()
+    selected = [registry.provider(name) for name in _task_providers(model_name)]
+    return 'local' if all(provider.backend == 'ctransformers' for provider in selected) else 'ollama'
+
+
+def _batch_concurrency(model_name: str) -> int:
+    limits = getattr(settings, 'GENERATION_BATCH_CONCURRENCY', {})
+    return max(1, int(limits.get(_batch_backend(model_name), 1)))
+
+
+def _run_batch_item(competence_id: int, question_type: str, model_name: str) -> dict:
+    try:
+        return _generate_question_item(competence_id, question_type, model_name)
+    finally:
+        # Pool threads get their own DB connections; do not leak them
+        connections.close_all()
 
 
 @shared_task
-def generate_questions_batch_task(competence_ids: list, question_type: str = "qcm", count_per_competence: int = 1) -> None:
+def summarize_batch_results(results: list, started_at: float) -> dict:
+    """Aggregate per-item results of a batch (also used as the chord callback)."""
+    elapsed = max(time.time() - started_at, 1e-6)
+    succeeded = [r for r in results if r.get('status') == 'success']
+    return {
+        'total': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'question_ids': [r['question_id'] for r in succeeded],
+        'failures': [r for r in results if r.get('status') != 'success'],
+        'elapsed_s': round(elapsed, 3),
+        'questions_per_minute': round(len(succeeded) * 60 / elapsed, 2),
+    }
+
+
+@shared_task
+def generate_questions_batch_task(
+    competence_ids: list,
+    question_type: str = "qcm",
+    count_per_competence: int = 1,
+    model_name: str = "mistral",
+) -> dict:
     """
-    Generate multiple questions for multiple competences
+    Generate multiple questions for multiple competences, in parallel.
+
+    With a broker, items fan out as a Celery chord (one task per question) and the
+    summary is produced by `summarize_batch_results`; concurrency is then bounded by
+    the workers consuming the queue. In eager mode, items run on an in-process thread
+    pool capped by GENERATION_BATCH_CONCURRENCY for the model's backend.
     """
+    items = [cid for cid in competence_ids for _ in range(count_per_competence)]
+    started_at = time.time()
+
+    if not getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        header = [generate_question_task.s(cid, question_type, model_name) for cid in items]
+        result = chord(header)(summarize_batch_results.s(started_at))
+        return {'status': 'dispatched', 'total': len(items), 'summary_task_id': result.id}
+
+    # Generate in parallel, then write the whole batch at once
+    with ThreadPoolExecutor(max_workers=_batch_concurrency(model_name), thread_name_prefix='generation-batch') as pool:
+        futures = [pool.submit(_run_batch_item, cid, question_type, model_name) for cid in items]
+        outcomes = []
+        for cid, future in zip(items, futures):
+            try:
+                outcomes.append((cid, future.result(), None))
+            except Exception as exc:
+                outcomes.append((cid, None, exc))
+
+    # Drop near-duplicates of the bank and of earlier items of the batch (per competence)
+    checkers, duplicates = {}, {}
+    for index, (cid, item, exc) in enumerate(outcomes):
+        if exc is not None:
+            continue
+        if cid not in checkers:
+            checkers[cid] = duplicate_checker(cid)
+        if checkers[cid] is not None and checkers[cid](item['question']):
+            duplicates[index] = _duplicate_message(checkers[cid], item)
+
+    generated = [item for index, (_, item, exc) in enumerate(outcomes) if exc is None and index not in duplicates]
+    try:
+        saved = iter(save_questions(generated))
+    except Exception as exc:
+        saved = None
+        save_error = exc
+
     results = []
-    for competence_id in competence_ids:
-        for _ in range(count_per_competence):
-            result = generate_question_task(competence_id, question_type)
-            results.append(result)
-    return results
\ No newline at end of file
+    for index, (cid, item, exc) in enumerate(outcomes):
+        if exc is not None:
+            results.append(_task_result(cid, None, f"Erreur lors de la génération: {exc}"))
+        elif index in duplicates:
+            results.append(_task_result(cid, None, duplicates[index]))
+        elif saved is None:
+            results.append(_task_result(cid, None, f"Erreur lors de l'enregistrement: {save_error}"))
+        else:
+            question, _ = next(saved)
+            results.append(_task_result(cid, question.id, _success_message(question.id)))
+    return summarize_batch_results(results, started_at)
+
+
+def _update_job(job_id: str, **fields) -> int:
+    """Update a job unless it was cancelled meanwhile; returns the number of rows updated."""
+    return GenerationJob.objects.filter(id=job_id).exclude(
+        status=GenerationJob.STATUS_CANCELLED
+    ).update(updated_at=timezone.now(), **fields)
+
+
+@shared_task
+@trace('task:generation_job')
+def run_generation_job_task(job_id: str) -> None:
+    """
+    Run a GenerationJob created through /generate/jobs/: same pipeline as GenerateQuestionView,
+    with progress reporting and cooperative cancellation.
+    """
+    from .services.providers import get_provider_registry
+    from .services.question_generation import (
+        generate_question_items, is_questions_payload, resolve_generation_context,
+    )
+
+    started = GenerationJob.objects.filter(
+        id=job_id, status=GenerationJob.STATUS_PENDING, expires_at__gt=timezone.now()
+    ).update(status=GenerationJob.STATUS_RUNNING, progress=10, updated_at=timezone.now())
+    if not started:
+        return
+
+    job = GenerationJob.objects.get(id=job_id)
+    params = job.params
+    try:
+        context = resolve_generation_context(
+            params.get('niveau_id'), params.get('thematique_id'),
+            params.get('competence_id'), params.get('sous_competence_id'),
+        )
+        items = generate_question_items(
+            lambda prompt, use_cache=True, schema=None: get_provider_registry().generate(
+                prompt, use_cache=use_cache, schema=schema, accept=is_questions_payload,
+            ),
+            context['topic_text'], params['format'], params['difficulte'], count=params.get('count') or 1,
+            is_duplicate=duplicate_checker(context['competence'].id),
+        )
+        if not _update_job(job_id, progress=80):
+            return
+
+        with transaction.atomic():
+            job = GenerationJob.objects.select_for_update().get(id=job_id)
+            if job.status == GenerationJob.STATUS_CANCELLED:
+                return
+            question_context = generation_context_fields(context, params['difficulte'])
+            saved = save_questions([
+                {'question': question_text, 'type': params['format'], 'answers': answers, **question_context}
+                for question_text, answers in items
+            ])
+            job.status = GenerationJob.STATUS_SUCCEEDED
+            job.progress = 100
+            job.question_ids = [question.id for question, _ in saved]
+            job.save(update_fields=['status', 'progress', 'question_ids', 'updated_at'])
+    except Exception as exc:
+        _update_job(job_id, status=GenerationJob.STATUS_FAILED, error=str(exc))
+
+
+@shared_task
+def purge_expired_generation_jobs_task() -> int:
+    """Delete jobs past their TTL (schedule with celery beat)."""
+    deleted, _ = GenerationJob.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,70 @@
+import json
+from unittest import mock
+
+from ..benchmarks.stub_backends import FakeModel, stub_backends
+from ..models import Competence, Matiere, Niveau, SousCompetence, Thematique
+from ..services import generation_cache, providers
+from ..services.ctransformers_client import ModelPool
+
+MODEL_PATH = '/nonexistent/fake-model.gguf'  # the pool loader never opens it
+
+
+def fake_pool(**options):
+    return ModelPool(loader=FakeModel.loader(token_latency=0, tokens=8), **options)
+
+
+class CurriculumMixin:
+    """One branch of the curriculum (matière > thématique > compétence > sous-compétence) and a niveau."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.niveau = Niveau.objects.create(nom='CE2')
+        cls.matiere = Matiere.objects.create(nom='Mathématiques')
+        cls.thematique = Thematique.objects.create(nom='Nombres', id_matiere=cls.matiere)
+        cls.competence = Competence.objects.create(description='Additionner', id_thematique=cls.thematique)
+        cls.sous_competence = SousCompetence.objects.create(
+            description='Additions sans retenue', id_competence=cls.competence,
+        )
+
+    def generation_body(self, **fields):
+        """Request body of the generation endpoints for this branch."""
+        return {
+            'niveau_id': self.niveau.id,
+            'thematique_id': self.thematique.id,
+            'competence_id': self.competence.id,
+            'sous_competence_id': self.sous_competence.id,
+            'format': 'quiz',
+            'difficulte': 'easy',
+            **fields,
+        }
+
+
+class StubBackendsMixin:
+    """
+    Ollama and the local model replaced by the stubs of benchmarks/stub_backends.py, with a
+    provider registry and a generation cache of their own for each test. `self.ollama` is
+    the fake Ollama server.
+    """
+    stub_tokens = 40
+
+    def setUp(self):
+        super().setUp()
+        backends = stub_backends(token_latency=0, tokens=self.stub_tokens)
+        self.ollama = backends.__enter__()
+        self.addCleanup(backends.__exit__, None, None, None)
+        self.enterContext(mock.patch.object(providers, '_REGISTRY', None))
+        self.enterContext(mock.patch.object(generation_cache, '_CACHE', None))
+
+
+def stream_events(response):
+    """(event, data) pairs of a streamed SSE or NDJSON response."""
+    body = b''.join(response.streaming_content).decode('utf-8')
+    if response['Content-Type'] == 'application/x-ndjson':
+        lines = [json.loads(line) for line in body.splitlines()]
+        return [(line.pop('event'), line) for line in lines]
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
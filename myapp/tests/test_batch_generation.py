@@ -0,0 +1,84 @@
+import threading
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import tasks
+from ..benchmarks.stub_backends import fake_question_text
+from ..models import Competence, Question
+from .helpers import CurriculumMixin
+
+
+class BatchGenerationTests(CurriculumMixin, TestCase):
+    """generate_questions_batch_task in eager mode, the model call replaced by `generate_item`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = Competence.objects.create(description='Soustraire', id_thematique=cls.thematique)
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.generated = 0
+        self.running = 0
+        self.peak = 0
+        self.barrier = None
+        self.enterContext(mock.patch.object(tasks, '_generate_question_item', self.generate_item))
+
+    def generate_item(self, competence_id, question_type, model_name):
+        with self.lock:
+            self.generated += 1
+            number = self.generated
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            if self.barrier is not None:
+                self.barrier.wait()
+            if competence_id == self.other.id:
+                raise ValueError('sortie invalide')
+            return {
+                'question': fake_question_text(number),
+                'type': question_type,
+                'answers': [{'text': str(number), 'is_correct': True}],
+                'competence_id': competence_id,
+                'thematique_id': self.thematique.id,
+            }
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def test_summary_lists_the_saved_questions(self):
+        summary = tasks.generate_questions_batch_task([self.competence.id], count_per_competence=3)
+        self.assertEqual((summary['total'], summary['succeeded'], summary['failed']), (3, 3, 0))
+        saved = Question.objects.filter(id__in=summary['question_ids'])
+        self.assertEqual(saved.filter(id_competence=self.competence, reponses__valide=True).count(), 3)
+
+    def test_failed_items_do_not_stop_the_batch(self):
+        summary = tasks.generate_questions_batch_task([self.competence.id, self.other.id], count_per_competence=2)
+        self.assertEqual((summary['total'], summary['succeeded'], summary['failed']), (4, 2, 2))
+        self.assertEqual({failure['competence_id'] for failure in summary['failures']}, {self.other.id})
+        self.assertIn('sortie invalide', summary['failures'][0]['message'])
+        self.assertEqual(Question.objects.count(), 2)
+
+    @override_settings(GENERATION_BATCH_CONCURRENCY={'ollama': 2, 'local': 1})
+    def test_items_run_in_parallel(self):
+        # Each item waits for the other one: the batch only succeeds if both run at once
+        self.barrier = threading.Barrier(2, timeout=5)
+        summary = tasks.generate_questions_batch_task([self.competence.id], count_per_competence=2)
+        self.assertEqual(summary['succeeded'], 2)
+        self.assertEqual(self.peak, 2)
+
+    @override_settings(GENERATION_BATCH_CONCURRENCY={'ollama': 4, 'local': 1})
+    def test_local_models_get_the_local_concurrency(self):
+        summary = tasks.generate_questions_batch_task([self.competence.id], count_per_competence=4, model_name='local')
+        self.assertEqual(summary['succeeded'], 4)
+        self.assertEqual(self.peak, 1)
+
+    def test_repeated_questions_are_saved_once(self):
+        self.generate_item = lambda competence_id, question_type, model_name: {
+            'question': fake_question_text(1), 'type': question_type, 'answers': [], 'competence_id': competence_id,
+        }
+        with mock.patch.object(tasks, '_generate_question_item', self.generate_item):
+            summary = tasks.generate_questions_batch_task([self.competence.id], count_per_competence=3)
+        self.assertEqual((summary['succeeded'], summary['failed']), (1, 2))
+        self.assertIn('double', summary['failures'][0]['message'])
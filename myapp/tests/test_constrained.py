@@ -0,0 +1,48 @@
+from django.test import SimpleTestCase
+
+from ..services.constrained import JsonSchemaGrammar, SentenceGrammar, grammar_from_spec
+
+
+class ConstrainedDecodingTests(SimpleTestCase):
+    SCHEMA = {
+        'type': 'object',
+        'properties': {
+            'question': {'type': 'string', 'minLength': 1, 'maxLength': 40},
+            'reponses': {'type': 'array', 'items': {'type': 'boolean'}, 'minItems': 1, 'maxItems': 2},
+        },
+        'required': ['question', 'reponses'],
+    }
+
+    def advance(self, grammar, text):
+        return grammar.advance(grammar.initial(), text)
+
+    def test_valid_document_completes(self):
+        grammar = JsonSchemaGrammar(self.SCHEMA)
+        state = self.advance(grammar, '{"question": "Combien ?", "reponses": [true, false]}')
+        self.assertIsNotNone(state)
+        self.assertTrue(grammar.is_complete(state))
+
+    def test_prefix_is_valid_but_not_complete(self):
+        grammar = JsonSchemaGrammar(self.SCHEMA)
+        state = self.advance(grammar, '{"question": "Comb')
+        self.assertIsNotNone(state)
+        self.assertFalse(grammar.is_complete(state))
+
+    def test_rejects_text_outside_the_schema(self):
+        grammar = JsonSchemaGrammar(self.SCHEMA)
+        self.assertIsNone(self.advance(grammar, 'Sure! {'))
+        self.assertIsNone(self.advance(grammar, '{"autre": 1}'))
+        self.assertIsNone(self.advance(grammar, '{"question": "a", "reponses": [true, true, true]}'))
+        self.assertIsNone(self.advance(grammar, '{"question": "a", "reponses": ["oui"]}'))
+
+    def test_sentence_grammar_requires_one_question(self):
+        grammar = SentenceGrammar(min_words=3)
+        self.assertTrue(grammar.is_complete(self.advance(grammar, 'Combien font 2 + 2 ?')))
+        self.assertIsNone(self.advance(grammar, 'Sure?'))
+        self.assertIsNone(self.advance(grammar, 'Combien font 2 + 2 ? Merci'))
+
+    def test_grammar_round_trips_through_its_spec(self):
+        grammar = grammar_from_spec(JsonSchemaGrammar(self.SCHEMA).spec())
+        self.assertEqual(grammar.name, JsonSchemaGrammar(self.SCHEMA).name)
+        with self.assertRaises(ValueError):
+            grammar_from_spec({'type': 'inconnu'})
@@ -0,0 +1,56 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from ..models import Competence, Matiere, SousCompetence, Thematique
+from ..reference_cache import CACHE_ALIAS
+from .helpers import CurriculumMixin
+
+
+class CurriculumTreeTests(CurriculumMixin, TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_tree_nests_every_level(self):
+        tree = self.get('/api/tree/')
+        self.assertEqual(tree['niveaux'], [{'id': self.niveau.id, 'type': 'niveau', 'nom': 'CE2'}])
+        [matiere] = tree['matieres']
+        sous_competence = matiere['thematiques'][0]['competences'][0]['sous_competences'][0]
+        self.assertEqual(sous_competence, {
+            'id': self.sous_competence.id, 'type': 'sous-competence', 'description': 'Additions sans retenue',
+        })
+
+    def test_query_count_does_not_grow_with_the_tree(self):
+        with CaptureQueriesContext(connection) as small:
+            self.get('/api/tree/')
+        for index in range(3):
+            matiere = Matiere.objects.create(nom=f'Matière {index}')
+            thematique = Thematique.objects.create(nom='Thème', id_matiere=matiere)
+            competence = Competence.objects.create(description='Compétence', id_thematique=thematique)
+            SousCompetence.objects.create(description='Sous-compétence', id_competence=competence)
+        caches[CACHE_ALIAS].clear()
+        with CaptureQueriesContext(connection) as large:
+            tree = self.get('/api/tree/')
+        self.assertEqual(len(tree['matieres']), 4)
+        self.assertEqual(len(large), len(small))
+
+    def test_subtree_depth_and_fields(self):
+        subtree = self.get(f'/api/tree/thematique/{self.thematique.id}/?depth=1&fields=nom')
+        self.assertEqual(subtree, {
+            'id': self.thematique.id, 'type': 'thematique', 'nom': 'Nombres',
+            'competences': [{'id': self.competence.id, 'type': 'competence'}],
+        })
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/tree/inconnu/1/').status_code, 400)
+        self.assertEqual(self.client.get('/api/tree/?depth=-1').status_code, 400)
+        self.assertEqual(self.client.get('/api/tree/?depth=deux').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/tree/competence/{self.competence.id + 1000}/').status_code, 404)
@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from ..benchmarks.stub_backends import fake_question, fake_question_text
+from ..models import Question
+from ..services.dedup import DuplicateChecker, find_similar, jaccard, minhash, shingles, text_buckets
+from .helpers import CurriculumMixin, StubBackendsMixin
+
+
+class MinHashTests(SimpleTestCase):
+    def test_signature_and_buckets_are_deterministic(self):
+        text = 'Combien font 7 + 8 ?'
+        self.assertEqual(minhash(shingles(text)), minhash(shingles(text)))
+        self.assertEqual(text_buckets(text), text_buckets('  combien FONT 7 + 8 ? '))
+
+    def test_similar_texts_share_buckets(self):
+        a = 'Quelle est la capitale de la France et son fleuve principal ?'
+        b = 'Quelle est la capitale de la France et son fleuve principal?'
+        c = fake_question_text(1)
+        self.assertGreater(jaccard(shingles(a), shingles(b)), 0.9)
+        self.assertTrue(set(text_buckets(a)) & set(text_buckets(b)))
+        self.assertFalse(set(text_buckets(a)) & set(text_buckets(c)))
+
+
+class DedupTests(CurriculumMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.question = Question.objects.create(
+            description='Combien font 12 + 15 dans la cour de récréation ?', type='qcm', id_competence=cls.competence,
+        )
+
+    def test_find_similar_uses_the_index(self):
+        matches = find_similar('Combien font 12 + 15 dans la cour de récréation?')
+        self.assertEqual([question_id for question_id, _ in matches], [self.question.id])
+        self.assertEqual(find_similar(fake_question_text(3)), [])
+
+    def test_checker_rejects_existing_and_repeated_questions(self):
+        checker = DuplicateChecker(self.competence.id)
+        self.assertTrue(checker('Combien font 12 + 15 dans la cour de récréation ?'))
+        self.assertEqual(checker.rejected['Combien font 12 + 15 dans la cour de récréation ?'], self.question.id)
+        self.assertFalse(checker(fake_question_text(4)))
+        self.assertTrue(checker(fake_question_text(4)))
+
+
+class GenerateWithoutDuplicatesTests(CurriculumMixin, StubBackendsMixin, TestCase):
+    def test_existing_question_is_generated_again(self):
+        # The stub model answers with question 1 first, already in the bank
+        Question.objects.create(description=fake_question(1)['question'], type='quiz', id_competence=self.competence)
+        response = APIClient().post('/api/generate/question/', self.generation_body(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['question']['description'], fake_question(2)['question'])
+        self.assertEqual(self.ollama.calls, 2)
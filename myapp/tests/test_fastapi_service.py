@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import pedagogieQuestions_logic as logic
+import questionsGenerator as service
+
+from ..benchmarks.stub_backends import stub_backends
+from .helpers import MODEL_PATH
+
+REQUEST = service.QuestionRequest(
+    school_level='CE2', module='Mathématiques', thematic='Nombres', competence='Additionner',
+    sous_competence='Additions sans retenue', num_questions=2,
+)
+
+
+class ConnectedRequest:
+    """Stands for the starlette Request: only `is_disconnected` is used by the endpoints."""
+
+    disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+class DisconnectedRequest(ConnectedRequest):
+    disconnected = True
+
+
+def body(response):
+    return json.loads(response.body)
+
+
+class FastAPIServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = service.InferenceExecutor(workers=1, max_queue=0)
+        self.enterContext(mock.patch.object(service, 'executor', self.executor))
+        self.enterContext(mock.patch.object(service, 'DISCONNECT_POLL', 0.01))
+        self.enterContext(mock.patch.object(service, 'stream_answer', self.stream_answer))
+
+    @staticmethod
+    def stream_answer(**params):
+        yield from ['1. Combien font ', '2 + 2 ?\n', '2. Et 3 + 4 ?']
+
+    def block_executor(self):
+        """Fill the only slot of the executor; returns the event that frees it."""
+        release = threading.Event()
+        [(future, _)] = self.executor.submit(lambda item, cancel: release.wait(5), None)
+        self.addCleanup(future.result, 5)
+        self.addCleanup(release.set)
+        return release
+
+    def test_generate_questions(self):
+        data = asyncio.run(service.generate_pedagogical_questions(REQUEST, ConnectedRequest()))
+        self.assertEqual(data, {'questions': '1. Combien font 2 + 2 ?\n2. Et 3 + 4 ?', 'status': 'success'})
+
+    def test_full_queue_answers_429(self):
+        self.block_executor()
+        response = asyncio.run(service.generate_pedagogical_questions(REQUEST, ConnectedRequest()))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], str(service.RETRY_AFTER))
+        batch = service.BatchQuestionRequest(requests=[REQUEST])
+        self.assertEqual(asyncio.run(service.generate_pedagogical_questions_batch(batch, ConnectedRequest())).status_code, 429)
+        self.assertEqual(asyncio.run(service.stream_pedagogical_questions(REQUEST)).status_code, 429)
+
+    def test_batch_size_is_bounded(self):
+        batch = service.BatchQuestionRequest(requests=[REQUEST] * (service.MAX_BATCH + 1))
+        response = asyncio.run(service.generate_pedagogical_questions_batch(batch, ConnectedRequest()))
+        self.assertEqual(response.status_code, 400)
+
+    def test_disconnected_client_cancels_the_generation(self):
+        started = threading.Event()
+
+        def generate(item, cancel):
+            started.set()
+            cancel.wait(5)
+            return 'annulé' if cancel.is_set() else 'terminé'
+
+        jobs = self.executor.submit(generate, None)
+        self.assertTrue(started.wait(5))
+        with self.assertRaises(service.ClientDisconnected):
+            asyncio.run(service._until_disconnected(DisconnectedRequest(), jobs))
+        [(future, cancel)] = jobs
+        self.assertTrue(cancel.is_set())
+        self.assertEqual(future.result(5), 'annulé')
+
+    def test_disconnected_client_gets_499(self):
+        def endless(**params):
+            # Stops only once the endpoint cancels the job (checked between two chunks)
+            while True:
+                yield 'Combien '
+
+        with mock.patch.object(service, 'stream_answer', endless):
+            response = asyncio.run(service.generate_pedagogical_questions(REQUEST, DisconnectedRequest()))
+        self.assertEqual((response.status_code, body(response)['status']), (499, 'error'))
+
+    def test_stream_sends_tokens_then_done(self):
+        async def read():
+            response = await service.stream_pedagogical_questions(REQUEST)
+            self.assertEqual(response.media_type, 'text/event-stream')
+            return ''.join([chunk async for chunk in response.body_iterator])
+
+        events = [block.split('\n') for block in asyncio.run(read()).strip().split('\n\n')]
+        names = [lines[0].removeprefix('event: ') for lines in events]
+        self.assertEqual(names, ['token', 'token', 'token', 'done'])
+        self.assertEqual(json.loads(events[-1][1].removeprefix('data: '))['status'], 'success')
+
+
+class ReadinessTests(SimpleTestCase):
+    def ready(self, status, server=None):
+        with mock.patch.object(service, 'load_status', return_value={'status': status, 'error': None}), \
+                mock.patch.object(service, 'get_model_server_client', return_value=server):
+            return asyncio.run(service.readiness_check())
+
+    def test_not_ready_until_the_model_is_loaded(self):
+        for status in ('idle', 'loading', 'error'):
+            with self.subTest(status=status):
+                self.assertEqual(self.ready(status).status_code, 503)
+        self.assertEqual(self.ready('ready').status_code, 200)
+
+    def test_model_server_must_be_ready_too(self):
+        server = mock.Mock(**{'ready.return_value': False})
+        response = self.ready('ready', server)
+        self.assertEqual((response.status_code, body(response)['status']), (503, 'loading'))
+        server.ready.return_value = True
+        self.assertEqual(self.ready('ready', server).status_code, 200)
+
+    def test_health_check_answers_while_loading(self):
+        with mock.patch.object(service, 'load_status', return_value={'status': 'loading', 'error': None}):
+            self.assertEqual(asyncio.run(service.health_check())['status'], 'ok')
+
+
+class LazyLoadingTests(SimpleTestCase):
+    def setUp(self):
+        self.enterContext(stub_backends(token_latency=0, tokens=8))
+        self.enterContext(mock.patch.object(logic, '_llm', None))
+        self.enterContext(mock.patch.object(logic, 'model_file', MODEL_PATH))
+        self.enterContext(mock.patch.dict(logic._load_state, status='idle', error=None))
+
+    def test_model_is_loaded_once_by_warm_up(self):
+        self.assertEqual(logic.load_status()['status'], 'idle')
+        state = logic.warm_up()
+        self.assertEqual((state['status'], state['model']), ('ready', 'fake-model.gguf'))
+        llm = logic.get_llm()
+        logic.warm_up()
+        self.assertIs(logic.get_llm(), llm)
+        self.assertTrue(logic.clean_answer(''.join(logic.stream_answer(**REQUEST.model_dump()))))
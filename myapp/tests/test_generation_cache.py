@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..services import generation_cache
+from ..services.generation_cache import CacheBackend, GenerationCache, LRUBackend, Uncacheable, build_generation_cache
+from ..services.ctransformers_client import generate_json_locally
+from ..services.llm_client import generate_json_with_model
+from .helpers import MODEL_PATH, StubBackendsMixin
+
+
+class GenerationCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = GenerationCache(LRUBackend(max_entries=10), variants=2)
+        self.key = GenerationCache.make_key('prompt', 'modèle', {'temperature': 0.7})
+
+    def test_key_depends_on_prompt_model_and_params(self):
+        self.assertEqual(self.key, GenerationCache.make_key('prompt', 'modèle', {'temperature': 0.7}))
+        self.assertNotEqual(self.key, GenerationCache.make_key('prompt', 'modèle', {'temperature': 0.8}))
+        self.assertNotEqual(self.key, GenerationCache.make_key('prompt', 'autre', {'temperature': 0.7}))
+
+    def test_serves_variants_once_enough_are_known(self):
+        outputs = iter(['A', 'B', 'C'])
+        results = [self.cache.get_or_generate(self.key, lambda: next(outputs)) for _ in range(4)]
+        self.assertEqual(results[:2], ['A', 'B'])
+        self.assertEqual(set(results[2:]), {'A', 'B'})
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_repeated_output_completes_the_entry(self):
+        self.cache.store(self.key, 'A')
+        self.cache.store(self.key, 'A')
+        self.assertEqual(self.cache.lookup(self.key), 'A')
+
+    def test_stream_stored_only_when_fully_consumed(self):
+        stream = self.cache.stream_through(self.key, lambda: iter(['a', 'b', 'c']))
+        next(stream)
+        stream.close()
+        self.assertIsNone(self.cache.backend.get(self.key))
+        self.assertEqual(''.join(self.cache.stream_through(self.key, lambda: iter(['a', 'b']))), 'ab')
+        self.assertEqual(self.cache.backend.get(self.key)['variants'], ['ab'])
+
+    def test_uncacheable_output_is_returned_but_not_stored(self):
+        def reject():
+            raise Uncacheable('pas du JSON')
+
+        self.assertEqual(self.cache.get_or_generate(self.key, reject), 'pas du JSON')
+        self.assertIsNone(self.cache.backend.get(self.key))
+        self.assertEqual(self.cache.get_or_generate(self.key, lambda: 'A'), 'A')
+
+    def test_backend_must_implement_every_operation(self):
+        class GetOnly(CacheBackend):
+            def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            GetOnly()
+        cache = build_generation_cache('none')
+        self.assertEqual(cache.get_or_generate(self.key, lambda: 'A'), 'A')
+        self.assertIsNone(cache.lookup(self.key))
+
+
+class JsonGenerationCacheTests(StubBackendsMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = GenerationCache(LRUBackend(), variants=1)
+        self.enterContext(mock.patch.object(generation_cache, '_CACHE', self.cache))
+
+    def test_rejected_completion_is_generated_again(self):
+        for _ in range(2):
+            generate_json_with_model('Génère 1 questions', accept=lambda value: False)
+        self.assertEqual(self.ollama.calls, 2)
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+    def test_accepted_completion_is_served_from_the_cache(self):
+        outputs = [generate_json_with_model('Génère 1 questions', accept=lambda value: True) for _ in range(2)]
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(self.ollama.calls, 1)
+
+    def test_local_completion_without_json_is_generated_again(self):
+        # The fake local model answers with plain text: no JSON value to accept
+        for _ in range(2):
+            generate_json_locally('Génère 1 questions', MODEL_PATH)
+        self.assertEqual(self.cache.stats()['hits'], 0)
@@ -0,0 +1,77 @@
+import contextvars
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from ..benchmarks.stub_backends import FakeModel
+from ..services.ctransformers_client import PRIORITY_BATCH, PRIORITY_INTERACTIVE, ModelPoolBusy
+from ..services.inference_scheduler import DeadlineExceeded, InferenceScheduler
+from .helpers import MODEL_PATH, fake_pool
+
+
+class InferenceSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = InferenceScheduler(fake_pool(), workers=1, max_queue=4, batch_window=0)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def block_worker(self):
+        """Occupy the only worker until self.release is set."""
+        started = threading.Event()
+
+        def work(model):
+            started.set()
+            self.release.wait(5)
+
+        future = self.scheduler.submit(MODEL_PATH, 'bloquant', work)
+        self.assertTrue(started.wait(5))
+        return future
+
+    def test_run_returns_the_result_or_raises(self):
+        self.assertIsInstance(self.scheduler.run(MODEL_PATH, 'p', lambda model: model), FakeModel)
+        with self.assertRaises(ZeroDivisionError):
+            self.scheduler.run(MODEL_PATH, 'p', lambda model: 1 / 0)
+
+    def test_interactive_requests_go_first(self):
+        self.block_worker()
+        order = []
+        batch = self.scheduler.submit(MODEL_PATH, 'x', lambda m: order.append('batch'), priority=PRIORITY_BATCH)
+        interactive = self.scheduler.submit(MODEL_PATH, 'y', lambda m: order.append('interactive'),
+                                            priority=PRIORITY_INTERACTIVE)
+        self.release.set()
+        batch.result(5), interactive.result(5)
+        self.assertEqual(order, ['interactive', 'batch'])
+
+    def test_request_not_started_before_its_deadline_fails(self):
+        self.block_worker()
+        late = self.scheduler.submit(MODEL_PATH, 'x', lambda m: 'trop tard', timeout=0.01)
+        time.sleep(0.05)
+        self.release.set()
+        with self.assertRaises(DeadlineExceeded):
+            late.result(5)
+        self.assertEqual(self.scheduler.stats()['expired'], 1)
+
+    def test_identical_pending_requests_are_merged(self):
+        self.block_worker()
+        calls = []
+        futures = [self.scheduler.submit(MODEL_PATH, 'x', lambda m: calls.append(1) or 'texte', key='k')
+                   for _ in range(3)]
+        self.release.set()
+        self.assertEqual([future.result(5) for future in futures], ['texte'] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.scheduler.stats()['merged'], 2)
+
+    def test_full_queue_is_rejected(self):
+        self.block_worker()
+        for index in range(4):
+            self.scheduler.submit(MODEL_PATH, f'{index}', lambda m: None)
+        with self.assertRaises(ModelPoolBusy):
+            self.scheduler.submit(MODEL_PATH, 'encore', lambda m: None)
+
+    def test_work_runs_in_the_submitter_context(self):
+        variable = contextvars.ContextVar('variable', default=None)
+        variable.set('requête')
+        self.assertEqual(self.scheduler.run(MODEL_PATH, 'p', lambda model: variable.get()), 'requête')
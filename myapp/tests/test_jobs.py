@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ..models import GenerationJob, Question
+from ..tasks import run_generation_job_task
+from .helpers import CurriculumMixin, StubBackendsMixin
+
+
+class GenerationJobApiTests(CurriculumMixin, StubBackendsMixin, TestCase):
+    url = '/api/generate/jobs/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def create_job(self, **fields):
+        """POST a job; it is dispatched on commit, which the test runs by hand instead."""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(self.url, self.generation_body(**fields), format='json')
+        self.assertEqual(len(callbacks), 1 if response.status_code == 202 else 0)
+        return response
+
+    def test_create_answers_202_with_the_job_location(self):
+        response = self.create_job(count=2)
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], GenerationJob.STATUS_PENDING)
+        self.assertEqual(response['Location'], f"/api/generate/jobs/{job['id']}/")
+        self.assertEqual(GenerationJob.objects.get(id=job['id']).params['count'], 2)
+
+    def test_invalid_requests_create_no_job(self):
+        for fields in ({'format': ''}, {'count': 11}, {'competence_id': 999999}):
+            with self.subTest(fields=fields):
+                self.assertEqual(self.create_job(**fields).status_code, 400)
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_job_runs_to_completion(self):
+        job_id = self.create_job(count=2).json()['id']
+        run_generation_job_task(job_id)
+        job = self.client.get(f'{self.url}{job_id}/').json()
+        self.assertEqual(job['status'], GenerationJob.STATUS_SUCCEEDED)
+        self.assertEqual(job['progress'], 100)
+        self.assertEqual(len(job['question_ids']), 2)
+        self.assertEqual(Question.objects.filter(id__in=job['question_ids'], id_competence=self.competence).count(), 2)
+
+    def test_cancelled_job_never_runs(self):
+        job_id = self.create_job().json()['id']
+        response = self.client.post(f'{self.url}{job_id}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], GenerationJob.STATUS_CANCELLED)
+        run_generation_job_task(job_id)
+        self.assertEqual(self.ollama.calls, 0)
+        self.assertFalse(Question.objects.exists())
+
+    def test_finished_job_cannot_be_cancelled(self):
+        job_id = self.create_job().json()['id']
+        run_generation_job_task(job_id)
+        response = self.client.post(f'{self.url}{job_id}/cancel/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(GenerationJob.objects.get(id=job_id).status, GenerationJob.STATUS_SUCCEEDED)
+
+    def test_expired_job_is_not_found(self):
+        job_id = self.create_job().json()['id']
+        GenerationJob.objects.filter(id=job_id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.get(f'{self.url}{job_id}/').status_code, 404)
+        self.assertEqual(self.client.post(f'{self.url}{job_id}/cancel/').status_code, 404)
@@ -0,0 +1,33 @@
+import json
+
+from django.test import SimpleTestCase
+
+from ..services.json_stream import JsonStreamExtractor, loads_lenient, repair_json
+
+
+class JsonStreamTests(SimpleTestCase):
+    def test_repair_json_fixes_common_model_defects(self):
+        text = "{'question': 'L\\'eau ?', 'valide': True, 'notes': None, 'tags': ['a', 'b',],}"
+        self.assertEqual(
+            json.loads(repair_json(text)),
+            {'question': "L'eau ?", 'valide': True, 'notes': None, 'tags': ['a', 'b']},
+        )
+
+    def test_loads_lenient_raises_value_error_on_garbage(self):
+        self.assertEqual(loads_lenient('{"a": 1}'), {'a': 1})
+        with self.assertRaises(ValueError):
+            loads_lenient('pas du JSON')
+
+    def test_extractor_stops_at_the_first_accepted_value(self):
+        extractor = JsonStreamExtractor(accept=lambda value: 'question' in value)
+        chunks = ['Voici: {"autre": 1} puis {"quest', 'ion": "Combien {font} 2 + 2 ?"}', ' et du texte']
+        done = [extractor.feed(chunk) for chunk in chunks]
+        self.assertEqual(done, [False, True, True])
+        self.assertEqual(extractor.value, {'question': 'Combien {font} 2 + 2 ?'})
+        self.assertEqual(extractor.rejected, 1)
+        self.assertEqual(json.loads(extractor.text()), extractor.value)
+
+    def test_extractor_without_value_returns_the_raw_text(self):
+        extractor = JsonStreamExtractor()
+        self.assertFalse(extractor.feed('{"incomplet": '))
+        self.assertEqual(extractor.text(), '{"incomplet": ')
@@ -0,0 +1,46 @@
+import time
+
+from django.test import SimpleTestCase
+
+from ..services.ctransformers_client import ModelPoolBusy
+from .helpers import MODEL_PATH, fake_pool
+
+
+class ModelPoolTests(SimpleTestCase):
+    def test_loads_replicas_up_to_the_limit(self):
+        pool = fake_pool(max_replicas=2, acquire_timeout=0.05)
+        with pool.acquire(MODEL_PATH) as first, pool.acquire(MODEL_PATH) as second:
+            self.assertIsNot(first, second)
+            with self.assertRaises(ModelPoolBusy):
+                with pool.acquire(MODEL_PATH):
+                    pass
+        self.assertEqual(pool.stats()[0]['replicas'], 2)
+
+    def test_full_waiting_queue_fails_immediately(self):
+        pool = fake_pool(max_replicas=1, max_waiting=0, acquire_timeout=5)
+        with pool.acquire(MODEL_PATH):
+            started = time.monotonic()
+            with self.assertRaises(ModelPoolBusy):
+                with pool.acquire(MODEL_PATH):
+                    pass
+            self.assertLess(time.monotonic() - started, 1)
+
+    def test_replica_reused_for_the_longest_shared_prefix(self):
+        pool = fake_pool(max_replicas=2)
+        with pool.acquire(MODEL_PATH, prompt='Consignes A, compétence 1') as a, \
+                pool.acquire(MODEL_PATH, prompt='Autres consignes, compétence 2') as b:
+            pass
+        with pool.acquire(MODEL_PATH, prompt='Autres consignes, compétence 3') as replica:
+            self.assertIs(replica, b)
+        with pool.acquire(MODEL_PATH, prompt='Consignes A, compétence 4') as replica:
+            self.assertIs(replica, a)
+        self.assertEqual(pool.stats()[0]['prefix_hits'], 2)
+
+    def test_evict_unloads_idle_models(self):
+        pool = fake_pool()
+        with pool.acquire(MODEL_PATH) as first:
+            pass
+        pool.evict()
+        self.assertEqual(pool.stats(), [])
+        with pool.acquire(MODEL_PATH) as second:
+            self.assertIsNot(first, second)
@@ -0,0 +1,61 @@
+import json
+import threading
+
+import requests
+from django.test import SimpleTestCase
+
+from ..benchmarks.stub_backends import stub_backends
+from ..services.ctransformers_client import ModelServerClient
+from ..services.model_server import ModelServer
+from .helpers import MODEL_PATH
+
+
+class ModelServerTests(SimpleTestCase):
+    def setUp(self):
+        self.enterContext(stub_backends(token_latency=0, tokens=8))
+        self.server = ModelServer(('127.0.0.1', 0), MODEL_PATH)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def generate(self, **body):
+        return requests.post(f'{self.url}/generate', json={'prompt': 'Une question ?', **body}, timeout=5)
+
+    def test_ready_only_after_warm_up(self):
+        self.assertEqual(requests.get(f'{self.url}/healthz', timeout=5).status_code, 200)
+        loading = requests.get(f'{self.url}/readyz', timeout=5)
+        self.assertEqual((loading.status_code, loading.json()['status']), (503, 'loading'))
+        self.server.warm_up()
+        ready = requests.get(f'{self.url}/readyz', timeout=5)
+        self.assertEqual((ready.status_code, ready.json()['model']), (200, 'fake-model.gguf'))
+
+    def test_generate_returns_the_text(self):
+        response = self.generate(max_new_tokens=8, temperature=0.2)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['text'])
+
+    def test_stream_sends_ndjson_lines_then_done(self):
+        response = self.generate(stream=True)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+        self.assertEqual(lines[-1], {'done': True})
+        self.assertTrue(all(line['text'] for line in lines[:-1]))
+
+    def test_invalid_requests(self):
+        self.assertEqual(requests.post(f'{self.url}/generate', data=b'{', timeout=5).status_code, 400)
+        self.assertEqual(self.generate(prompt='').status_code, 400)
+        self.assertEqual(self.generate(max_new_tokens='beaucoup').status_code, 400)
+        self.assertEqual(self.generate(model='../secret.gguf').status_code, 400)
+        self.assertEqual(requests.post(f'{self.url}/inconnu', json={}, timeout=5).status_code, 404)
+        self.assertEqual(requests.get(f'{self.url}/inconnu', timeout=5).status_code, 404)
+
+    def test_client_round_trip(self):
+        client = ModelServerClient(self.url)
+        self.assertFalse(client.ready())
+        self.server.warm_up()
+        self.assertTrue(client.ready())
+        params = {'max_new_tokens': 8}
+        text = client.generate('Une question ?', MODEL_PATH, params)
+        self.assertTrue(text)
+        self.assertTrue(''.join(client.stream('Une question ?', MODEL_PATH, params)))
@@ -0,0 +1,45 @@
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ..models import Niveau
+from ..reference_cache import CACHE_ALIAS
+from .helpers import CurriculumMixin
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Niveau.objects.bulk_create([Niveau(nom=f'Niveau {index}') for index in range(5)])
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+
+    def test_pages_follow_next_in_id_order(self):
+        client = APIClient()
+        url, ids = '/api/niveaux/?page_size=2', []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertEqual(set(page), {'next', 'previous', 'results'})
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [niveau['id'] for niveau in page['results']]
+            url = page['next']
+        self.assertEqual(ids, sorted(Niveau.objects.values_list('id', flat=True)))
+
+
+class SparseFieldsetTests(CurriculumMixin, TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.client = APIClient()
+
+    def test_fields_keeps_only_the_listed_fields(self):
+        [competence] = self.client.get('/api/competences/?fields=id,description').json()['results']
+        self.assertEqual(competence, {'id': self.competence.id, 'description': 'Additionner'})
+
+    def test_expand_nests_the_related_object(self):
+        [competence] = self.client.get('/api/competences/?expand=id_thematique').json()['results']
+        self.assertEqual(competence['id_thematique']['nom'], 'Nombres')
+        [competence] = self.client.get('/api/competences/').json()['results']
+        self.assertEqual(competence['id_thematique'], self.thematique.id)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import tasks
+from ..benchmarks.stub_backends import stub_backends
+from ..services import providers
+from ..services.llm_client import OllamaClient
+from ..services.providers import LocalProvider, OllamaProvider, ProviderBusy, ProviderRegistry, build_provider
+from .helpers import MODEL_PATH
+
+
+class ProviderRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.ollama_server = self.enterContext(stub_backends(token_latency=0, tokens=12))
+        self.ollama = OllamaProvider('ollama', 'mistral', max_concurrency=1)
+        self.local = LocalProvider('local', MODEL_PATH, max_concurrency=1, fallback=True)
+        self.registry = ProviderRegistry([self.ollama, self.local])
+
+    def test_primary_provider_serves_first(self):
+        text = self.registry.generate('Génère 1 questions', use_cache=False)
+        self.assertIn('question', json.loads(text))
+        self.assertEqual(self.ollama_server.calls, 1)
+        self.assertIsNotNone(self.ollama.latency)
+        self.assertIsNone(self.local.latency)
+
+    def test_saturated_provider_falls_back(self):
+        self.assertTrue(self.ollama.acquire(0))
+        try:
+            text = self.registry.generate('Génère 1 questions', use_cache=False, wait=0.05)
+        finally:
+            self.ollama.release()
+        self.assertTrue(text.startswith('Question'))
+        self.assertEqual(self.ollama_server.calls, 0)
+
+    def test_every_provider_saturated_raises_provider_busy(self):
+        self.assertTrue(self.ollama.acquire(0) and self.local.acquire(0))
+        try:
+            with self.assertRaises(ProviderBusy):
+                self.registry.generate('x', use_cache=False, wait=0.05)
+        finally:
+            self.ollama.release()
+            self.local.release()
+
+    def test_failing_provider_is_put_in_cooldown(self):
+        self.ollama.client = OllamaClient(['http://127.0.0.1:9/api/generate'], max_retries=0)
+        with self.assertLogs('myapp.services.providers', 'WARNING'):
+            for _ in range(2):
+                self.assertTrue(self.registry.generate('x', use_cache=False).startswith('Question'))
+        self.assertFalse(self.ollama.healthy)
+        self.assertEqual(self.registry.route()[0], self.local)
+
+    def test_providers_restricts_the_choice(self):
+        self.registry.generate('x', use_cache=False, providers=['local'])
+        self.assertEqual(self.ollama_server.calls, 0)
+        with self.assertRaises(ValueError):
+            self.registry.generate('x', providers=['inconnu'])
+
+    def test_stream_yields_the_completion(self):
+        chunks = list(self.registry.stream('Génère 1 questions', use_cache=False))
+        self.assertGreater(len(chunks), 1)
+        self.assertIn('question', json.loads(''.join(chunks)))
+
+
+    def test_async_calls_run_off_the_event_loop(self):
+        async def call():
+            text = await self.registry.agenerate('Génère 1 questions', use_cache=False)
+            chunks = [chunk async for chunk in self.registry.astream('Génère 1 questions', use_cache=False)]
+            return text, ''.join(chunks)
+
+        text, streamed = asyncio.run(call())
+        self.assertIn('question', json.loads(text))
+        self.assertIn('question', json.loads(streamed))
+
+    def test_build_provider_from_settings_entry(self):
+        provider = build_provider({'backend': 'ctransformers', 'name': 'local', 'model': MODEL_PATH})
+        self.assertIsInstance(provider, LocalProvider)
+        with self.assertRaises(ValueError):
+            build_provider({'backend': 'inconnu', 'name': 'x', 'model': 'y'})
+
+
+class TaskProvidersTests(SimpleTestCase):
+    def setUp(self):
+        registry = ProviderRegistry([
+            OllamaProvider('ollama-mistral', 'mistral'),
+            OllamaProvider('ollama-llama', 'llama3'),
+            LocalProvider('local-llama', '/modeles/llama-2-7b.gguf', fallback=True),
+            LocalProvider('local-phi', '/modeles/phi-2.gguf'),
+        ])
+        self.enterContext(mock.patch.object(providers, '_REGISTRY', registry))
+
+    def test_model_name_selects_the_providers(self):
+        self.assertEqual(tasks._task_providers('local-phi'), ['local-phi'])
+        self.assertEqual(tasks._task_providers('local:phi-2'), ['local-phi'])
+        self.assertEqual(tasks._task_providers('local:inconnu'), ['local-llama', 'local-phi'])
+        self.assertEqual(tasks._task_providers('llama3'), ['ollama-llama', 'local-llama'])
+        self.assertEqual(tasks._task_providers('gemma'), ['ollama-mistral', 'ollama-llama', 'local-llama'])
+
+    def test_batch_backend(self):
+        self.assertEqual(tasks._batch_backend('local:phi-2'), 'local')
+        self.assertEqual(tasks._batch_backend('mistral'), 'ollama')
+
+
+class ProviderInterfaceTests(SimpleTestCase):
+    def test_backend_calls_must_be_implemented(self):
+        class GenerateOnly(providers.Provider):
+            def _generate(self, prompt, params, use_cache, schema, accept, priority):
+                return 'texte'
+
+        with self.assertRaises(TypeError):
+            providers.Provider('abstrait', 'modele')
+        with self.assertRaises(TypeError):
+            GenerateOnly('incomplet', 'modele')
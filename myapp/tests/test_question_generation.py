@@ -0,0 +1,81 @@
+import json
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from ..benchmarks.stub_backends import fake_question
+from ..models import Question
+from ..services.question_generation import GenerationError, generate_question_items
+from .helpers import CurriculumMixin, StubBackendsMixin
+
+
+def completion(*numbers):
+    return json.dumps({'questions': [fake_question(number) for number in numbers]}, ensure_ascii=False)
+
+
+class ScriptedModel:
+    """`generate` callable answering with the given completions in turn, recording each call."""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.calls = []
+
+    def __call__(self, prompt, use_cache=True, schema=None):
+        self.calls.append({'prompt': prompt, 'use_cache': use_cache, 'schema': schema})
+        return self.outputs.pop(0)
+
+
+class GenerateQuestionItemsTests(SimpleTestCase):
+    def generate(self, model, count=3, **options):
+        return generate_question_items(model, 'Niveau: CE2', 'quiz', 'easy', count=count, **options)
+
+    def test_one_call_for_the_whole_batch(self):
+        model = ScriptedModel(completion(1, 2, 3))
+        self.assertEqual(len(self.generate(model)), 3)
+        self.assertEqual(len(model.calls), 1)
+        self.assertIn('Génère 3 questions', model.calls[0]['prompt'])
+        self.assertEqual(model.calls[0]['schema']['properties']['questions']['minItems'], 3)
+
+    def test_missing_questions_are_topped_up_without_the_cache(self):
+        model = ScriptedModel(completion(1, 2), 'pas du JSON', completion(3))
+        items = self.generate(model)
+        self.assertEqual([text for text, _ in items], [fake_question(n)['question'] for n in (1, 2, 3)])
+        self.assertEqual([call['use_cache'] for call in model.calls], [True, False, False])
+        top_up = model.calls[1]['prompt']
+        self.assertIn('Génère 1 questions', top_up)
+        self.assertIn(fake_question(1)['question'], top_up)
+
+    def test_partial_batch_after_the_last_top_up(self):
+        model = ScriptedModel(completion(1), completion(1), completion(1))
+        self.assertEqual(len(self.generate(model)), 1)
+        self.assertEqual(len(model.calls), 3)
+
+    def test_duplicates_are_regenerated(self):
+        known = fake_question(1)['question']
+        model = ScriptedModel(completion(1, 2), completion(3))
+        items = self.generate(model, count=2, is_duplicate=lambda text: text == known)
+        self.assertEqual([text for text, _ in items], [fake_question(n)['question'] for n in (2, 3)])
+        self.assertIn(known, model.calls[1]['prompt'])
+
+    def test_no_usable_output_raises(self):
+        with self.assertRaises(GenerationError):
+            self.generate(ScriptedModel('{}', '[]', 'rien'))
+
+
+class GenerateSeveralQuestionsViewTests(CurriculumMixin, StubBackendsMixin, TestCase):
+    url = '/api/generate/question/'
+
+    def test_count_questions_from_one_model_call(self):
+        response = APIClient().post(self.url, self.generation_body(count=3), format='json')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual((data['requested'], data['generated'], len(data['questions'])), (3, 3, 3))
+        self.assertEqual(self.ollama.calls, 1)
+        self.assertEqual(Question.objects.filter(id_competence=self.competence).count(), 3)
+
+    def test_count_out_of_range_is_rejected(self):
+        for count in (-1, 11, 'beaucoup'):
+            with self.subTest(count=count):
+                response = APIClient().post(self.url, self.generation_body(count=count), format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.ollama.calls, 0)
@@ -0,0 +1,48 @@
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..benchmarks.stub_backends import fake_question
+from ..models import Question, Reponse
+from ..services.question_store import save_questions, serialize_saved
+from .helpers import CurriculumMixin
+
+
+def items(count, start=0, **context):
+    """`save_questions` items with four answers each."""
+    return [{**fake_question(number), 'type': 'quiz', **context} for number in range(start, start + count)]
+
+
+class SaveQuestionsTests(CurriculumMixin, TestCase):
+    def test_query_count_does_not_grow_with_the_batch(self):
+        with CaptureQueriesContext(connection) as one:
+            save_questions(items(1))
+        with CaptureQueriesContext(connection) as five:
+            saved = save_questions(items(5, start=1))
+        self.assertEqual(len(five), len(one))
+        self.assertEqual(len(saved), 5)
+        self.assertEqual(Reponse.objects.filter(id_question__in=[question.id for question, _ in saved]).count(), 20)
+
+    def test_saved_questions_carry_their_context_and_serialize_without_queries(self):
+        [(question, reponses)] = save_questions(items(
+            1, competence_id=self.competence.id, thematique_id=self.thematique.id, niveau_id=self.niveau.id,
+            difficulte='easy',
+        ))
+        stored = Question.objects.get(id=question.id)
+        self.assertEqual((stored.id_competence_id, stored.id_niveau_id, stored.difficulte),
+                         (self.competence.id, self.niveau.id, 'easy'))
+        with self.assertNumQueries(0):
+            data = serialize_saved(question, reponses)
+        self.assertEqual(len(data['reponses']), 4)
+        self.assertEqual(data['question']['id'], question.id)
+
+    def test_batch_is_saved_entirely_or_not_at_all(self):
+        batch = items(3)
+        batch[2]['answers'][0]['text'] = None
+        with self.assertRaises(IntegrityError):
+            save_questions(batch)
+        self.assertFalse(Question.objects.exists())
+
+    def test_empty_batch_runs_no_query(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(save_questions([]), [])
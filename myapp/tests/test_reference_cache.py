@@ -0,0 +1,68 @@
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ..models import Matiere, Niveau, ReferenceCacheVersion, Thematique
+from ..reference_cache import CACHE_ALIAS, bump_version, current_versions
+from .helpers import CurriculumMixin
+
+
+class ReferenceCacheTests(CurriculumMixin, TestCase):
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.client = APIClient()
+
+    def test_etag_and_not_modified(self):
+        first = self.client.get('/api/niveaux/')
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'])
+        again = self.client.get('/api/niveaux/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+    def test_cache_hit_only_reads_the_versions(self):
+        first = self.client.get('/api/niveaux/')
+        with self.assertNumQueries(1):
+            again = self.client.get('/api/niveaux/')
+        self.assertEqual(again.content, first.content)
+
+    def test_write_invalidates_the_responses_of_that_model(self):
+        niveaux = self.client.get('/api/niveaux/')
+        matieres = self.client.get('/api/matieres/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Niveau.objects.create(nom='CM1')
+        changed = self.client.get('/api/niveaux/', HTTP_IF_NONE_MATCH=niveaux['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('CM1', [niveau['nom'] for niveau in changed.json()['results']])
+        self.assertEqual(self.client.get('/api/matieres/', HTTP_IF_NONE_MATCH=matieres['ETag']).status_code, 304)
+
+    def test_filtered_views_follow_their_model(self):
+        url = f'/api/thematiques/matiere/{self.matiere.id}/'
+        self.assertEqual(len(self.client.get(url).json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Thematique.objects.create(nom='Géométrie', id_matiere=self.matiere)
+            Matiere.objects.create(nom='Français')
+        self.assertEqual(len(self.client.get(url).json()), 2)
+
+    def test_api_writes_invalidate_too(self):
+        self.client.get(f'/api/niveaux/{self.niveau.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/niveaux/{self.niveau.id}/', {'nom': 'CE1'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(f'/api/niveaux/{self.niveau.id}/').json()['nom'], 'CE1')
+
+    def test_versions_are_counted_in_the_database(self):
+        ReferenceCacheVersion.objects.all().delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(current_versions([Niveau, Matiere]), '0.0')
+        bump_version(Niveau)
+        bump_version(Niveau)
+        self.assertEqual(current_versions([Niveau, Matiere]), '2.0')
+
+    def test_versions_change_when_the_write_commits(self):
+        before = current_versions([Niveau])
+        with self.captureOnCommitCallbacks(execute=True):
+            Niveau.objects.create(nom='CM2')
+            # Not committed yet: other workers still read the old rows
+            self.assertEqual(current_versions([Niveau]), before)
+        self.assertNotEqual(current_versions([Niveau]), before)
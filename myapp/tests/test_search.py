@@ -0,0 +1,55 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ..models import Question
+from .helpers import CurriculumMixin
+
+
+class QuestionSearchTests(CurriculumMixin, TestCase):
+    url = '/api/questions/search/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.multiplication = Question.objects.create(
+            description='Combien font 3 multiplications de 4 par 2 ?', type='quiz',
+            id_competence=cls.competence, id_niveau=cls.niveau, difficulte='easy',
+        )
+        cls.addition = Question.objects.create(
+            description='Calcule la somme de 12 et 7.', type='question',
+            id_competence=cls.competence, id_niveau=cls.niveau, difficulte='hard',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_text_results_are_ranked(self):
+        data = self.search(q='multiplication')
+        self.assertEqual((data['query'], data['count']), ('multiplication', 1))
+        [result] = data['results']
+        self.assertEqual((result['id'], result['match']), (self.multiplication.id, 'fulltext'))
+        self.assertGreater(result['score'], 0)
+
+    def test_misspelling_falls_back_to_trigrams(self):
+        [result] = self.search(q='multiplcations')['results']
+        self.assertEqual((result['id'], result['match']), (self.multiplication.id, 'trigram'))
+
+    def test_filters_narrow_the_results(self):
+        self.assertEqual(self.search(q='somme', difficulte='hard')['count'], 1)
+        self.assertEqual(self.search(q='somme', difficulte='easy')['count'], 0)
+        self.assertEqual(self.search(q='somme', niveau_id=self.niveau.id + 1000)['count'], 0)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': '  '}).status_code, 400)
+        for limit in ('0', '101', 'dix'):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.client.get(self.url, {'q': 'somme', 'limit': limit}).status_code, 400)
+        response = self.client.get(self.url, {'q': 'somme', 'competence_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['field'], 'competence_id')
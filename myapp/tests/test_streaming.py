@@ -0,0 +1,84 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ..models import Question
+from .helpers import CurriculumMixin, StubBackendsMixin, stream_events
+
+
+class GenerateQuestionStreamingTests(CurriculumMixin, StubBackendsMixin, TestCase):
+    url = '/api/generate/question/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_plain_request_returns_the_saved_question(self):
+        response = self.client.post(self.url, self.generation_body(), format='json')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertTrue(Question.objects.filter(id=data['question']['id']).exists())
+        self.assertEqual(len(data['reponses']), 4)
+
+    def test_sse_relays_tokens_then_the_saved_question(self):
+        response = self.client.post(self.url, self.generation_body(stream='sse'), format='json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        events = stream_events(response)
+        names = [event for event, _ in events]
+        self.assertGreater(names.count('token'), 1)
+        self.assertEqual(names[-1], 'done')
+        streamed = ''.join(data['text'] for event, data in events if event == 'token')
+        done = events[-1][1]
+        self.assertIn(done['question']['description'], streamed)
+        self.assertTrue(Question.objects.filter(id=done['question']['id']).exists())
+
+    def test_ndjson_and_accept_header_select_the_format(self):
+        response = self.client.post(self.url, self.generation_body(stream='ndjson'), format='json')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(stream_events(response)[-1][0], 'done')
+        response = self.client.post(self.url, self.generation_body(), format='json', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+    def test_streamed_failure_ends_with_an_error_event(self):
+        self.ollama.shutdown()
+        self.ollama.server_close()
+        with self.assertLogs('myapp.services.providers', 'WARNING'):
+            response = self.client.post(self.url, self.generation_body(stream=True), format='json')
+            events = stream_events(response)
+        self.assertEqual(events[-1][0], 'error')
+        self.assertFalse(Question.objects.exists())
+
+
+class LocalGenerateStreamingTests(StubBackendsMixin, TestCase):
+    url = '/api/generate/local/'
+    body = {'niveau': 'CE2', 'thematique': 'Nombres', 'competence': 'Additionner'}
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_plain_request_returns_one_question(self):
+        response = self.client.post(self.url, self.body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['text'].endswith('?'))
+        self.assertIsNone(response.json()['duplicate_of'])
+
+    def test_invalid_sampling_options_are_rejected(self):
+        for field, value in (('max_new_tokens', 'abc'), ('temperature', 'chaud'), ('top_p', [0.9])):
+            with self.subTest(field=field):
+                response = self.client.post(self.url, {**self.body, field: value}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['field'], field)
+
+    def test_stream_ends_with_the_sanitized_question(self):
+        response = self.client.post(self.url, {**self.body, 'stream': 'ndjson'}, format='json')
+        events = stream_events(response)
+        self.assertEqual(events[0][0], 'token')
+        event, data = events[-1]
+        self.assertEqual(event, 'done')
+        self.assertTrue(data['text'].endswith('?'))
+        self.assertIn(data['text'].rstrip('?').strip()[-10:], ''.join(d['text'] for e, d in events if e == 'token'))
+
+    def test_missing_fields_are_rejected_before_streaming(self):
+        response = self.client.post(self.url, {'niveau': 'CE2', 'stream': True}, format='json')
+        self.assertEqual(response.status_code, 400)
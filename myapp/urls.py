@@ -3,10 +3,12 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     NiveauViewSet, MatiereViewSet, ThematiqueViewSet, CompetenceViewSet,
     SousCompetenceViewSet, QuestionViewSet, ReponseViewSet,
-    QuestionsByCompetenceView, QuestionsByThematiqueView,
+    QuestionsByCompetenceView, QuestionsByThematiqueView, QuestionSearchView,
     ThematiquesByMatiereView, CompetencesByThematiqueView,
     SousCompetencesByCompetenceView, ReponsesByQuestionView,
-    GenerateQuestionView, LocalLLMGenerateView
+    GenerateQuestionView, LocalLLMGenerateView,
+    GenerationJobCreateView, GenerationJobDetailView, GenerationJobCancelView,
+    CurriculumTreeView
 )
 
 router = DefaultRouter()
@@ -19,13 +21,20 @@ router.register(r'questions', QuestionViewSet)
 router.register(r'reponses', ReponseViewSet)
 
 urlpatterns = [
+    # Before the router, whose questions/<pk>/ route would capture "search"
+    path('questions/search/', QuestionSearchView.as_view(), name='questions-search'),
     path('', include(router.urls)),
     path('questions/competence/<int:competence_id>/', QuestionsByCompetenceView.as_view(), name='questions-by-competence'),
     path('questions/thematique/<int:thematique_id>/', QuestionsByThematiqueView.as_view(), name='questions-by-thematique'),
     path('thematiques/matiere/<int:matiere_id>/', ThematiquesByMatiereView.as_view(), name='thematiques-by-matiere'),
     path('competences/thematique/<int:thematique_id>/', CompetencesByThematiqueView.as_view(), name='competences-by-thematique'),
     path('sous-competences/competence/<int:competence_id>/', SousCompetencesByCompetenceView.as_view(), name='souscompetences-by-competence'),
+    path('tree/', CurriculumTreeView.as_view(), name='curriculum-tree'),
+    path('tree/<str:kind>/<int:root_id>/', CurriculumTreeView.as_view(), name='curriculum-subtree'),
     path('reponses/question/<int:question_id>/', ReponsesByQuestionView.as_view(), name='reponses-by-question'),
     path('generate/question/', GenerateQuestionView.as_view(), name='generate-question'),
     path('generate/local/', LocalLLMGenerateView.as_view(), name='generate-local'),
+    path('generate/jobs/', GenerationJobCreateView.as_view(), name='generation-job-create'),
+    path('generate/jobs/<uuid:job_id>/', GenerationJobDetailView.as_view(), name='generation-job-detail'),
+    path('generate/jobs/<uuid:job_id>/cancel/', GenerationJobCancelView.as_view(), name='generation-job-cancel'),
 ]
\ No newline at end of file
@@ -3,16 +3,21 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-import json
 
 from .models import (
     Niveau, Matiere, Thematique, Competence, SousCompetence,
-    Question, Reponse
+    Question, Reponse, GenerationJob
 )
 from .serializers import (
     NiveauSerializer, MatiereSerializer, ThematiqueSerializer, CompetenceSerializer,
-    SousCompetenceSerializer, QuestionSerializer, ReponseSerializer
+    SousCompetenceSerializer, QuestionSerializer, ReponseSerializer, GenerationJobSerializer
 )
+from .fieldsets import OptimizedQuerysetMixin
+from .reference_cache import CachedReferenceMixin, cached_json_response
+from .streaming import StreamingContentNegotiation, requested_stream_format, streaming_response
+
+# Reference data served from the reference cache (invalidated by signals.py)
+REFERENCE_MODELS = [Niveau, Matiere, Thematique, Competence, SousCompetence]
 
 
 class AllowAllPermission(permissions.BasePermission):
@@ -20,43 +25,43 @@ class AllowAllPermission(permissions.BasePermission):
         return True
 
 
-class NiveauViewSet(viewsets.ModelViewSet):
+class NiveauViewSet(CachedReferenceMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Niveau.objects.all()
     serializer_class = NiveauSerializer
     permission_classes = [AllowAllPermission]
 
 
-class MatiereViewSet(viewsets.ModelViewSet):
+class MatiereViewSet(CachedReferenceMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Matiere.objects.all()
     serializer_class = MatiereSerializer
     permission_classes = [AllowAllPermission]
 
 
-class ThematiqueViewSet(viewsets.ModelViewSet):
+class ThematiqueViewSet(CachedReferenceMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Thematique.objects.all()
     serializer_class = ThematiqueSerializer
     permission_classes = [AllowAllPermission]
 
 
-class CompetenceViewSet(viewsets.ModelViewSet):
+class CompetenceViewSet(CachedReferenceMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Competence.objects.all()
     serializer_class = CompetenceSerializer
     permission_classes = [AllowAllPermission]
 
 
-class SousCompetenceViewSet(viewsets.ModelViewSet):
+class SousCompetenceViewSet(CachedReferenceMixin, OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = SousCompetence.objects.all()
     serializer_class = SousCompetenceSerializer
     permission_classes = [AllowAllPermission]
 
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class QuestionViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
     permission_classes = [AllowAllPermission]
 
 
-class ReponseViewSet(viewsets.ModelViewSet):
+class ReponseViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Reponse.objects.all()
     serializer_class = ReponseSerializer
     permission_classes = [AllowAllPermission]
@@ -66,9 +71,7 @@ class QuestionsByCompetenceView(APIView):
     permission_classes = [AllowAllPermission]
 
     def get(self, request, competence_id):
-        questions = Question.objects.filter(
-            reponses__id_competence__id=competence_id
-        ).distinct()
+        questions = Question.objects.filter(id_competence_id=competence_id).order_by('id').prefetch_related('reponses')
         serializer = QuestionSerializer(questions, many=True)
         return Response(serializer.data)
 
@@ -77,38 +80,74 @@ class QuestionsByThematiqueView(APIView):
     permission_classes = [AllowAllPermission]
 
     def get(self, request, thematique_id):
-        questions = Question.objects.filter(
-            reponses__id_competence__id_thematique__id=thematique_id
-        ).distinct()
+        questions = Question.objects.filter(id_thematique_id=thematique_id).order_by('id').prefetch_related('reponses')
         serializer = QuestionSerializer(questions, many=True)
         return Response(serializer.data)
 
 
+class QuestionSearchView(APIView):
+    """
+    Recherche dans la banque de questions: `?q=` (syntaxe web: "expression exacte", or, -exclusion),
+    filtres `niveau_id`, `thematique_id`, `competence_id`, `sous_competence_id`, `type`, `difficulte`,
+    et `limit` (défaut 20, max 100). Résultats classés par pertinence, fautes de frappe tolérées.
+    """
+    permission_classes = [AllowAllPermission]
+    max_limit = 100
+
+    def get(self, request):
+        from .search import search_filters, search_questions
+
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': "Paramètre 'q' requis."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit') or 20)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            return Response({'error': f"'limit' doit être compris entre 1 et {self.max_limit}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            filters = search_filters(request.query_params)
+        except ValueError as exc:
+            field = str(exc)
+            return Response({'error': f"'{field}' doit être un entier.", 'field': field},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        questions = search_questions(text, filters, limit)
+        data = QuestionSerializer(questions, many=True, context={'request': request}).data
+        for item, question in zip(data, questions):
+            item['match'] = question.match
+            item['score'] = round(question.score, 4)
+        return Response({'query': text, 'count': len(data), 'results': data})
+
+
 class ThematiquesByMatiereView(APIView):
     permission_classes = [AllowAllPermission]
 
     def get(self, request, matiere_id):
-        thematiques = Thematique.objects.filter(id_matiere__id=matiere_id)
-        serializer = ThematiqueSerializer(thematiques, many=True)
-        return Response(serializer.data)
+        return cached_json_response(request, [Thematique], lambda: ThematiqueSerializer(
+            Thematique.objects.filter(id_matiere__id=matiere_id), many=True,
+        ).data)
 
 
 class CompetencesByThematiqueView(APIView):
     permission_classes = [AllowAllPermission]
 
     def get(self, request, thematique_id):
-        competences = Competence.objects.filter(id_thematique__id=thematique_id)
-        serializer = CompetenceSerializer(competences, many=True)
-        return Response(serializer.data)
+        return cached_json_response(request, [Competence], lambda: CompetenceSerializer(
+            Competence.objects.filter(id_thematique__id=thematique_id), many=True,
+        ).data)
 
 
 class SousCompetencesByCompetenceView(APIView):
     permission_classes = [AllowAllPermission]
 
     def get(self, request, competence_id):
-        sous_competences = SousCompetence.objects.filter(id_competence__id=competence_id)
-        serializer = SousCompetenceSerializer(sous_competences, many=True)
-        return Response(serializer.data)
+        return cached_json_response(request, [SousCompetence], lambda: SousCompetenceSerializer(
+            SousCompetence.objects.filter(id_competence__id=competence_id), many=True,
+        ).data)
 
 
 class ReponsesByQuestionView(APIView):
@@ -120,11 +159,83 @@ class ReponsesByQuestionView(APIView):
         return Response(serializer.data)
 
 
+class CurriculumTreeView(APIView):
+    """
+    Référentiel complet (niveaux + matières > thématiques > compétences > sous-compétences)
+    ou sous-arbre d'un nœud (/tree/<type>/<id>/), en une seule requête HTTP.
+    Paramètres: ?depth=<n> (niveaux sous la racine), ?fields=nom,description.
+    """
+    permission_classes = [AllowAllPermission]
+
+    def get(self, request, kind=None, root_id=None):
+        from .curriculum import LEVEL_KINDS, build_tree
+
+        if kind is not None and kind not in LEVEL_KINDS:
+            return Response({'error': f"Type de nœud inconnu: {kind}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        depth = request.query_params.get('depth')
+        if depth is not None:
+            try:
+                depth = int(depth)
+                if depth < 0:
+                    raise ValueError
+            except ValueError:
+                return Response({'error': "'depth' doit être un entier positif."}, status=status.HTTP_400_BAD_REQUEST)
+        fields = request.query_params.get('fields')
+        if fields is not None:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+
+        response = cached_json_response(
+            request, REFERENCE_MODELS, lambda: build_tree(kind, root_id, depth=depth, fields=fields),
+        )
+        if response is None:
+            return Response({'error': 'Nœud introuvable.'}, status=status.HTTP_404_NOT_FOUND)
+        return response
+
+
+def _requested_count(data, max_count):
+    """Number of questions asked for (default 1), or None when out of [1, max_count]."""
+    try:
+        count = int(data.get('count') or 1)
+    except (TypeError, ValueError):
+        return None
+    return count if 1 <= count <= max_count else None
+
+
+def _requested_number(data, field, cast, default=None):
+    """Numeric request option converted with `cast` (default when absent); ValueError(field) when invalid."""
+    value = data.get(field)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        raise ValueError(field)
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(field) from None
+
+
+def _requested_flag(value, default):
+    """Boolean request option: JSON booleans, or "1"/"true"/"yes" (case-insensitive)."""
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+
 class GenerateQuestionView(APIView):
     permission_classes = [AllowAllPermission]
+    content_negotiation_class = StreamingContentNegotiation
+    providers = None  # names from settings.LLM_PROVIDERS; None: routed among all of them
+    max_count = 10
 
     def post(self, request):
-        from .services.llm_client import generate_with_model
+        from .services.question_generation import (
+            GenerationError, build_questions_prompt, generate_question_items, resolve_generation_context,
+        )
+        from .services.dedup import duplicate_checker
+        from .services.question_store import generation_context_fields
 
         niveau_id = request.data.get('niveau_id')
         thematique_id = request.data.get('thematique_id')
@@ -136,88 +247,171 @@ class GenerateQuestionView(APIView):
         if not all([niveau_id, thematique_id, competence_id, format_, difficulte]):
             return Response({'error': 'Champs requis manquants.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        count = _requested_count(request.data, self.max_count)
+        if count is None:
+            return Response({'error': f"'count' doit être compris entre 1 et {self.max_count}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            niveau = Niveau.objects.get(id=niveau_id)
-            thematique = Thematique.objects.get(id=thematique_id)
-            competence = Competence.objects.get(id=competence_id)
-            sous_competence = None
-            if sous_competence_id:
-                sous_competence = SousCompetence.objects.get(id=sous_competence_id)
+            context = resolve_generation_context(niveau_id, thematique_id, competence_id, sous_competence_id)
         except Exception:
             return Response({'error': "Identifiants invalides fournis."}, status=status.HTTP_400_BAD_REQUEST)
 
-        task_description = competence.description
-        topic_text = f"Niveau: {niveau.nom} | Thématique: {thematique.nom} | Compétence: {task_description}"
-        if sous_competence:
-            topic_text += f" | Sous-compétence: {sous_competence.description}"
-
-        # Ask the model to return strict JSON that we can parse
-        prompt = (
-            "Tu es un expert en pédagogie. Génère une question et des réponses au format JSON strict.\n"
-            f"Contexte: {topic_text}.\n"
-            f"Format de question: {format_}. Difficulté: {difficulte}.\n"
-            "Contraintes:\n"
-            "- Réponds UNIQUEMENT avec du JSON valide, sans texte additionnel.\n"
-            "- Schéma attendu: {\n"
-            "  \"question\": \"texte de la question\",\n"
-            "  \"answers\": [ { \"text\": \"réponse\", \"is_correct\": true|false }, ... ]\n"
-            "}.\n"
-            "- Pour 'quiz': 1 bonne réponse et 3 distracteurs.\n"
-            "- Pour 'true-false': donne 2 entrées (Vrai et Faux) avec la bonne marquée is_correct=true.\n"
-            "- Pour 'question' (ouverte): fournis 1 \"réponse modèle\" (is_correct=true) et 2 pistes incorrectes.\n"
+        niveau = context['niveau']
+        thematique = context['thematique']
+        sous_competence = context['sous_competence']
+        task_description = context['competence'].description
+        topic_text = context['topic_text']
+
+        meta = {
+            'niveau': niveau.nom,
+            'thematique': thematique.nom,
+            'competence': task_description,
+            'sous_competence': sous_competence.description if sous_competence else '',
+            'difficulte': difficulte,
+        }
+        generation = (topic_text, format_, difficulte, count)
+        self.question_context = generation_context_fields(context, difficulte)
+        self.is_duplicate = duplicate_checker(context['competence'].id)
+
+        stream_format = requested_stream_format(request)
+        if stream_format:
+            # Ask the model to return strict JSON that we can parse
+            prompt = build_questions_prompt(topic_text, format_, difficulte, count)
+            return streaming_response(self._stream_events(prompt, generation, meta), stream_format)
+
+        try:
+            items = generate_question_items(self._generate, *generation, is_duplicate=self.is_duplicate)
+        except GenerationError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_502_BAD_GATEWAY)
+
+        return Response(self._save(items, generation, meta), status=status.HTTP_201_CREATED)
+
+    def _generate(self, prompt, use_cache=True, schema=None):
+        from .services.ctransformers_client import PRIORITY_INTERACTIVE
+        from .services.providers import get_provider_registry
+        from .services.question_generation import is_questions_payload
+
+        # Generation stops as soon as a complete, valid JSON payload has been emitted
+        return get_provider_registry().generate(
+            prompt, use_cache=use_cache, schema=schema, accept=is_questions_payload,
+            priority=PRIORITY_INTERACTIVE, providers=self.providers,
+        )
+
+    def _stream_events(self, prompt, generation, meta):
+        """Relay model tokens as they arrive, then persist and emit the parsed question(s)."""
+        from .services.ctransformers_client import PRIORITY_INTERACTIVE
+        from .services.json_stream import JsonStreamExtractor
+        from .services.providers import get_provider_registry
+        from .services.question_generation import (
+            GenerationError, generate_question_items, is_questions_payload, questions_schema,
         )
 
+        extractor = JsonStreamExtractor(is_questions_payload)
+        stream = get_provider_registry().stream(
+            prompt, schema=questions_schema(generation[3]), priority=PRIORITY_INTERACTIVE, providers=self.providers,
+        )
         try:
-            raw = generate_with_model(prompt, model_name='ollama:mistral')
-            # Extract JSON portion if model added explanations
-            json_str = raw.strip()
-            first_brace = json_str.find('{')
-            last_brace = json_str.rfind('}')
-            if first_brace != -1 and last_brace != -1:
-                json_str = json_str[first_brace:last_brace+1]
-            data = json.loads(json_str)
+            for chunk in stream:
+                yield 'token', {'text': chunk}
+                if extractor.feed(chunk):
+                    # Complete, valid payload: nothing after the closing brace is needed
+                    break
         except Exception as exc:
-            return Response({'error': f"Échec génération/parsing: {exc}"}, status=status.HTTP_502_BAD_GATEWAY)
+            yield 'error', {'error': f"Échec génération/parsing: {exc}"}
+            return
+        finally:
+            stream.close()
+
+        try:
+            # Missing or invalid items are topped up with blocking follow-up calls
+            items = generate_question_items(
+                self._generate, *generation, first_output=extractor.raw_text(), is_duplicate=self.is_duplicate,
+            )
+        except GenerationError as exc:
+            yield 'error', {'error': str(exc)}
+            return
+        yield 'done', self._save(items, generation, meta)
+
+    def _save(self, items, generation, meta):
+        from .services.question_store import save_questions, serialize_saved
+
+        format_, count = generation[1], generation[3]
+        saved = save_questions([
+            {'question': question_text, 'type': format_, 'answers': answers, **self.question_context}
+            for question_text, answers in items
+        ])
+        if count == 1:
+            question, created_answers = saved[0]
+            return {**serialize_saved(question, created_answers), 'meta': meta}
+        return {
+            'questions': [serialize_saved(question, created_answers) for question, created_answers in saved],
+            'requested': count,
+            'generated': len(saved),
+            'meta': meta,
+        }
+
+
+class GenerationJobCreateView(APIView):
+    """
+    Variante asynchrone de GenerateQuestionView: même corps de requête, réponse 202 immédiate
+    avec l'identifiant du job à interroger sur /generate/jobs/<id>/.
+    """
+    permission_classes = [AllowAllPermission]
+    job_fields = ['niveau_id', 'thematique_id', 'competence_id', 'sous_competence_id', 'format', 'difficulte', 'count']
 
-        question_text = str(data.get('question', '')).strip()
-        answers = data.get('answers') or []
-        if not question_text or not isinstance(answers, list) or len(answers) == 0:
-            return Response({'error': 'Sortie du modèle invalide.'}, status=status.HTTP_502_BAD_GATEWAY)
+    def post(self, request):
+        from .jobs import create_generation_job
+        from .services.question_generation import resolve_generation_context
 
-        question = Question.objects.create(description=question_text, type=format_)
-        created_answers = []
-        for ans in answers:
-            try:
-                ans_text = str(ans.get('text', '')).strip()
-                is_correct = bool(ans.get('is_correct', False))
-            except Exception:
-                continue
-            if not ans_text:
-                continue
-            created = Reponse.objects.create(
-                description=ans_text,
-                valide=is_correct,
-                id_question=question,
+        params = {field: request.data.get(field) for field in self.job_fields}
+        required = ['niveau_id', 'thematique_id', 'competence_id', 'format', 'difficulte']
+        if not all(params[field] for field in required):
+            return Response({'error': 'Champs requis manquants.'}, status=status.HTTP_400_BAD_REQUEST)
+        params['count'] = _requested_count(request.data, GenerateQuestionView.max_count)
+        if params['count'] is None:
+            return Response({'error': f"'count' doit être compris entre 1 et {GenerateQuestionView.max_count}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            resolve_generation_context(
+                params['niveau_id'], params['thematique_id'],
+                params['competence_id'], params['sous_competence_id'],
             )
-            created_answers.append(created)
-
-        serializer = QuestionSerializer(question)
-        answers_serializer = ReponseSerializer(created_answers, many=True)
-        return Response({
-            'question': serializer.data,
-            'reponses': answers_serializer.data,
-            'meta': {
-                'niveau': niveau.nom,
-                'thematique': thematique.nom,
-                'competence': task_description,
-                'sous_competence': sous_competence.description if sous_competence else '',
-                'difficulte': difficulte,
-            }
-        }, status=status.HTTP_201_CREATED)
+        except Exception:
+            return Response({'error': "Identifiants invalides fournis."}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = create_generation_job(params)
+        response = Response(GenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = f"{request.path.rstrip('/')}/{job.id}/"
+        return response
+
+
+class GenerationJobDetailView(APIView):
+    permission_classes = [AllowAllPermission]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(GenerationJob, id=job_id, expires_at__gt=timezone.now())
+        return Response(GenerationJobSerializer(job).data)
+
+
+class GenerationJobCancelView(APIView):
+    permission_classes = [AllowAllPermission]
+
+    def post(self, request, job_id):
+        from .jobs import cancel_generation_job
+
+        job = get_object_or_404(GenerationJob, id=job_id, expires_at__gt=timezone.now())
+        if not cancel_generation_job(job):
+            return Response({'error': f"Le job est déjà terminé ({job.status})."}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(GenerationJobSerializer(job).data)
 
 
 class LocalLLMGenerateView(APIView):
     permission_classes = [AllowAllPermission]
+    content_negotiation_class = StreamingContentNegotiation
+    provider_name = 'local'  # ctransformers entry of settings.LLM_PROVIDERS
 
     def post(self, request):
         """
@@ -235,12 +429,19 @@ class LocalLLMGenerateView(APIView):
              "temperature"?: float,
              "top_p"?: float
            }
-        Réponse: { "text": str }
+        "constrained"?: bool restreint l'échantillonnage à une seule phrase interrogative
+        (décodage contraint; par défaut selon CONSTRAINED_DECODING).
+        Réponse: { "text": str, "duplicate_of": int | null }
+        `duplicate_of` désigne une question existante quasi identique (une seconde génération
+        est tentée avant de la signaler).
+        Avec "stream": true | "sse" | "ndjson", les tokens sont envoyés au fil de l'eau
+        (événements `token`), puis un événement `done` contenant { "text": str }.
         """
+        from .services.constrained import CONSTRAINED_DECODING, SentenceGrammar
+        from .services.ctransformers_client import PRIORITY_INTERACTIVE
+        from .services.question_generation import build_local_question_prompt
+
         user_prompt = request.data.get('prompt')
-        max_new_tokens = request.data.get('max_new_tokens') or 300
-        temperature = request.data.get('temperature')
-        top_p = request.data.get('top_p')
 
         # Fields for structured mode
         niveau = str(request.data.get('niveau', '') or '').strip()
@@ -256,112 +457,52 @@ class LocalLLMGenerateView(APIView):
                 return Response({
                     'error': "Les champs 'niveau', 'thematique' et 'competence' sont obligatoires (ou fournissez 'prompt')."
                 }, status=status.HTTP_400_BAD_REQUEST)
-
-            prompt_parts = [
-                "You are a question generator for pedagogy.",
-                "Your task is to produce EXACTLY ONE clear, well‑formed question in ENGLISH.",
-                "Write in simple English suitable for the specified level so a student can self‑assess.",
-                "",
-                "Strict rules:",
-                "- Produce a DIRECT academic content question about the topic that assesses the competence.",
-                "- Use concrete values/examples where natural; for math, include numbers.",
-                "- Do NOT use meta language (no 'Can you', 'Could you', 'Please', 'Write', 'Create', 'Give me', 'Make', 'Formulate', 'Answer', 'about', 'regarding').",
-                "- Do NOT start with phrases like 'Here is', 'Thanks', 'Thank you', 'Sure', etc.",
-                "- Do NOT provide explanations, introductions, or justifications.",
-                "- Do NOT provide any answers, only the question.",
-                "- Output must be ONE interrogative sentence ending with a question mark '?'.",
-                f"- The question must be appropriate for the level: {niveau}.",
-                f"- The topic is: {thematique}.",
-                f"- The targeted competence is: {competence}.",
-                "",
-                "Bad examples (do NOT write like this):",
-                "- Can you answer a simple question about numbers?",
-                "- Please create a question about place value.",
-                "",
-                "Good examples (structure to imitate):",
-                "- What is 37 + 25?",
-                "- Which digit shows the tens place in 84?",
-            ]
-            if sous_competence:
-                prompt_parts.append(f"- The sub‑competence to respect is: {sous_competence}.")
-            prompt_parts.extend([
-                "",
-                "Expected example:",
-                "Which number is greater: 243 or 578?",
-                "",
-                "Now generate exactly one suitable question:",
-            ])
-            prompt = "\n".join(prompt_parts)
+            prompt = build_local_question_prompt(niveau, thematique, competence, sous_competence)
 
         try:
-            from .services.ctransformers_client import generate_locally
-            # Utilise le même chemin que dans le notebook
-            model_path = "./models/llama-2-7b-chat.Q4_K_M.gguf"
             gen_kwargs = {
-                'max_new_tokens': int(max_new_tokens),
+                'max_new_tokens': _requested_number(request.data, 'max_new_tokens', int, 300),
+                # Ahead of background jobs in the local inference queue
+                'priority': PRIORITY_INTERACTIVE,
             }
-            if temperature is not None:
-                gen_kwargs['temperature'] = float(temperature)
-            if top_p is not None:
-                gen_kwargs['top_p'] = float(top_p)
-            raw_text = generate_locally(prompt.strip(), model_path=model_path, **gen_kwargs)
-            # --- Sanitize: keep only a single clean question sentence ---
-            import re
-            text = (raw_text or "").strip()
-            # Drop common polite fillers or prefaces on their own line (tolerant to spaces/punct.)
-            filler_line_re = r"^(?:merci|thanks|ok|bien\s*s[uû]r)\s*[!\.?]*$"
-            lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-            lines = [ln for ln in lines if not re.match(filler_line_re, ln, flags=re.IGNORECASE)]
-            text = " \n".join(lines) if lines else ""
-            # Remove prefaces like "Pas de problème,", "Voici", etc. at start
-            text = re.sub(r"^(?:[\"'“”‘’\s]*(?:pas de problème|voici|here is|ok[:,]?|bien sûr[:,]?)[^\n]*?[:\-]\s*)",
-                          "", text, flags=re.IGNORECASE)
-            # Prefer a quoted question like "... ?" or “ … ? ” if present
-            quoted = re.search(r"[\"“]([^\"”\n]{3,}?\?)[\"”]", text)
-            if quoted:
-                candidate = quoted.group(1).strip()
-            else:
-                # Find first sentence that ends with a question mark across the whole text
-                qmatch = re.search(r"([A-ZÀ-ÖØ-Þ\"“‘'\(][^?]{3,}?\?)", text)
-                candidate = qmatch.group(1).strip() if qmatch else (lines[0] if lines else "")
-            # Strip numbering/bullets and leading labels
-            candidate = re.sub(r"^\s*(?:\d+[\).:]\s*|[-*]\s*|Q\s*[:\-]\s*|Question\s*[:\-]\s*)", "", candidate)
-            # Trim surrounding quotes
-            candidate = candidate.strip().strip('\"\'“”‘’').strip()
-            # If the candidate contains 'exemple' or similar prefix, remove it
-            candidate = re.sub(r"^(exemple\s*[:\-]\s*)", "", candidate, flags=re.IGNORECASE)
-            # Hard cut: everything after the first '?' must be dropped
-            if '?' in candidate:
-                candidate = candidate.split('?', 1)[0].strip() + '?'
-            # Ensure it ends with '?', with robust fallback if detection failed
-            # If the candidate is still a filler or too short, search again or synthesize
-            def looks_like_filler(s: str) -> bool:
-                return bool(re.match(filler_line_re, s or "", flags=re.IGNORECASE))
-
-            if candidate and not looks_like_filler(candidate) and len(candidate.split()) >= 3:
-                question = candidate if candidate.endswith('?') else (candidate + '?')
-            else:
-                # Try to find any question sentence in the whole text
-                all_qs = re.findall(r"([^?]{3,}?\?)", text)
-                chosen = next((q.strip() for q in all_qs if not looks_like_filler(q)), "")
-                fallback = chosen or (lines[0] if lines else text).strip()
-                fallback = re.sub(r"^\s*(?:\d+[\).:]\s*|[-*]\s*|Q\s*[:\-]\s*|Question\s*[:\-]\s*)", "", fallback)
-                fallback = fallback.strip().strip('\"\'“”‘’').strip()
-                if looks_like_filler(fallback) or len(fallback.split()) < 3 or re.match(r"^(can|could|please|write|create|give|make|formulate|answer|about|regarding)\b", fallback, flags=re.IGNORECASE):
-                    # Synthesize a minimal safe academic question from context
-                    ctx_niv = niveau or "this level"
-                    ctx_theme = thematique or "this topic"
-                    # Prefer a concrete arithmetic pattern when relevant
-                    if re.search(r"(number|digit|add|plus|sum|place\s*value|tens|ones|arithmetic|count)", f"{ctx_theme} {competence}", flags=re.IGNORECASE):
-                        fallback = "What is 7 + 8?"
-                    else:
-                        fallback = f"Which statement is true about {ctx_theme}?"
-                elif fallback and not fallback.endswith('?'):
-                    fallback = fallback.rstrip('.!;:') + '?'
-                # Remove any trailing filler like 'merci'
-                question = re.sub(filler_line_re, '', fallback, flags=re.IGNORECASE).strip()
-                if '?' in question:
-                    question = question.split('?', 1)[0].strip() + '?'
+            for field in ('temperature', 'top_p'):
+                value = _requested_number(request.data, field, float)
+                if value is not None:
+                    gen_kwargs[field] = value
+        except ValueError as exc:
+            field = str(exc)
+            expected = 'un entier' if field == 'max_new_tokens' else 'un nombre'
+            return Response({'error': f"'{field}' doit être {expected}.", 'field': field},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if _requested_flag(request.data.get('constrained'), CONSTRAINED_DECODING):
+            # Only tokens that keep the output a single interrogative sentence can be sampled
+            gen_kwargs['constraint'] = SentenceGrammar()
+
+        stream_format = requested_stream_format(request)
+        if stream_format:
+            events = self._stream_events(prompt.strip(), gen_kwargs, thematique, competence)
+            return streaming_response(events, stream_format)
+
+        from .services.ctransformers_client import ModelPoolBusy
+        from .services.metrics import count, stage
+        from .services.providers import ProviderBusy, get_provider_registry
+        from .services.sanitizer import sanitize_question
+
+        provider = get_provider_registry().provider(self.provider_name)
+        try:
+            raw_text = provider.generate(prompt.strip(), **gen_kwargs)
+            with stage('parse'):
+                question = sanitize_question(raw_text, thematique, competence)
+            duplicate_of = self._duplicate_of(question)
+            if duplicate_of is not None:
+                # Retry once without the generation cache, which would serve the same text
+                count('regenerations')
+                raw_text = provider.generate(prompt.strip(), use_cache=False, **gen_kwargs)
+                with stage('parse'):
+                    question = sanitize_question(raw_text, thematique, competence)
+                duplicate_of = self._duplicate_of(question)
+        except (ModelPoolBusy, ProviderBusy) as busy:
+            return Response({'error': str(busy)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except FileNotFoundError as fnf:
             return Response({'error': str(fnf)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except RuntimeError as dep:
@@ -369,4 +510,52 @@ class LocalLLMGenerateView(APIView):
         except Exception as exc:
             return Response({'error': f"Échec génération locale: {exc}"}, status=status.HTTP_502_BAD_GATEWAY)
 
-        return Response({'text': question})
\ No newline at end of file
+        return Response({'text': question, 'duplicate_of': duplicate_of})
+
+    @staticmethod
+    def _duplicate_of(text):
+        from .services.dedup import DEDUP_ENABLED, find_similar
+
+        if not DEDUP_ENABLED:
+            return None
+        similar = find_similar(text, limit=1)
+        return similar[0][0] if similar else None
+
+    def _stream_events(self, prompt, gen_kwargs, thematique, competence):
+        from .services.providers import get_provider_registry
+        from .services.sanitizer import StreamingQuestionSanitizer
+
+        sanitizer = StreamingQuestionSanitizer(thematique, competence)
+        stream = get_provider_registry().provider(self.provider_name).stream(prompt, **gen_kwargs)
+        try:
+            for chunk in stream:
+                yield 'token', {'text': chunk}
+                if sanitizer.feed(chunk):
+                    # The question is complete: the rest would be dropped, stop generating
+                    break
+        except (FileNotFoundError, RuntimeError) as exc:
+            yield 'error', {'error': str(exc)}
+            return
+        except Exception as exc:
+            yield 'error', {'error': f"Échec génération locale: {exc}"}
+            return
+        finally:
+            # Releases the model replica right away
+            stream.close()
+        question = sanitizer.result()
+        yield 'done', {'text': question, 'duplicate_of': self._duplicate_of(question)}
+
+
+class MetricsView(APIView):
+    """
+    Métriques de génération au format texte Prometheus (services/metrics.py): durées par
+    étape, tokens par seconde, cache, relances. Chaque processus expose ses propres valeurs.
+    """
+    permission_classes = [AllowAllPermission]
+
+    def get(self, request):
+        from django.http import HttpResponse
+
+        from .services.metrics import render_prometheus
+
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'myapp',
     'rest_framework',
     'corsheaders',
@@ -60,6 +61,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Per-request generation metrics: Server-Timing header + one log line (GENERATION_METRICS=0 disables)
+    'myapp.middleware.GenerationMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -130,9 +133,34 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches: the 'reference' cache holds pre-serialized curriculum JSON (myapp/reference_cache.py),
+# stored under per-model version counters kept in the database (ReferenceCacheVersion), so that
+# signal-based invalidation reaches every worker. Shared through Redis when REDIS_URL is set;
+# otherwise the JSON stays in each process's memory, which is safe since its keys carry the
+# current versions.
+REDIS_URL = os.getenv('REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reference': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reference',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+# Upper bound on how long a cached reference response may be served
+REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', '3600'))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_PERMISSION_CLASSES': [],
+    # Keyset pagination on id for every ModelViewSet (`?cursor=`, `?page_size=`)
+    'DEFAULT_PAGINATION_CLASS': 'myapp.fieldsets.IdCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '100')),
 }
 
 # CORS/CSRF for local frontend (Next.js on port 3000)
@@ -153,3 +181,53 @@ CSRF_TRUSTED_ORIGINS = [
 # Celery - Use eager execution for development
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
+
+# Asynchronous generation jobs (/api/generate/jobs/)
+# TTL in seconds after which a job and its status are purged
+GENERATION_JOB_TTL = int(os.getenv('GENERATION_JOB_TTL', '86400'))
+# In eager mode, jobs run on an in-process thread pool of this size
+GENERATION_JOB_WORKERS = int(os.getenv('GENERATION_JOB_WORKERS', '2'))
+
+# Model providers of the generation endpoints (myapp/services/providers.py). Each call goes to
+# the fastest healthy provider with a free slot (max_concurrency calls at once); `fallback`
+# providers only take the calls the others cannot (saturated or down). Add an Ollama host with
+# {'name': ..., 'backend': 'ollama', 'model': ..., 'urls': ['http://host:11434/api/generate']}.
+LLM_PROVIDERS = [
+    {
+        'name': 'ollama',
+        'backend': 'ollama',
+        'model': os.getenv('OLLAMA_MODEL', 'mistral'),
+        'max_concurrency': int(os.getenv('LLM_OLLAMA_CONCURRENCY', '8')),
+    },
+    {
+        'name': 'local',
+        'backend': 'ctransformers',
+        'model': os.getenv('CTRANSFORMERS_MODEL', './models/llama-2-7b-chat.Q4_K_M.gguf'),
+        'max_concurrency': int(os.getenv('LLM_LOCAL_CONCURRENCY', '2')),
+        'params': {'max_new_tokens': 1024},
+        'fallback': True,
+    },
+]
+
+# Max parallel generations per backend for generate_questions_batch_task in eager mode
+# (`local` when its model_name selects only ctransformers providers, `ollama` otherwise)
+GENERATION_BATCH_CONCURRENCY = {
+    'ollama': int(os.getenv('GENERATION_BATCH_CONCURRENCY_OLLAMA', '4')),
+    'local': int(os.getenv('GENERATION_BATCH_CONCURRENCY_LOCAL', '1')),
+}
+
+# One JSON line per traced generation request/task on the `myapp.metrics` logger
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'myapp.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('GENERATION_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -17,7 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from myapp.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Prometheus scrape endpoint (generation metrics)
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/', include('myapp.urls')),
 ]
@@ -1,36 +1,111 @@
-from ctransformers import AutoModelForCausalLM
+import os
+import threading
+import time
 from langchain.llms.base import LLM
 from langchain.prompts import PromptTemplate
-from typing import Optional, List
+from typing import Any, Dict, Iterator, Optional, List
 from pydantic import Field
 
+from myapp.services.providers import LocalProvider
+from myapp.services.sanitizer import extract_numbered_questions
+
+# Sampling parameters of the questions generated by the FastAPI service
+GENERATION_PARAMS = {'max_new_tokens': 500, 'temperature': 0.8, 'top_p': 0.95}
+
 # ---- 1. Custom LLM wrapper ----
 class CTransformersLLM(LLM):
     model_file: str = Field(...)
-    model: Optional[AutoModelForCausalLM] = Field(default=None, exclude=True)
+    provider: Optional[Any] = Field(default=None, exclude=True)
 
     def __init__(self, model_file: str, **kwargs):
         super().__init__(model_file=model_file, **kwargs)
-        self.model = AutoModelForCausalLM.from_pretrained(model_file)
+        # Same provider interface as the Django views: the model pool of this process, or the
+        # model server when CTRANSFORMERS_SERVER_URL is set (then nothing is loaded here).
+        # The FastAPI executor already bounds the concurrent generations.
+        self.provider = LocalProvider(
+            "fastapi", model_file, params=GENERATION_PARAMS,
+            max_concurrency=int(os.getenv("FASTAPI_INFERENCE_WORKERS", "1")),
+        )
+        self.provider.load()
 
     @property
     def _llm_type(self) -> str:
         return "ctransformers"
 
     def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        output = self.model(prompt, max_new_tokens=500)
+        output = self.provider.generate(prompt, use_cache=False)
         if stop:
             for s in stop:
                 output = output.split(s)[0]
         return output.strip()
 
-# ---- 2. Load the model ----
-model_file = "./models/llama-2-7b-chat.Q4_K_M.gguf"
-llm = CTransformersLLM(model_file=model_file)
+    def stream_text(self, prompt: str) -> Iterator[str]:
+        """Chunks as the model produces them; closing the generator stops the generation."""
+        yield from self.provider.stream(prompt, use_cache=False)
+
+# ---- 2. Load the model (on first use) ----
+# Importing this module stays cheap: the GGUF file is only read by get_llm(), at the first
+# generation or through warm_up() (called at FastAPI startup).
+model_file = os.getenv("CTRANSFORMERS_MODEL", "./models/llama-2-7b-chat.Q4_K_M.gguf")
+
+_llm: Optional[CTransformersLLM] = None
+_llm_lock = threading.Lock()
+_load_state: Dict[str, Any] = {"status": "idle", "error": None, "started_at": None, "seconds": None}
+
+
+def get_llm() -> CTransformersLLM:
+    """The shared LLM, loaded by the first caller; concurrent callers wait for that load."""
+    global _llm
+    if _llm is not None:
+        return _llm
+    with _llm_lock:
+        if _llm is None:
+            _load_state.update(status="loading", error=None, started_at=time.time(), seconds=None)
+            started = time.perf_counter()
+            try:
+                _llm = CTransformersLLM(model_file=model_file)
+            except Exception as exc:
+                _load_state.update(status="error", error=str(exc), seconds=round(time.perf_counter() - started, 3))
+                raise
+            _load_state.update(status="ready", seconds=round(time.perf_counter() - started, 3))
+    return _llm
+
+
+def load_status() -> Dict[str, Any]:
+    """Model loading state: status (idle, loading, ready, error), error, seconds spent (or elapsed so far)."""
+    state = dict(_load_state, model=os.path.basename(model_file))
+    if state["status"] == "loading":
+        state["seconds"] = round(time.time() - state["started_at"], 3)
+    try:
+        state["size_bytes"] = os.path.getsize(model_file)
+    except OSError:
+        state["size_bytes"] = None
+    return state
+
+
+def warm_up() -> Dict[str, Any]:
+    """Load the model now instead of at the first request; never raises (see load_status)."""
+    try:
+        get_llm()
+    except Exception:
+        pass
+    return load_status()
 
 # ---- 3. Enhanced Prompt template ----
+# The fixed instructions come first and the request parameters last: ctransformers keeps the
+# tokens it has evaluated and only evaluates the part of the next prompt past the common prefix.
 template = """You are a pedagogy expert specializing in curriculum design and assessment.
 
+Requirements:
+1. Questions must be appropriate for the students of the school level given below
+2. Focus specifically on the sub-competence
+3. Align with the competence
+4. Stay within the thematic area, in the given module
+5. Make questions clear, measurable, and pedagogically sound
+6. Ensure questions test understanding at the appropriate cognitive level
+
+Generate ONLY the questions, numbered 1, 2, 3, etc. No additional text or explanations.
+
 Generate exactly {num_questions} {question_type} questions for:
 - School Level: {school_level}
 - Module: {module}
@@ -38,16 +113,6 @@ Generate exactly {num_questions} {question_type} questions for:
 - Competence: {competence}
 - Sub-competence: {sous_competence}
 
-Requirements:
-1. Questions must be appropriate for {school_level} students
-2. Focus specifically on the sub-competence: {sous_competence}
-3. Align with the competence: {competence}
-4. Stay within the thematic area: {thematic} from the {module} module
-5. Make questions clear, measurable, and pedagogically sound
-6. Ensure questions test understanding at the appropriate cognitive level
-
-Generate ONLY the questions, numbered 1, 2, 3, etc. No additional text or explanations.
-
 Questions:"""
 
 prompt = PromptTemplate(
@@ -64,6 +129,32 @@ prompt = PromptTemplate(
 )
 
 # ---- 4. Updated API Function ----
+def build_prompt(
+    school_level: str,
+    module: str,
+    thematic: str,
+    competence: str,
+    sous_competence: str,
+    num_questions: int = 3,
+    question_type: str = "quiz"
+) -> str:
+    return prompt.format(
+        num_questions=num_questions,
+        question_type=question_type,
+        school_level=school_level,
+        module=module,
+        thematic=thematic,
+        competence=competence,
+        sous_competence=sous_competence
+    )
+
+
+def clean_answer(response: str) -> str:
+    """Keep only the numbered questions of the model output (the raw output when none is found)."""
+    questions = extract_numbered_questions(response)
+    return '\n'.join(questions) if questions else response.strip()
+
+
 def answer_question(
     school_level: str,
     module: str,
@@ -88,24 +179,16 @@ def answer_question(
     Returns:
         Generated questions as a string
     """
-    final_prompt = prompt.format(
-        num_questions=num_questions,
-        question_type=question_type,
-        school_level=school_level,
-        module=module,
-        thematic=thematic,
-        competence=competence,
-        sous_competence=sous_competence
+    final_prompt = build_prompt(
+        school_level, module, thematic, competence, sous_competence, num_questions, question_type
     )
-    
-    response = llm.invoke(final_prompt)
-    
-    # Clean up the response to return only questions
-    lines = response.split('\n')
-    questions = []
-    for line in lines:
-        line = line.strip()
-        if line and (line[0].isdigit() or line.startswith('Q')):
-            questions.append(line)
-    
-    return '\n'.join(questions) if questions else response
\ No newline at end of file
+    response = get_llm().invoke(final_prompt)
+    return clean_answer(response)
+
+
+def stream_answer(**params) -> Iterator[str]:
+    """
+    Same generation as `answer_question` (same parameters), as raw model chunks; pass the
+    joined text to `clean_answer`. Closing the generator stops the generation.
+    """
+    return get_llm().stream_text(build_prompt(**params))
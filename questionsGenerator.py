@@ -1,9 +1,48 @@
-from fastapi import FastAPI
+
+import time
+
+_STARTED = time.perf_counter()  # cold-start measurement (--cold-start)
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from pedagogieQuestions_logic import answer_question  
+from myapp.services.ctransformers_client import get_model_server_client
+from pedagogieQuestions_logic import clean_answer, load_status, stream_answer, warm_up
+
+# The model runs in a bounded thread pool so the event loop stays free: beyond
+# INFERENCE_WORKERS running + INFERENCE_MAX_QUEUE waiting generations, requests get a 429.
+# A single in-process model generates one sequence at a time; raise INFERENCE_WORKERS when
+# the generations go to the model server (CTRANSFORMERS_SERVER_URL).
+INFERENCE_WORKERS = int(os.getenv("FASTAPI_INFERENCE_WORKERS", "1"))
+INFERENCE_MAX_QUEUE = int(os.getenv("FASTAPI_MAX_QUEUE", "16"))
+RETRY_AFTER = int(os.getenv("FASTAPI_RETRY_AFTER", "10"))
+MAX_BATCH = int(os.getenv("FASTAPI_MAX_BATCH", "10"))
+DISCONNECT_POLL = 0.5  # seconds between two client disconnection checks
+# Load the model in the background at startup (otherwise at the first generation)
+WARM_UP = os.getenv("FASTAPI_WARM_UP", "1").lower() not in ("0", "false", "no")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Not awaited: the server accepts connections (and answers /) while the model loads
+    warm_up_task = asyncio.get_running_loop().run_in_executor(None, warm_up) if WARM_UP else None
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,32 +66,231 @@ class QuestionRequest(BaseModel):
     num_questions: int = 3
     question_type: str = "quiz"  # "quiz", "essay", "multiple_choice", etc.
 
+class BatchQuestionRequest(BaseModel):
+    requests: List[QuestionRequest]
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+Job = Tuple[Future, threading.Event]
+
+
+class InferenceExecutor:
+    """
+    Pool de threads borné pour les générations: `submit` met en file une génération par
+    élément (ou aucune si la file ne peut pas toutes les prendre) et `wait` les attend
+    depuis la boucle asyncio. Chaque job reçoit un `threading.Event` positionné quand son
+    résultat n'est plus attendu (client parti): la génération s'arrête au chunk suivant.
+    """
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.capacity = max(1, workers) + max(0, max_queue)
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="inference")
+
+    def submit(self, fn: Callable[[Any, threading.Event], Any], *items: Any) -> List[Job]:
+        with self._lock:
+            if self.pending + len(items) > self.capacity:
+                raise QueueFull("File de génération pleine, réessayez plus tard.")
+            self.pending += len(items)
+        jobs = []
+        for item in items:
+            cancel = threading.Event()
+            future = self._pool.submit(fn, item, cancel)
+            future.add_done_callback(self._release)
+            jobs.append((future, cancel))
+        return jobs
+
+    async def wait(self, jobs: List[Job]) -> List[Any]:
+        """Results in order; a failed job gives its exception instead of a result."""
+        try:
+            return await asyncio.gather(*(asyncio.wrap_future(future) for future, _ in jobs), return_exceptions=True)
+        except asyncio.CancelledError:
+            self.cancel(jobs)
+            raise
+
+    @staticmethod
+    def cancel(jobs: List[Job]) -> None:
+        for future, cancel in jobs:
+            cancel.set()
+            future.cancel()  # drops the job if it has not started yet
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+
+executor = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_MAX_QUEUE)
+
+
+def _generate_questions(
+    req: QuestionRequest,
+    cancel: threading.Event,
+    on_chunk: Optional[Callable[[Optional[str]], None]] = None,
+) -> Optional[str]:
+    """Runs in an executor thread; `on_chunk` gets every chunk, then None at the end."""
+    stream = stream_answer(
+        school_level=req.school_level,
+        module=req.module,
+        thematic=req.thematic,
+        competence=req.competence,
+        sous_competence=req.sous_competence,
+        num_questions=req.num_questions,
+        question_type=req.question_type,
+    )
+    chunks = []
+    try:
+        for chunk in stream:
+            if cancel.is_set():
+                return None  # nobody is waiting for the result anymore
+            chunks.append(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+    finally:
+        stream.close()
+        if on_chunk:
+            on_chunk(None)
+    return clean_answer(''.join(chunks))
+
+
+async def _until_disconnected(request: Request, jobs: List[Job]) -> List[Any]:
+    """Wait for the jobs, cancelling them if the client goes away in the meantime."""
+    waiter = asyncio.ensure_future(executor.wait(jobs))
+    while True:
+        done, _ = await asyncio.wait({waiter}, timeout=DISCONNECT_POLL)
+        if done:
+            return waiter.result()
+        if await request.is_disconnected():
+            waiter.cancel()
+            raise ClientDisconnected()
+
+
+def _busy(exc: QueueFull) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(exc), "status": "error"},
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
+
+
+def _disconnected() -> JSONResponse:
+    return JSONResponse(status_code=499, content={"error": "Requête annulée par le client.", "status": "error"})
+
+
+def _result(value: Any) -> dict:
+    if isinstance(value, BaseException):
+        return {"error": str(value), "status": "error"}
+    return {"questions": value, "status": "success"}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @app.get("/")
-def health_check():
-    return {"status": "ok", "message": "FastAPI service is running"}
+async def health_check():
+    return {
+        "status": "ok",
+        "message": "FastAPI service is running",
+        "queue": {"pending": executor.pending, "capacity": executor.capacity},
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """200 une fois le modèle chargé (et le serveur de modèles joignable s'il est utilisé), 503 sinon."""
+    state = load_status()
+    server = get_model_server_client()
+    if server is not None and state["status"] == "ready":
+        server_ready = await asyncio.get_running_loop().run_in_executor(None, server.ready)
+        if not server_ready:
+            state.update(status="loading", error="Serveur de modèles pas encore prêt.")
+    return JSONResponse(status_code=200 if state["status"] == "ready" else 503, content=state)
 
 @app.post("/generate-questions")
-def generate_pedagogical_questions(req: QuestionRequest):
+async def generate_pedagogical_questions(req: QuestionRequest, request: Request):
     try:
-        questions = answer_question(
-            school_level=req.school_level,
-            module=req.module,
-            thematic=req.thematic,
-            competence=req.competence,
-            sous_competence=req.sous_competence,
-            num_questions=req.num_questions,
-            question_type=req.question_type
+        [result] = await _until_disconnected(request, executor.submit(_generate_questions, req))
+    except QueueFull as exc:
+        return _busy(exc)
+    except ClientDisconnected:
+        return _disconnected()
+    return _result(result)
+
+@app.post("/generate-questions/batch")
+async def generate_pedagogical_questions_batch(batch: BatchQuestionRequest, request: Request):
+    """Plusieurs jeux de questions en un appel: tous mis en file, ou 429 si la file ne peut pas tous les prendre."""
+    if not 1 <= len(batch.requests) <= MAX_BATCH:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"'requests' doit contenir entre 1 et {MAX_BATCH} éléments.", "status": "error"},
         )
-        return {
-            "questions": questions,
-            "status": "success"
-        }
-    except Exception as e:
-        return {
-            "error": str(e),
-            "status": "error"
-        }
+    try:
+        results = await _until_disconnected(request, executor.submit(_generate_questions, *batch.requests))
+    except QueueFull as exc:
+        return _busy(exc)
+    except ClientDisconnected:
+        return _disconnected()
+    return {"results": [_result(value) for value in results], "status": "success"}
+
+@app.post("/generate-questions/stream")
+async def stream_pedagogical_questions(req: QuestionRequest):
+    """Server-sent events: `token` au fil de la génération, puis `done` (même contenu que /generate-questions) ou `error`."""
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+
+    def generate(item: QuestionRequest, cancel: threading.Event) -> Optional[str]:
+        return _generate_questions(item, cancel, lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk))
+
+    try:
+        jobs = executor.submit(generate, req)
+    except QueueFull as exc:
+        return _busy(exc)
+
+    async def events():
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield _sse("token", {"text": chunk})
+            [result] = await executor.wait(jobs)
+            yield _sse("error" if isinstance(result, BaseException) else "done", _result(result))
+        finally:
+            # Also reached when the client disconnects: the generation stops at its next chunk
+            executor.cancel(jobs)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def cold_start() -> int:
+    """Import + model load times as JSON (CI measure); exit code 1 when the model fails to load."""
+    imported = time.perf_counter()
+    state = warm_up()
+    print(json.dumps({
+        "import_seconds": round(imported - _STARTED, 3),
+        "load_seconds": state["seconds"],
+        "total_seconds": round(time.perf_counter() - _STARTED, 3),
+        "status": state["status"],
+        "error": state["error"],
+        "model": state["model"],
+    }))
+    return 0 if state["status"] == "ready" else 1
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service FastAPI de génération de questions")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--cold-start", action="store_true", help="Mesurer l'import et le chargement du modèle, puis quitter")
+    args = parser.parse_args()
+    if args.cold_start:
+        sys.exit(cold_start())
+
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host=args.host, port=args.port)